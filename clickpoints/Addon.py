@@ -19,15 +19,20 @@
 # You should have received a copy of the GNU General Public License
 # along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
 
-import time
+import os
+import sys
+import json
+import traceback
+import multiprocessing
+import multiprocessing.connection
+from concurrent.futures import Future, CancelledError
+from importlib import import_module
 import clickpoints
 from qtpy import QtCore, QtGui, QtWidgets
-from matplotlib import pyplot as plt
 
-from .includes import CanvasWindow
 from .includes import QtShortCuts
 from .modules.OptionEditor import getOptionInputWidget
-from matplotlib import _pylab_helpers
+from .JobScheduler import BatchJob, getJobScheduler
 import threading
 
 figures = {}
@@ -35,6 +40,8 @@ figures = {}
 
 def show():
     global figures
+    # matplotlib is only imported when an add-on is created, not when the module is imported by a worker process
+    from matplotlib import _pylab_helpers
     canvas = _pylab_helpers.Gcf.get_active().canvas
     canvas.draw()
     if canvas.window:
@@ -43,6 +50,8 @@ def show():
 
 def figure(num=None, size=None, *args, **kwargs):
     global figures
+    from matplotlib import _pylab_helpers
+    from .includes import CanvasWindow
     if num is None:
         num = len(figures)
     if num not in figures.keys():
@@ -62,6 +71,9 @@ class Command:
     def __init__(self, script_launcher=None, script=None):
         self.script_launcher = script_launcher
         self.script = script
+        # the pending jumps of the wait functions
+        self._waits = set()
+        self._waits_lock = threading.Lock()
         if self.script_launcher is not None:
             self.window = self.script_launcher.window
 
@@ -93,7 +105,7 @@ class Command:
             return
         self.window.signal_jumpTo.emit(int(value))
 
-    def jumpFramesWait(self, value):
+    def jumpFramesWait(self, value, timeout=None):
         """
         Let ClickPoints jump the given amount of frames and wait for it to complete.
 
@@ -101,24 +113,20 @@ class Command:
         ----------
         value : int
             the amount of frames which ClickPoints should jump.
+        timeout : number, optional
+            the maximal time in seconds to wait for the frame. Raises a TimeoutError if the time is exceeded.
+
+        Returns
+        -------
+        frame : int
+            the frame that has been loaded, or None if the add-on was terminated before the jump.
         """
         # only if we are not a dummy connection
         if self.script_launcher is None:
             return
-        self.window.signal_jump.emit(int(value))
-
-        # if this is the main thread, we have to call processEvents
-        if isinstance(threading.current_thread(), threading._MainThread):
-            # wait for frame change to be completed
-            while self.window.target_frame != int(value):
-                self.window.app.processEvents()
-            return
-
-        # wait for frame change to be completed
-        while self.window.target_frame != int(value):
-            time.sleep(0.01)
+        return self._jumpWait(value, True, timeout)
 
-    def jumpToFrameWait(self, value):
+    def jumpToFrameWait(self, value, timeout=None):
         """
         Let ClickPoints jump to the given frame and wait for it to complete.
 
@@ -126,23 +134,45 @@ class Command:
         ----------
         value : int
             the frame to which ClickPoints should jump.
+        timeout : number, optional
+            the maximal time in seconds to wait for the frame. Raises a TimeoutError if the time is exceeded.
+
+        Returns
+        -------
+        frame : int
+            the frame that has been loaded, or None if the add-on was terminated before the jump.
         """
         # only if we are not a dummy connection
         if self.script_launcher is None:
             return
-
-        self.window.signal_jumpTo.emit(int(value))
-
-        # if this is the main thread, we have to call processEvents
-        if isinstance(threading.current_thread(), threading._MainThread):
-            # wait for frame change to be completed
-            while self.window.target_frame != int(value):
-                self.window.app.processEvents()
-            return
-
-        # wait for frame change to be completed
-        while self.window.target_frame != int(value):
-            time.sleep(0.01)
+        return self._jumpWait(value, False, timeout)
+
+    def _jumpWait(self, value, relative, timeout):
+        # the gui thread resolves the future when the frame is loaded
+        future = Future()
+        with self._waits_lock:
+            self._waits.add(future)
+        try:
+            self.window.signal_jumpWait.emit(int(value), relative, future)
+
+            # if this is the main thread, we have to call processEvents
+            if isinstance(threading.current_thread(), threading._MainThread):
+                while not future.done():
+                    self.window.app.processEvents()
+            return future.result(timeout)
+        except CancelledError:
+            return None
+        finally:
+            with self._waits_lock:
+                self._waits.discard(future)
+
+    def cancelWaits(self):
+        """
+        Cancel the jumps that add-on threads are waiting for and that have not been started yet.
+        """
+        with self._waits_lock:
+            for future in self._waits:
+                future.cancel()
 
     def reloadMask(self):
         """
@@ -301,6 +331,9 @@ class Command:
         return self.stop
 
     def getHUD(self, location="upper left"):
+        # the HUD items only exist in the ClickPoints process
+        if self.script_launcher is None:
+            return None
         if location == "upper left":
             return self.window.view.hud
         elif location == "upper center":
@@ -366,8 +399,163 @@ class Command:
         self.window.Save()
 
 
+class CommandProxy(Command):
+    """
+    The :py:class:`Command` interface for an add-on that runs in a separate process. The calls are forwarded over a pipe
+    to the ClickPoints process, which executes them with the Command object of the add-on instance there.
+    """
+    window = None
+
+    def __init__(self, connection, stop_event):
+        Command.__init__(self)
+        self.connection = connection
+        self.stop_event = stop_event
+        # the add-on may call commands from several threads, but each call has to wait for its own answer
+        self.lock = threading.Lock()
+
+    @property
+    def stop(self):
+        return self.stop_event.is_set()
+
+    @stop.setter
+    def stop(self, value):
+        # only the ClickPoints process can withdraw a stop request, by starting a new process
+        if value:
+            self.stop_event.set()
+
+    def _call(self, name, *args, **kwargs):
+        with self.lock:
+            self.connection.send(("call", name, args, kwargs))
+            status, value = self.connection.recv()
+        if status == "error":
+            raise RuntimeError("ClickPoints could not execute %s: %s" % (name, value))
+        return value
+
+    def getImage(self):
+        # database entries are not send over the pipe, but loaded from the database connection of this process
+        image_id = self._call("getImage")
+        if image_id is None:
+            return None
+        return self.script.db.getImage(id=image_id)
+
+    def selectMarkerType(self, type):
+        self._call("selectMarkerType", type.id)
+
+
+def _forwardCommand(name):
+    def call(self, *args, **kwargs):
+        return self._call(name, *args, **kwargs)
+    call.__name__ = name
+    call.__doc__ = getattr(Command, name).__doc__
+    return call
+
+
+# the commands that are executed in the ClickPoints process
+proxy_commands = ["jumpFrames", "jumpToFrame", "jumpFramesWait", "jumpToFrameWait", "reloadMask", "reloadImage",
+                  "reloadMarker", "reloadTypes", "reloadMaskTypes", "reloadTracks", "getImage", "getCurrentFrame",
+                  "getFrameRange", "selectMarkerType", "updateImageCount", "setStatus", "centerOn", "save"]
+for _name in proxy_commands:
+    if _name not in CommandProxy.__dict__:
+        setattr(CommandProxy, _name, _forwardCommand(_name))
+
+
+def _runAddonProcess(addon_path, module_name, addon_name, database_filename, connection, stop_event, start_frame):
+    # the add-on is a widget and needs an application, but this process should not show any windows
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    sys.path.insert(0, addon_path)
+    try:
+        # the add-on opens its own connection to the database (which is in WAL mode, so both processes can access it)
+        module = import_module(module_name)
+        addon = module.Addon(database_filename, CommandProxy(connection, stop_event), addon_name)
+        addon.run(start_frame)
+    except Exception:
+        connection.send(("exception", traceback.format_exc()))
+    finally:
+        connection.send(("finished", None))
+        connection.close()
+
+
+class AddonProcess(threading.Thread):
+    """
+    Runs the run function of an add-on in a separate process and serves the Command calls of this process. The thread
+    finishes when the process finishes.
+    """
+    daemon = True
+
+    def __init__(self, addon, start_frame=0):
+        threading.Thread.__init__(self)
+        self.addon = addon
+        # the process is spawned, so that it does not inherit the gui
+        context = multiprocessing.get_context("spawn")
+        self.connection, self.child_connection = context.Pipe()
+        self.stop_event = context.Event()
+        module = sys.modules[type(addon).__module__]
+        addon_path = os.path.dirname(os.path.dirname(os.path.abspath(module.__file__)))
+        self.process = context.Process(target=_runAddonProcess, args=(addon_path, module.__name__, addon.addon_name,
+                                                                       addon.db._database_filename,
+                                                                       self.child_connection, self.stop_event,
+                                                                       start_frame))
+        self.process.daemon = True
+
+    def stop(self):
+        # tell the run function of the process to terminate
+        self.stop_event.set()
+
+    def callCommand(self, name, args, kwargs):
+        if name not in proxy_commands:
+            raise NameError("%s is no command" % name)
+        if name == "setStatus":
+            # the status has to be changed from the gui thread
+            self.addon._change_status.emit(*args)
+            return
+        if name == "getImage":
+            image = self.addon.cp.getImage()
+            return image.id if image is not None else None
+        if name == "selectMarkerType":
+            return self.addon.cp.selectMarkerType(self.addon.db.getMarkerType(id=args[0]))
+        return getattr(self.addon.cp, name)(*args, **kwargs)
+
+    def run(self):
+        self.addon.run_started()
+        try:
+            self.process.start()
+            # only the process holds the other end of the pipe, so that its exit is noticed even if it crashes
+            self.child_connection.close()
+            while True:
+                ready = multiprocessing.connection.wait([self.connection, self.process.sentinel])
+                if self.connection not in ready:
+                    break
+                try:
+                    message = self.connection.recv()
+                except EOFError:
+                    break
+                if message[0] == "call":
+                    name, args, kwargs = message[1:]
+                    try:
+                        result = ("result", self.callCommand(name, args, kwargs))
+                    except Exception as err:
+                        result = ("error", "%s: %s" % (err.__class__.__name__, err))
+                    self.connection.send(result)
+                elif message[0] == "exception":
+                    print(message[1], file=sys.stderr)
+                elif message[0] == "finished":
+                    break
+            self.process.join()
+            if self.process.exitcode:
+                print("Add-on %s: the process exited with code %d" % (self.addon.addon_name, self.process.exitcode),
+                      file=sys.stderr)
+        finally:
+            self.connection.close()
+            self.addon.run_stopped()
+
+
 class Addon(QtWidgets.QWidget):
     _run_thread = None
+    # whether the run function should be executed in a separate process
+    run_in_process = False
+    # a module level function (database_filename, image_ids, parameters) -> results, for batch jobs of the add-on
+    batch_function = None
     _change_status = QtCore.Signal(int)
     _option_widgets = None
     _input_widgets = []
@@ -377,7 +565,12 @@ class Addon(QtWidgets.QWidget):
         QtWidgets.QWidget.__init__(self)
 
         # initialize the command class to communicate with ClickPoints
-        self.cp = Command(command, self)
+        if isinstance(command, Command):
+            # the add-on runs in a separate process and got a proxy to the ClickPoints process
+            self.cp = command
+            self.cp.script = self
+        else:
+            self.cp = Command(command, self)
 
         # get the database instance, either it is already a database object or a filename
         if isinstance(database, str):
@@ -414,6 +607,7 @@ class Addon(QtWidgets.QWidget):
         # wrap the run function, so that it automatically updates the current state of the add-on (for the button state in ClickPoints)
         function = self.run
         # overload two matplotlib functions to help use them from the run function from a different thread
+        from matplotlib import pyplot as plt
         plt.show = show
         plt.figure = figure
 
@@ -428,6 +622,10 @@ class Addon(QtWidgets.QWidget):
 
         self._input_widgets = []
 
+        # the progress of an unfinished batch job
+        if type(self).batch_function is not None:
+            self.addOption(key="batchJob", default="", value_type="string", hidden=True)
+
         # connect the status changed signal (to be able to change the status from another thread)
         self._change_status.connect(self.cp.setStatus)
 
@@ -501,6 +699,10 @@ class Addon(QtWidgets.QWidget):
     def terminate(self):
         # when the add-on wants to tell it's run thread to terminate
         self.cp.stop = True
+        self.cp.cancelWaits()
+        getJobScheduler().cancel(self)
+        if isinstance(self._run_thread, AddonProcess):
+            self._run_thread.stop()
         if self._run_thread is not None:
             self._run_thread.join(1)
         self._run_thread = None
@@ -538,14 +740,47 @@ class Addon(QtWidgets.QWidget):
         else:
             if start_frame is None or isinstance(start_frame, bool):
                 start_frame = self.cp.getCurrentFrame()
-            self._run_thread = threading.Thread(target=self.run, args=(start_frame,))
-            self._run_thread.daemon = True
+            # add-ons that opt in run in a separate process, if the process can open the same database
+            if self.run_in_process and function is None and self.db._database_filename != ":memory:":
+                self._run_thread = AddonProcess(self, start_frame)
+            else:
+                self._run_thread = threading.Thread(target=self.run, args=(start_frame,))
+                self._run_thread.daemon = True
             self._run_thread.start()
 
     def run(self, start_frame=0):
         # here the add-on can implement it's run routine
         pass
 
+    def run_batch(self, start=None, end=None, skip=None, layer=None, chunk_size=10, processes=0, resume=True,
+                  verbose=False):
+        # queue a batch job that applies the batch function to the frame range (by default the range of the timeline)
+        if start is None or end is None:
+            frame_range = self.cp.getFrameRange()
+            if frame_range is None:
+                frame_range = [0, self.db.getImageCount() - 1, 1]
+            if start is None:
+                start = frame_range[0]
+            if end is None:
+                end = frame_range[1]
+            if skip is None:
+                skip = frame_range[2]
+        job = BatchJob(self, start, end, skip or 1, layer, chunk_size, processes, verbose=verbose)
+        # resume the progress of a cancelled or interrupted job with the same frames
+        if resume and self.getOption("batchJob"):
+            state = json.loads(self.getOption("batchJob"))
+            if job.matches(state):
+                job.done = set(state["done"])
+        return getJobScheduler().submit(job)
+
+    def batchParameters(self):
+        # the parameters for the batch function, they have to be picklable
+        return None
+
+    def batchResults(self, images, results):
+        # store the results of the batch function for the given images, called for every chunk in the order of the frames
+        pass
+
     def delete(self):
         # callback that gets called if ClickPoints wants to remove the add-on (also used before reloading the add-on)
         self.close()
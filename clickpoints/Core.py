@@ -23,16 +23,19 @@ import os
 import sys
 
 import time
+from concurrent.futures import Future
 
 from qtpy import QtGui, QtCore, QtWidgets
 from qtpy.QtCore import Qt
 import qtawesome as qta
 
 from .includes import HelpText, BroadCastEvent, SetBroadCastModules, rotate_list
-from .includes import BigImageDisplay
+from .includes.BigImageDisplay import BigImageDisplay
 from .includes import QExtendedGraphicsView
 from clickpoints.modules.FolderEditor import FolderEditor
 from .includes import Database
+from .includes.StartupTrace import startup_trace
+from .includes.FrameTrace import frame_trace, frame_trace_file
 
 from .modules.MaskHandler import MaskHandler
 from .modules.AnnotationHandler import AnnotationHandler
@@ -113,6 +116,7 @@ class ClickPointsWindow(QtWidgets.QWidget):
 
     signal_jump = QtCore.Signal(int)
     signal_jumpTo = QtCore.Signal(int)
+    signal_jumpWait = QtCore.Signal(int, bool, object)
     signal_broadcast = QtCore.Signal(str, tuple)
 
     def __init__(self, my_config: dotdict, app: QApplication, parent: QtWidgets.QWidget = None) -> None:
@@ -189,7 +193,8 @@ class ClickPointsWindow(QtWidgets.QWidget):
                 # Filter out only the arguments the function wants
                 arg_dict2 = {k: v for k, v in arg_dict.items() if k in arg_name_list}
                 # Initialize the module
-                self.modules.append(mod(**arg_dict2))
+                with startup_trace.span("module " + mod.__name__):
+                    self.modules.append(mod(**arg_dict2))
 
         SetBroadCastModules(self.modules)
 
@@ -217,6 +222,7 @@ class ClickPointsWindow(QtWidgets.QWidget):
 
         self.signal_jump.connect(self.JumpFrames)
         self.signal_jumpTo.connect(self.JumpToFrame)
+        self.signal_jumpWait.connect(self.JumpRequest)
         self.signal_broadcast.connect(lambda s, a: BroadCastEvent(self.modules, s, *a))
 
         self.setFocus()
@@ -339,7 +345,25 @@ class ClickPointsWindow(QtWidgets.QWidget):
     def JumpToFrame(self, target_id: int, threaded: bool = True) -> None:
         self.load_frame(target_id)
 
+    def JumpRequest(self, value: int, relative: bool, future: Future) -> None:
+        # a jump requested by an add-on, which waits on the future until the frame is loaded
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            if relative:
+                self.JumpFrames(value)
+            else:
+                self.JumpToFrame(value)
+        except Exception as err:
+            future.set_exception(err)
+        else:
+            future.set_result(self.target_frame)
+
     def load_frame(self, target_id: int, layer_id: None = None) -> None:
+        with frame_trace.frameChange(target_id):
+            self._load_frame(target_id, layer_id)
+
+    def _load_frame(self, target_id: int, layer_id: None = None) -> None:
         # if no frame is loaded yet, do nothing
         if self.data_file.get_image_count() == 0:
             return
@@ -367,10 +391,12 @@ class ClickPointsWindow(QtWidgets.QWidget):
         layer_id = self.current_layer
 
         # get the database entry of the image
-        image_object = self.data_file.table_image.get(sort_index=target_id, layer_id=layer_id.id)
+        with frame_trace.stage("lookup"):
+            image_object = self.data_file.table_image.get(sort_index=target_id, layer_id=layer_id.id)
 
         # load the image from disk
-        image = self.data_file.load_frame(image_object, target_id, layer=layer_id)
+        with frame_trace.stage("load"):
+            image = self.data_file.load_frame(image_object, target_id, layer=layer_id)
 
         # set the index of the current frame
         self.data_file.set_image(target_id, layer_id)
@@ -380,15 +406,17 @@ class ClickPointsWindow(QtWidgets.QWidget):
         self.setWindowTitle("%s - %s - ClickPoints - Layer %s" % (image_object.filename, self.data_file.getFilename(), self.current_layer.name))
 
         # display the image
-        self.ImageDisplay.SetImage(image, self.data_file.get_offset())
+        with frame_trace.stage("display"):
+            self.ImageDisplay.SetImage(image, self.data_file.get_offset())
 
-        # tell the QExtendedGraphicsView the shape of the new image
-        self.view.setExtend(*image.shape[:2][::-1])
+            # tell the QExtendedGraphicsView the shape of the new image
+            self.view.setExtend(*image.shape[:2][::-1])
 
         # notify all modules that a new frame is loaded
         BroadCastEvent(self.modules, "imageLoadedEvent", image_object.filename, target_id)
 
         self.target_frame = target_id
+        startup_trace.finish("first frame displayed")
 
     def CenterOn(self, x: float, y: float) -> None:
         print("Center on: %d %d" % (x,y))
@@ -419,6 +447,8 @@ class ClickPointsWindow(QtWidgets.QWidget):
             self.data_file.closeEvent(event)
         # broadcast event to the modules
         BroadCastEvent(self.modules, "closeEvent", event)
+        if frame_trace_file is not None:
+            frame_trace.save(frame_trace_file)
 
     def resizeEvent(self, event: QResizeEvent) -> None:
         # broadcast event to the modules
@@ -21,11 +21,10 @@
 
 import numpy as np
 import os
+import math
 import peewee
-import imageio.v2 as imageio
 import sys
 import platform
-import PIL
 import zlib
 try:
     from cStringIO import StringIO
@@ -39,7 +38,17 @@ PY3 = sys.version_info[0] == 3
 if PY3:
     basestring = str
 
-from .addons.imageio_plugin import imageio_plugin_BOOL  # noqa: F401
+_imageio_module = None
+
+
+def _imageio():
+    # imageio and its plugins take long to import, therefore they are only loaded when the first image or mask is used
+    global _imageio_module
+    if _imageio_module is None:
+        import imageio.v2 as imageio
+        from .addons.imageio_plugin import imageio_plugin_BOOL  # noqa: F401
+        _imageio_module = imageio
+    return _imageio_module
 
 # to get query results as dictionaries
 def dict_factory(cursor, row):
@@ -53,6 +62,7 @@ def dict_factory(cursor, row):
 class ImageField(peewee.BlobField):
     """ A database field, that """
     def db_value(self, value):
+        imageio = _imageio()
         value = np.asarray(value, dtype=np.uint8)
         # if the maximal value is 1, we can save it as a 1bit PNG
         if np.max(value) == 1:
@@ -64,6 +74,7 @@ class ImageField(peewee.BlobField):
         return peewee.binary_construct(value)
 
     def python_value(self, value):
+        imageio = _imageio()
         if not PY3:
             stream = StringIO(str(value))
         else:
@@ -353,6 +364,16 @@ def getLine(image, line, width=None):
         return np.array(datas[0])
     return np.array(datas)[::-1, :]
 
+
+def _getMaskIntensities(database_filename, image_ids, indices, channel):
+    # worker for DataFile.getMaskIntensities, which opens the database in its own process
+    db = DataFile(database_filename)
+    try:
+        return db._maskIntensities(image_ids, indices, channel)
+    finally:
+        db.db.close()
+
+
 class DataFile:
     """
     The DataFile class provides access to the .cdb file format in which ClickPoints stores the data for a project.
@@ -367,10 +388,11 @@ class DataFile:
     """
     db = None
     _reader = None
-    _current_version = "22"
+    _current_version = "26"
     _database_filename = None
     _next_sort_index = 0
     _SQLITE_MAX_VARIABLE_NUMBER = None
+    _query_profiler = None
     _config = None
     _buffer = None
 
@@ -383,6 +405,16 @@ class DataFile:
     TYPE_Ellipse = 8
     TYPE_Polygon = 16
 
+    # the tables which are counted in the frame summary table, whether they have a marker type and which rows conflict
+    # with a new row
+    _summary_kinds = {"marker": (True, "old.id = NEW.id OR (old.image_id = NEW.image_id AND old.track_id = NEW.track_id)"),
+                      "line": (True, "old.id = NEW.id"),
+                      "rectangle": (True, "old.id = NEW.id"),
+                      "ellipse": (True, "old.id = NEW.id"),
+                      "polygon": (True, "old.id = NEW.id"),
+                      "mask": (False, "old.id = NEW.id"),
+                      "annotation": (False, "old.id = NEW.id OR old.image_id = NEW.image_id")}
+
     def max_sql_variables(self):
         """Get the maximum number of arguments allowed in a query by the current
         sqlite3 implementation.
@@ -394,9 +426,14 @@ class DataFile:
         """
         import sqlite3
         db = sqlite3.connect(':memory:')
+        low, high = 0, 100000
+        # since Python 3.11 the limit can be queried directly, which is much faster than probing it
+        if hasattr(db, "getlimit"):
+            limit = db.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+            db.close()
+            return min(limit, high - 1)
         cur = db.cursor()
         cur.execute('CREATE TABLE t (test)')
-        low, high = 0, 100000
         while (high - 1) > low:
             guess = (high + low) // 2
             query = 'INSERT INTO t VALUES ' + ','.join(['(?)' for _ in
@@ -508,7 +545,7 @@ class DataFile:
 
             class Meta:
                 # image and path in combination have to be unique
-                indexes = ((('filename', 'path', 'frame'), True),)
+                indexes = ((('filename', 'path', 'frame'), True), (('sort_index', 'layer'), False))
 
             def __array__(self):
                 return self.get_data()
@@ -530,7 +567,7 @@ class DataFile:
                     else:
                         path = os.path.join(os.path.dirname(self.database_class._database_filename), self.path.path, self.filename)
                     # get the reader (open the file)
-                    self.database_class._reader = imageio.get_reader(path)
+                    self.database_class._reader = _imageio().get_reader(path)
                     self.database_class._reader.filename = self.filename
                 # return the image
                 return self.database_class._reader.get_data(self.frame)
@@ -1545,11 +1582,59 @@ class DataFile:
         self.table_tagassociation = TagAssociation
         self._tables.extend([Annotation, Tag, TagAssociation])
 
+        """ Summary Table """
+
+        class FrameSummary(BaseModel):
+            image = peewee.ForeignKeyField(Image, backref="summaries", on_delete='CASCADE')
+            kind = peewee.CharField()
+            type = peewee.IntegerField(default=0)
+            count = peewee.IntegerField(default=0)
+
+            class Meta:
+                # image and kind are in separate indices to look up the images of a kind and the kinds of an image
+                indexes = ((('image', 'kind', 'type'), True), (('kind', 'type'), False))
+
+            def __str__(self):
+                return "FrameSummaryObject id%s:\timage=%s\tkind=%s\ttype=%s\tcount=%s" \
+                       % (self.id, self.image, self.kind, self.type, self.count)
+
+        self.table_framesummary = FrameSummary
+        self._tables.extend([FrameSummary])
+
+        class TrackStatistic(BaseModel):
+            track = peewee.ForeignKeyField(Track, unique=True, backref="statistics", on_delete='CASCADE')
+            count = peewee.IntegerField(index=True)
+            first_frame = peewee.IntegerField(index=True)
+            last_frame = peewee.IntegerField(index=True)
+            start_x = peewee.FloatField()
+            start_y = peewee.FloatField()
+            end_x = peewee.FloatField()
+            end_y = peewee.FloatField()
+            displacement = peewee.FloatField(index=True)
+            path_length = peewee.FloatField(index=True)
+            min_x = peewee.FloatField()
+            max_x = peewee.FloatField()
+            min_y = peewee.FloatField()
+            max_y = peewee.FloatField()
+
+            def __str__(self):
+                return "TrackStatisticObject id%s:\ttrack=%s\tcount=%s\tframes=%s-%s\tdisplacement=%s\tpath_length=%s" \
+                       % (self.id, self.track_id, self.count, self.first_frame, self.last_frame, self.displacement,
+                          self.path_length)
+
+        self.table_trackstatistic = TrackStatistic
+        self._tables.extend([TrackStatistic])
+
         """ Connect """
         try:
             self.db.connect()
         except peewee.OperationalError:
             pass
+        # the track statistics need sqrt, which is missing in sqlite versions without math functions
+        try:
+            self.db.execute_sql("SELECT sqrt(1)")
+        except peewee.OperationalError:
+            self.db.register_function(math.sqrt, "sqrt", 1)
         self._CreateTables()
         self.db.execute_sql("PRAGMA foreign_keys = ON")
         self.db.execute_sql("PRAGMA journal_mode = WAL")
@@ -1559,6 +1644,8 @@ class DataFile:
                                 BEGIN\
                                   DELETE FROM track WHERE id = OLD.track_id AND (SELECT COUNT(marker.id) FROM marker WHERE marker.track_id = track.id) = 0;\
                                 END;")
+            self._CreateSummaryTriggers()
+            self._CreateTrackStatisticTriggers()
 
         if new_database:
             self.table_meta(key="version", value=self._current_version).save()
@@ -1611,6 +1698,11 @@ class DataFile:
                                 "one image bigger than the allowed memory size.\n"
                                 "The buffer should be only as big as the\n"
                                 "RAM has space to prevent swapping.")
+        self._AddOption(key="undo_memory", display_name="Undo Memory Amount", default=100, value_type="int",
+                        min_value=1, unit="MB",
+                        tooltip="How much memory the undo and redo steps\n"
+                                "are allowed to use in MB. If they need\n"
+                                "more, the oldest steps are dropped.")
 
         self._last_category = "Script Launcher"
         self._AddOption(key="scripts", hidden=True, default=[], value_type="array")
@@ -1644,6 +1736,12 @@ class DataFile:
         self._AddOption(key="tracking_hide_leading", display_name="Track hide leading", default=2, value_type="int", min_value=0,
                         tooltip="Nr of frames after the last track marker\n"
                                 "until the the track is hidden")
+        self._AddOption(key="marker_batch_threshold", display_name="Batch Marker Threshold", default=1000, value_type="int",
+                        min_value=-1,
+                        tooltip="From how many markers in a frame on,\n"
+                                "markers are drawn together in one batch\n"
+                                "and only get an own item when clicked.\n"
+                                "-1 to always use own items.")
 
         self._last_category = "Mask"
         self._AddOption(key="draw_types", default=[[1, [124, 124, 255], "mask"]], value_type="list", hidden=True)
@@ -1670,6 +1768,10 @@ class DataFile:
                                 "exif[] exit information from jpeg files.\n"
                                 "regex[] information from the filename.\n"
                                 "meta[] meta information from tiff images.")
+        self._AddOption(key="frame_latency", display_name="Frame Latency", default=False, value_type="bool",
+                        tooltip="Measure how long the stages of a\n"
+                                "frame change take and display the\n"
+                                "percentiles of the slowest stages.")
         self._AddOption(key="infohud_interface_hidden", default=True, value_type="bool", hidden=True)
 
         self._last_category = "Timeline"
@@ -1723,6 +1825,15 @@ class DataFile:
         self._AddOption(key="sql_user", default='', value_type="string", hidden=True)
         self._AddOption(key="sql_pwd", default='', value_type="string", hidden=True)
 
+        self._last_category = "Profiling"
+        self._AddOption(key="query_profiling", display_name="Query Profiling", default=False, value_type="bool",
+                        tooltip="Record the execution time and call\n"
+                                "site of every database query.")
+        self._AddOption(key="query_profiling_threshold", display_name="Slow Query Threshold", default=10.0,
+                        value_type="float", min_value=0, unit="ms",
+                        tooltip="For queries slower than this the\n"
+                                "query plan is stored.")
+
     def _AddOption(self, **kwargs):
         category = kwargs["category"] if "category" in kwargs else self._last_category
         if "display_name" not in kwargs:
@@ -1936,6 +2047,7 @@ class DataFile:
                     if os.path.exists(tmp_maskpath):
                         from PIL import Image as PILImage
                         im = np.asarray(PILImage.open(tmp_maskpath))
+                        imageio = _imageio()
                         value = imageio.imwrite(imageio.RETURN_BYTES, im, format=".png")
                         value = peewee.binary_construct(value)
                         self.db.execute_sql("INSERT INTO mask_tmp VALUES (?, ?, ?)", [mask[0], mask[1], value])
@@ -2249,8 +2361,200 @@ class DataFile:
                 """)
             self._SetVersion(22)
 
+        if nr_version < 23:
+            print("\tto 23")
+
+            with self.db.transaction():
+                # create a table which counts the objects of each image, kind and type
+                self.db.execute_sql("""CREATE TABLE framesummary (
+                                                                id       INTEGER       NOT NULL
+                                                                                       PRIMARY KEY,
+                                                                image_id INTEGER       NOT NULL,
+                                                                kind     VARCHAR (255) NOT NULL,
+                                                                type     INTEGER       NOT NULL,
+                                                                count    INTEGER       NOT NULL,
+                                                                FOREIGN KEY (
+                                                                    image_id
+                                                                )
+                                                                REFERENCES image (id) ON DELETE CASCADE
+                                                            );
+                """)
+                self.db.execute_sql('CREATE INDEX "framesummary_image_id" ON "framesummary" ("image_id");')
+                self.db.execute_sql('CREATE UNIQUE INDEX "framesummary_image_id_kind_type" ON "framesummary" ("image_id", "kind", "type");')
+                self.db.execute_sql('CREATE INDEX "framesummary_kind_type" ON "framesummary" ("kind", "type");')
+                self._CreateSummaryTriggers()
+                self._FillSummaryTable()
+            self._SetVersion(23)
+
+        if nr_version < 24:
+            print("\tto 24")
+
+            with self.db.transaction():
+                # create a table with the statistics of each track
+                self.db.execute_sql("""CREATE TABLE trackstatistic (
+                                                                id           INTEGER NOT NULL
+                                                                                     PRIMARY KEY,
+                                                                track_id     INTEGER NOT NULL,
+                                                                count        INTEGER NOT NULL,
+                                                                first_frame  INTEGER NOT NULL,
+                                                                last_frame   INTEGER NOT NULL,
+                                                                start_x      REAL    NOT NULL,
+                                                                start_y      REAL    NOT NULL,
+                                                                end_x        REAL    NOT NULL,
+                                                                end_y        REAL    NOT NULL,
+                                                                displacement REAL    NOT NULL,
+                                                                path_length  REAL    NOT NULL,
+                                                                min_x        REAL    NOT NULL,
+                                                                max_x        REAL    NOT NULL,
+                                                                min_y        REAL    NOT NULL,
+                                                                max_y        REAL    NOT NULL,
+                                                                FOREIGN KEY (
+                                                                    track_id
+                                                                )
+                                                                REFERENCES track (id) ON DELETE CASCADE
+                                                            );
+                """)
+                self.db.execute_sql('CREATE UNIQUE INDEX "trackstatistic_track_id" ON "trackstatistic" ("track_id");')
+                for column in ["count", "first_frame", "last_frame", "displacement", "path_length"]:
+                    self.db.execute_sql('CREATE INDEX "trackstatistic_{0}" ON "trackstatistic" ("{0}");'.format(column))
+                self._CreateTrackStatisticTriggers()
+                self.updateTrackStatistics()
+            self._SetVersion(24)
+
+        if nr_version < 25:
+            print("\tto 25")
+
+            with self.db.transaction():
+                # the images are looked up by their frame, which needs an index
+                self.db.execute_sql('CREATE INDEX IF NOT EXISTS "image_sort_index_layer_id" ON "image" ("sort_index", "layer_id");')
+            self._SetVersion(25)
+
+        if nr_version < 26:
+            print("\tto 26")
+
+            with self.db.transaction():
+                # the replace triggers of the frame summary only fire if the insert replaces an object
+                for kind in self._summary_kinds:
+                    self.db.execute_sql("DROP TRIGGER IF EXISTS framesummary_{kind}_replace".format(kind=kind))
+                self._CreateSummaryTriggers()
+            self._SetVersion(26)
+
         self.db.connection().row_factory = None
 
+    def _CreateSummaryTriggers(self):
+        # keep the counts of the frame summary table up to date when objects are added, removed or changed
+        def increase(row, kind, type):
+            # no INSERT OR IGNORE here, as the conflict clause of the outer statement would replace it
+            return """INSERT INTO framesummary (image_id, kind, type, count) SELECT {row}.image_id, '{kind}', {type}, 0
+                        WHERE NOT EXISTS (SELECT 1 FROM framesummary WHERE image_id = {row}.image_id AND kind = '{kind}' AND type = {type});
+                      UPDATE framesummary SET count = count + 1 WHERE image_id = {row}.image_id AND kind = '{kind}' AND type = {type};
+                   """.format(row=row, kind=kind, type=type)
+
+        def decrease(row, kind, type):
+            return """UPDATE framesummary SET count = count - 1 WHERE image_id = {row}.image_id AND kind = '{kind}' AND type = {type};
+                      DELETE FROM framesummary WHERE image_id = {row}.image_id AND kind = '{kind}' AND type = {type} AND count <= 0;
+                   """.format(row=row, kind=kind, type=type)
+
+        def replaced(kind, type, conflict):
+            # INSERT OR REPLACE removes conflicting rows without firing the delete trigger, therefore they are
+            # subtracted before the insert (if the insert fails, this is rolled back with the statement)
+            # only the summary rows of the conflicting objects are touched, so that an insert does not scan all frames
+            return """UPDATE framesummary SET count = count - (SELECT COUNT(*) FROM {kind} AS old WHERE ({conflict}) AND old.image_id = framesummary.image_id AND {type} = framesummary.type)
+                        WHERE kind = '{kind}' AND image_id IN (SELECT old.image_id FROM {kind} AS old WHERE {conflict});
+                      DELETE FROM framesummary WHERE kind = '{kind}' AND count <= 0 AND image_id IN (SELECT old.image_id FROM {kind} AS old WHERE {conflict});
+                   """.format(kind=kind, type=type, conflict=conflict)
+
+        for kind, (has_type, conflict) in self._summary_kinds.items():
+            new_type, old_type = ("IFNULL(NEW.type_id, 0)", "IFNULL(OLD.type_id, 0)") if has_type else ("0", "0")
+            changed = "OLD.image_id IS NOT NEW.image_id" + (" OR OLD.type_id IS NOT NEW.type_id" if has_type else "")
+            self.db.execute_sql("CREATE TRIGGER IF NOT EXISTS framesummary_{kind}_replace BEFORE INSERT ON {kind} "
+                                "WHEN EXISTS (SELECT 1 FROM {kind} AS old WHERE {conflict}) BEGIN {sql} END;"
+                                .format(kind=kind, conflict=conflict,
+                                        sql=replaced(kind, "IFNULL(old.type_id, 0)" if has_type else "0", conflict)))
+            self.db.execute_sql("CREATE TRIGGER IF NOT EXISTS framesummary_{kind}_insert AFTER INSERT ON {kind} BEGIN {sql} END;"
+                                .format(kind=kind, sql=increase("NEW", kind, new_type)))
+            self.db.execute_sql("CREATE TRIGGER IF NOT EXISTS framesummary_{kind}_delete AFTER DELETE ON {kind} BEGIN {sql} END;"
+                                .format(kind=kind, sql=decrease("OLD", kind, old_type)))
+            self.db.execute_sql("CREATE TRIGGER IF NOT EXISTS framesummary_{kind}_update AFTER UPDATE ON {kind} WHEN {changed} BEGIN {sql} END;"
+                                .format(kind=kind, changed=changed, sql=decrease("OLD", kind, old_type) + increase("NEW", kind, new_type)))
+
+    def _FillSummaryTable(self):
+        # count all objects again, e.g. for databases from older versions
+        self.db.execute_sql("DELETE FROM framesummary")
+        for kind, (has_type, conflict) in self._summary_kinds.items():
+            type = "IFNULL(type_id, 0)" if has_type else "0"
+            self.db.execute_sql("INSERT INTO framesummary (image_id, kind, type, count) "
+                                "SELECT image_id, '{kind}', {type}, COUNT(*) FROM {kind} GROUP BY image_id{group_type}"
+                                .format(kind=kind, type=type, group_type=", type_id" if has_type else ""))
+
+    def _CreateTrackStatisticTriggers(self):
+        # keep the track statistics up to date. Markers which are appended at the end or the start of a track update
+        # the statistics directly, all other changes remove the statistics of the track, which are then computed again
+        # by updateTrackStatistics
+        frame = "(SELECT sort_index FROM image WHERE id = NEW.image_id)"
+        self.db.execute_sql("""CREATE TRIGGER IF NOT EXISTS trackstatistic_marker_replace BEFORE INSERT ON marker BEGIN
+                                 DELETE FROM trackstatistic WHERE track_id IN (SELECT track_id FROM marker AS old
+                                   WHERE old.id = NEW.id OR (old.image_id = NEW.image_id AND old.track_id = NEW.track_id));
+                               END;""")
+        self.db.execute_sql("""CREATE TRIGGER IF NOT EXISTS trackstatistic_marker_insert AFTER INSERT ON marker
+                               WHEN NEW.track_id IS NOT NULL BEGIN
+                                 DELETE FROM trackstatistic WHERE track_id = NEW.track_id
+                                   AND last_frame >= {frame} AND first_frame <= {frame};
+                                 UPDATE trackstatistic SET count = count + 1, min_x = min(min_x, NEW.x), max_x = max(max_x, NEW.x),
+                                   min_y = min(min_y, NEW.y), max_y = max(max_y, NEW.y),
+                                   path_length = path_length + sqrt((NEW.x - end_x) * (NEW.x - end_x) + (NEW.y - end_y) * (NEW.y - end_y)),
+                                   displacement = sqrt((NEW.x - start_x) * (NEW.x - start_x) + (NEW.y - start_y) * (NEW.y - start_y)),
+                                   last_frame = {frame}, end_x = NEW.x, end_y = NEW.y
+                                   WHERE track_id = NEW.track_id AND last_frame < {frame};
+                                 UPDATE trackstatistic SET count = count + 1, min_x = min(min_x, NEW.x), max_x = max(max_x, NEW.x),
+                                   min_y = min(min_y, NEW.y), max_y = max(max_y, NEW.y),
+                                   path_length = path_length + sqrt((NEW.x - start_x) * (NEW.x - start_x) + (NEW.y - start_y) * (NEW.y - start_y)),
+                                   displacement = sqrt((NEW.x - end_x) * (NEW.x - end_x) + (NEW.y - end_y) * (NEW.y - end_y)),
+                                   first_frame = {frame}, start_x = NEW.x, start_y = NEW.y
+                                   WHERE track_id = NEW.track_id AND first_frame > {frame};
+                                 INSERT INTO trackstatistic (track_id, count, first_frame, last_frame, start_x, start_y, end_x, end_y,
+                                                             displacement, path_length, min_x, max_x, min_y, max_y)
+                                   SELECT NEW.track_id, 1, {frame}, {frame}, NEW.x, NEW.y, NEW.x, NEW.y, 0, 0, NEW.x, NEW.x, NEW.y, NEW.y
+                                   WHERE NOT EXISTS (SELECT 1 FROM trackstatistic WHERE track_id = NEW.track_id)
+                                   AND NOT EXISTS (SELECT 1 FROM marker WHERE track_id = NEW.track_id AND id != NEW.id);
+                               END;""".format(frame=frame))
+        self.db.execute_sql("""CREATE TRIGGER IF NOT EXISTS trackstatistic_marker_delete AFTER DELETE ON marker
+                               WHEN OLD.track_id IS NOT NULL BEGIN
+                                 DELETE FROM trackstatistic WHERE track_id = OLD.track_id;
+                               END;""")
+        self.db.execute_sql("""CREATE TRIGGER IF NOT EXISTS trackstatistic_marker_update AFTER UPDATE ON marker
+                               WHEN OLD.track_id IS NOT NEW.track_id OR OLD.image_id IS NOT NEW.image_id
+                                 OR OLD.x IS NOT NEW.x OR OLD.y IS NOT NEW.y BEGIN
+                                 DELETE FROM trackstatistic WHERE track_id IN (OLD.track_id, NEW.track_id);
+                               END;""")
+        self.db.execute_sql("""CREATE TRIGGER IF NOT EXISTS trackstatistic_image_update AFTER UPDATE ON image
+                               WHEN OLD.sort_index IS NOT NEW.sort_index BEGIN
+                                 DELETE FROM trackstatistic WHERE track_id IN (SELECT track_id FROM marker WHERE image_id = NEW.id);
+                               END;""")
+
+    def updateTrackStatistics(self):
+        """
+        Compute the :py:class:`TrackStatistic` entries of all tracks, whose statistics are not up to date. The
+        statistics of markers appended to a track are updated directly by the database, other changes of the markers
+        of a track have to be computed again. This is done automatically by :py:meth:`~.DataFile.getTrackStatistics`
+        and :py:meth:`~.DataFile.getTracks`.
+        """
+        self.db.execute_sql("""INSERT INTO trackstatistic (track_id, count, first_frame, last_frame, start_x, start_y, end_x, end_y,
+                                                      displacement, path_length, min_x, max_x, min_y, max_y)
+                               SELECT track_id, COUNT(*), MIN(frame), MAX(frame), MIN(start_x), MIN(start_y), MIN(end_x), MIN(end_y),
+                                 sqrt((MIN(end_x) - MIN(start_x)) * (MIN(end_x) - MIN(start_x)) + (MIN(end_y) - MIN(start_y)) * (MIN(end_y) - MIN(start_y))),
+                                 TOTAL(sqrt((x - last_x) * (x - last_x) + (y - last_y) * (y - last_y))),
+                                 MIN(x), MAX(x), MIN(y), MAX(y)
+                               FROM (SELECT marker.track_id, image.sort_index AS frame, marker.x, marker.y,
+                                       FIRST_VALUE(marker.x) OVER forward AS start_x, FIRST_VALUE(marker.y) OVER forward AS start_y,
+                                       FIRST_VALUE(marker.x) OVER backward AS end_x, FIRST_VALUE(marker.y) OVER backward AS end_y,
+                                       LAG(marker.x) OVER forward AS last_x, LAG(marker.y) OVER forward AS last_y
+                                     FROM marker JOIN image ON image.id = marker.image_id
+                                     WHERE marker.track_id IN (SELECT id FROM track WHERE id NOT IN (SELECT track_id FROM trackstatistic))
+                                     WINDOW forward AS (PARTITION BY marker.track_id ORDER BY image.sort_index),
+                                            backward AS (PARTITION BY marker.track_id ORDER BY image.sort_index DESC))
+                               GROUP BY track_id""")
+
     def _SetVersion(self, nr_new_version):
         self.db.execute_sql("INSERT OR REPLACE INTO meta (id,key,value) VALUES ( \
                                             (SELECT id FROM meta WHERE key='version'),'version',%s)" % str(
@@ -2406,6 +2710,86 @@ class DataFile:
         """
         return self._current_version
 
+    def enableQueryProfiling(self, threshold=0.01):
+        """
+        Start recording the execution time and the call site of every SQL statement. For statements which take longer
+        than the threshold, the query plan is stored. The statements are aggregated after replacing their literals.
+
+        See also: :py:meth:`~.DataFile.disableQueryProfiling`, :py:meth:`~.DataFile.getQueryStatistics`,
+        :py:meth:`~.DataFile.getQueryReport`.
+
+        Parameters
+        ----------
+        threshold : float, optional
+            the duration in seconds above which a statement is considered slow.
+        """
+        from .QueryProfiler import QueryProfiler
+        if self._query_profiler is None:
+            self._query_profiler = QueryProfiler(self.db, threshold)
+        self._query_profiler.threshold = threshold
+        self._query_profiler.start()
+
+    def disableQueryProfiling(self, clear=False):
+        """
+        Stop recording the SQL statements.
+
+        See also: :py:meth:`~.DataFile.enableQueryProfiling`.
+
+        Parameters
+        ----------
+        clear : bool, optional
+            whether to delete the recorded statistics.
+        """
+        if self._query_profiler is None:
+            return
+        self._query_profiler.stop()
+        if clear:
+            self._query_profiler.clear()
+
+    def getQueryStatistics(self, sort_by="total"):
+        """
+        Get the statistics of the recorded SQL statements.
+
+        See also: :py:meth:`~.DataFile.enableQueryProfiling`, :py:meth:`~.DataFile.getQueryReport`.
+
+        Parameters
+        ----------
+        sort_by : string, optional
+            the key by which the statements are sorted in descending order, e.g. "total", "count", "mean" or "max".
+
+        Returns
+        -------
+        statistics : list of dict
+            for every normalised statement the keys sql, count, total, mean, max (in seconds), slow (the number of
+            executions above the threshold), call_sites (list of call site and count), example (the first slow
+            statement with its parameters) and plan (the query plan of the first slow execution).
+        """
+        if self._query_profiler is None:
+            return []
+        return self._query_profiler.getStatistics(sort_by)
+
+    def getQueryReport(self, limit=20, sort_by="total"):
+        """
+        Get a text report of the recorded SQL statements.
+
+        See also: :py:meth:`~.DataFile.enableQueryProfiling`, :py:meth:`~.DataFile.getQueryStatistics`.
+
+        Parameters
+        ----------
+        limit : int, optional
+            the number of statements to include.
+        sort_by : string, optional
+            the key by which the statements are sorted, see :py:meth:`~.DataFile.getQueryStatistics`.
+
+        Returns
+        -------
+        report : string
+            the statements with their timing, call sites and query plans.
+        """
+        if self._query_profiler is None:
+            return "Query profiling is not enabled."
+        return self._query_profiler.report(limit, sort_by)
+
     def getPath(self, path_string=None, id=None, create=False, absolute=False):
         """
         Get a :py:class:`Path` entry from the database.
@@ -2972,11 +3356,14 @@ class DataFile:
         query = addFilter(query, layer, self.table_image.layer)
         return query.execute()
 
-    def getTracks(self, type=None, text=None, hidden=None, id=None):
+    def getTracks(self, type=None, text=None, hidden=None, id=None, count=None, first_frame=None, last_frame=None,
+                  displacement=None, path_length=None):
         """
-        Get all :py:class:`Track` entries, optional filter by type
+        Get all :py:class:`Track` entries, optional filter by type or by the :py:class:`TrackStatistic` of the tracks.
+        The statistic filters can be single values, lists or slices for ranges.
 
-        See also: :py:meth:`~.DataFile.getTrack`, :py:meth:`~.DataFile.setTrack`, :py:meth:`~.DataFile.deleteTracks`, :py:meth:`~.DataFile.getTracksNanPadded`.
+        See also: :py:meth:`~.DataFile.getTrack`, :py:meth:`~.DataFile.setTrack`, :py:meth:`~.DataFile.deleteTracks`, :py:meth:`~.DataFile.getTracksNanPadded`,
+        :py:meth:`~.DataFile.getTrackStatistics`.
 
         Parameters
         ----------
@@ -2988,6 +3375,16 @@ class DataFile:
             whether the tracks should be displayed in ClickPoints
         id : int, array_like, optional
             the  :py:class:`Track` ID
+        count : int, array_like, slice, optional
+            the number of markers of the track.
+        first_frame : int, array_like, slice, optional
+            the first frame of the track.
+        last_frame : int, array_like, slice, optional
+            the last frame of the track.
+        displacement : float, slice, optional
+            the distance between the first and the last marker of the track.
+        path_length : float, slice, optional
+            the summed distance between the consecutive markers of the track.
 
         Returns
         -------
@@ -3002,6 +3399,45 @@ class DataFile:
         query = addFilter(query, hidden, self.table_track.hidden)
         query = addFilter(query, id, self.table_track.id)
 
+        # the filters on the statistics
+        statistics = dict(count=count, first_frame=first_frame, last_frame=last_frame, displacement=displacement,
+                          path_length=path_length)
+        if any(value is not None for value in statistics.values()):
+            self.updateTrackStatistics()
+            query = query.join(self.table_trackstatistic)
+            for key, value in statistics.items():
+                query = addFilter(query, value, getattr(self.table_trackstatistic, key))
+
+        return query
+
+    def getTrackStatistics(self, track=None, type=None):
+        """
+        Get the :py:class:`TrackStatistic` entries, which hold the marker count, the first and last frame, the start and
+        end position, the displacement, the path length and the bounding box of each track.
+
+        See also: :py:meth:`~.DataFile.getTracks`, :py:meth:`~.DataFile.updateTrackStatistics`.
+
+        Parameters
+        ----------
+        track : int, :py:class:`Track`, array_like, optional
+            the track/s of the statistics.
+        type: :py:class:`MarkerType`, str, array_like, optional
+            the marker type/types or name of the marker type of the tracks.
+
+        Returns
+        -------
+        entries : array_like
+            a query object which contains the requested :py:class:`TrackStatistic` entries.
+        """
+        type = self._processesTypeNameField(type, ["TYPE_Track"])
+        self.updateTrackStatistics()
+
+        query = self.table_trackstatistic.select()
+        if type is not None:
+            query = query.join(self.table_track)
+            query = addFilter(query, type, self.table_track.type)
+        query = addFilter(query, track, self.table_trackstatistic.track)
+
         return query
 
     def getTrack(self, id):
@@ -3630,6 +4066,110 @@ class DataFile:
         query = addFilter(query, id, self.table_mask.id)
         query.execute()
 
+    def _maskIntensities(self, image_ids, indices, channel):
+        # the intensity sums, squared sums and pixel counts of the given mask indices in the given images
+        indices = np.asarray(indices, dtype=int)
+        sums = np.zeros((len(indices), len(image_ids)))
+        squares = np.zeros((len(indices), len(image_ids)))
+        areas = np.zeros((len(indices), len(image_ids)), dtype=int)
+
+        images = {image.id: image for image in self.table_image.select().where(self.table_image.id.in_(image_ids))}
+        for t, image_id in enumerate(image_ids):
+            # the masks are fetched one by one, so that only one decoded mask is kept in memory
+            mask = self.table_mask.select().where(self.table_mask.image == image_id).first()
+            if mask is None:
+                continue
+            mask = mask.data
+            # decode the image once
+            data = images[image_id].data
+            if len(data.shape) == 3:
+                if data.shape[2] == 1:
+                    data = data[:, :, 0]
+                else:
+                    data = data[:, :, channel]
+            # one pass over the image for all mask types
+            mask = mask.ravel()
+            data = data.ravel().astype(float)
+            length = max(256, indices.max() + 1)
+            sums[:, t] = np.bincount(mask, weights=data, minlength=length)[indices]
+            squares[:, t] = np.bincount(mask, weights=data ** 2, minlength=length)[indices]
+            areas[:, t] = np.bincount(mask, minlength=length)[indices]
+        return sums, squares, areas
+
+    def getMaskIntensities(self, mask_type=None, frame=None, layer=None, channel=0, processes=1):
+        """
+        Get the time series of the image intensities in the regions of the given mask types. Every image and its mask are
+        only decoded once for all mask types.
+
+        See also: :py:meth:`~.DataFile.getMasks`, :py:meth:`~.DataFile.getMaskTypes`.
+
+        Parameters
+        ----------
+        mask_type : string, :py:class:`MaskType`, array_like, optional
+            the mask type/types or name/names of the mask types. Default: all mask types sorted by their index.
+        frame : int, array_like, optional
+            the frame number/s of the images. Default: all images.
+        layer : int, string, optional
+            the layer of the images.
+        channel : int, optional
+            the color channel, which is used for images with multiple channels. Default: 0.
+        processes : int, optional
+            the number of processes in which the images are loaded, 0 uses all cpus. Default: 1.
+
+        Returns
+        -------
+        sums : ndarray
+            the sum of the intensities with the shape [n_mask_types, n_images].
+        areas : ndarray
+            the number of pixels with the shape [n_mask_types, n_images].
+        means : ndarray
+            the mean intensity (nan for an empty area) with the shape [n_mask_types, n_images].
+        stds : ndarray
+            the standard deviation of the intensity (nan for an empty area) with the shape [n_mask_types, n_images].
+        """
+        if mask_type is None:
+            mask_types = list(self.getMaskTypes().order_by(self.table_masktype.index))
+        else:
+            if not isinstance(mask_type, (tuple, list)):
+                mask_type = [mask_type]
+            mask_types = []
+            for type in mask_type:
+                if isinstance(type, basestring):
+                    name = type
+                    type = self.getMaskType(name=name)
+                    if type is None:
+                        raise DoesNotExist("No mask type with the name \"%s\" exists." % name)
+                mask_types.append(type)
+        indices = [type.index for type in mask_types]
+        image_ids = [image.id for image in self.getImages(frame=frame, layer=layer)]
+
+        if len(indices) == 0 or len(image_ids) == 0:
+            sums = np.zeros((len(indices), len(image_ids)))
+            squares = np.zeros((len(indices), len(image_ids)))
+            areas = np.zeros((len(indices), len(image_ids)), dtype=int)
+        else:
+            if processes == 0:
+                import multiprocessing
+                processes = multiprocessing.cpu_count()
+            # in memory databases cannot be opened by other processes
+            if processes <= 1 or len(image_ids) == 1 or self._database_filename == ":memory:":
+                sums, squares, areas = self._maskIntensities(image_ids, indices, channel)
+            else:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                chunk_size = int(math.ceil(len(image_ids) / (processes * 4)))
+                chunks = [image_ids[idx:idx + chunk_size] for idx in range(0, len(image_ids), chunk_size)]
+                with ProcessPoolExecutor(max_workers=min(processes, len(chunks)),
+                                         mp_context=multiprocessing.get_context("spawn")) as executor:
+                    results = list(executor.map(_getMaskIntensities, [self._database_filename] * len(chunks), chunks,
+                                                [indices] * len(chunks), [channel] * len(chunks)))
+                sums, squares, areas = [np.concatenate(values, axis=1) for values in zip(*results)]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / areas
+            stds = np.sqrt(np.maximum(squares / areas - means ** 2, 0))
+        return sums, areas, means, stds
+
     """ Markers """
 
     def getMarker(self, id):
@@ -5167,6 +5707,133 @@ class DataFile:
 
         return query.execute()
 
+    def _processSummaryTypeField(self, types):
+        def CheckType(type):
+            if isinstance(type, basestring):
+                type_name = type
+                type = self.getMarkerType(type)
+                if type is None:
+                    raise MarkerTypeDoesNotExist("No marker type with the name \"%s\" exists." % type_name)
+            # the summary table stores the type id, 0 stands for objects without type
+            if type is None:
+                return 0
+            if isinstance(type, (int, np.integer)):
+                return int(type)
+            return type.id
+
+        if types is None:
+            return None
+        if isinstance(types, (tuple, list)):
+            return [CheckType(type) for type in types]
+        return CheckType(types)
+
+    def getFrameSummaries(self, image=None, frame=None, filename=None, kind=None, type=None, layer=None):
+        """
+        Get the entries of the frame summary table, which holds the number of objects of each kind and marker type for
+        every image. The table is kept up to date by the database itself, so reading it is much faster than counting
+        the objects.
+
+        See also: :py:meth:`~.DataFile.getFrameSummaryCount`, :py:meth:`~.DataFile.getMarkedFrames`.
+
+        Parameters
+        ----------
+        image : int, :py:class:`Image`, array_like, optional
+            the image/s of the entries.
+        frame : int, array_like, optional
+            the frame/s of the images of the entries.
+        filename : string, array_like, optional
+            the filename/s of the images of the entries.
+        kind : string, array_like, optional
+            the kind/s of the counted objects: "marker", "line", "rectangle", "ellipse", "polygon", "mask" or
+            "annotation".
+        type : string, int, :py:class:`MarkerType`, array_like, optional
+            the marker type/s (or name/s or id/s) of the counted objects. Masks and annotations have no type.
+        layer : int, string, optional
+            the layer of the images of the entries.
+
+        Returns
+        -------
+        entries : array_like
+            a query object which contains the summary entries with the fields image, kind, type (the id of the
+            marker type or 0) and count.
+        """
+        type = self._processSummaryTypeField(type)
+        layer = self._processLayerNameField(layer)
+
+        query = self.table_framesummary.select(self.table_framesummary, self.table_image).join(self.table_image)
+
+        image = self._processImagesField(image, frame, filename, layer)
+
+        query = addFilter(query, image, self.table_framesummary.image)
+        query = addFilter(query, frame, self.table_image.sort_index)
+        query = addFilter(query, filename, self.table_image.filename)
+        query = addFilter(query, layer, self.table_image.layer)
+        query = addFilter(query, kind, self.table_framesummary.kind)
+        query = addFilter(query, type, self.table_framesummary.type)
+
+        return query
+
+    def getFrameSummaryCount(self, image=None, frame=None, filename=None, kind=None, type=None, layer=None):
+        """
+        Get the number of objects with the given criteria from the frame summary table.
+
+        See also: :py:meth:`~.DataFile.getFrameSummaries`, :py:meth:`~.DataFile.getMarkedFrames`.
+
+        Parameters
+        ----------
+        image : int, :py:class:`Image`, array_like, optional
+            the image/s of the objects.
+        frame : int, array_like, optional
+            the frame/s of the images of the objects.
+        filename : string, array_like, optional
+            the filename/s of the images of the objects.
+        kind : string, array_like, optional
+            the kind/s of the objects: "marker", "line", "rectangle", "ellipse", "polygon", "mask" or "annotation".
+        type : string, int, :py:class:`MarkerType`, array_like, optional
+            the marker type/s (or name/s or id/s) of the objects.
+        layer : int, string, optional
+            the layer of the images of the objects.
+
+        Returns
+        -------
+        count : int
+            the number of objects.
+        """
+        query = self.getFrameSummaries(image=image, frame=frame, filename=filename, kind=kind, type=type, layer=layer)
+        return query.select(peewee.fn.SUM(self.table_framesummary.count)).scalar() or 0
+
+    def getMarkedFrames(self, kind=None, type=None, layer=None):
+        """
+        Get the frame numbers of all images which have objects of the given kind and marker type.
+
+        See also: :py:meth:`~.DataFile.getFrameSummaries`, :py:meth:`~.DataFile.getFrameSummaryCount`.
+
+        Parameters
+        ----------
+        kind : string, array_like, optional
+            the kind/s of the objects: "marker", "line", "rectangle", "ellipse", "polygon", "mask" or "annotation".
+        type : string, int, :py:class:`MarkerType`, array_like, optional
+            the marker type/s (or name/s or id/s) of the objects.
+        layer : int, string, optional
+            the layer of the images.
+
+        Returns
+        -------
+        frames : ndarray
+            the sorted frame numbers.
+        """
+        type = self._processSummaryTypeField(type)
+        layer = self._processLayerNameField(layer)
+
+        query = (self.table_image.select(self.table_image.sort_index).join(self.table_framesummary)
+                 .distinct().order_by(self.table_image.sort_index))
+
+        query = addFilter(query, layer, self.table_image.layer)
+        query = addFilter(query, kind, self.table_framesummary.kind)
+        query = addFilter(query, type, self.table_framesummary.type)
+
+        return np.array([frame for frame, in query.tuples()], dtype=int)
+
     def mergeWith(self, other_db):
         my_marker_types = {t.name: t.id for t in self.getMarkerTypes()}
         other_marker_types = {t.name: t.id for t in other_db.getMarkerTypes()}
@@ -5307,19 +5974,19 @@ class DataFile:
 
         # now we built a little LUT/encoding scheme, that tells us which positions in the "pos" array encodes which image/track
         # start with what track ids could possibly be in nonNanPos
-        allowedTracksIds = np.array(track_ids, dtype=int)
+        allowedTracksIds = np.array(track_ids, dtype=int).ravel()
         # now built a look up table, that maps these track ids to a an id in [0, track_count] -> column id of that track
-        allowedTracksLUT = np.cumsum(np.isin(np.arange(max(allowedTracksIds)+1), allowedTracksIds))
+        allowedTracksLUT = np.cumsum(np.isin(np.arange(allowedTracksIds.max()+1), allowedTracksIds))
         # now we renumber the tracks from our query to fit into [0, track_count]
-        encTracksId = allowedTracksLUT[nonNanPos[:,0].astype(int)] - allowedTracksIds.min()
+        encTracksId = allowedTracksLUT[nonNanPos[:,0].astype(int)] - 1
 
         # repeat the same with the image ids
         # start with what image ids could possibly be in nonNanPos
-        allowedImageIds = np.array(image_ids, dtype=int)
+        allowedImageIds = np.array(image_ids, dtype=int).ravel()
         # now built a look up table, that maps these image ids to a an id in [0, image_count] -> column id of that image
-        allowedImageLUT = np.cumsum(np.isin(np.arange(max(allowedImageIds)+1), allowedImageIds))
+        allowedImageLUT = np.cumsum(np.isin(np.arange(allowedImageIds.max()+1), allowedImageIds))
         # now we renumber the iamges from our query to fit into [0, image_count]
-        encImageId = allowedImageLUT[nonNanPos[:,1].astype(int)] - allowedImageIds.min()
+        encImageId = allowedImageLUT[nonNanPos[:,1].astype(int)] - 1
 
         # now we stack our encoding scheme together -> this now identifies all entries in pos
         encId = encImageId + image_count*encTracksId
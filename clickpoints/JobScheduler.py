@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# JobScheduler.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+import os
+import sys
+import json
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+
+class BatchJob:
+    """
+    A batch job of an add-on. The frames of the job are split in chunks, the batch function of the add-on processes
+    the images of the chunks in a pool of worker processes and the add-on stores the results chunk by chunk in the order
+    of the frames. The progress is saved in the options of the add-on, so that a job can be resumed.
+    """
+    error = None
+
+    def __init__(self, addon, start, end, skip=1, layer=None, chunk_size=10, processes=0, done=None, verbose=False):
+        self.addon = addon
+        self.range = [int(start), int(end), int(skip)]
+        self.layer = layer
+        self.chunk_size = max(int(chunk_size), 1)
+        self.processes = processes
+        # whether the progress is printed for every chunk
+        self.verbose = verbose
+        # the indices of the chunks that are already stored
+        self.done = set(done or [])
+
+        frames = list(range(self.range[0], self.range[1] + 1, self.range[2]))
+        self.chunks = [frames[i:i + self.chunk_size] for i in range(0, len(frames), self.chunk_size)]
+
+        self.cancelled = False
+        self.finished = threading.Event()
+
+    def getState(self):
+        # the state of the job, as it is stored in the options of the add-on
+        return dict(range=self.range, layer=self.layer, chunk_size=self.chunk_size, done=sorted(self.done))
+
+    def matches(self, state):
+        # whether a stored state belongs to a job with the same frames
+        return state is not None and state.get("range") == self.range and state.get("layer") == self.layer and \
+            state.get("chunk_size") == self.chunk_size
+
+    def save(self):
+        self.addon.setOption("batchJob", json.dumps(self.getState()) if len(self.done) < len(self.chunks) else "")
+
+    def progress(self):
+        """
+        The progress of the job.
+
+        Returns
+        -------
+        done : int
+            the number of stored chunks.
+        total : int
+            the number of chunks of the job.
+        """
+        return len(self.done), len(self.chunks)
+
+    def cancel(self):
+        """
+        Cancel the job. The stored progress is kept, so that the job can be resumed.
+        """
+        self.cancelled = True
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job to finish or to be cancelled.
+
+        Returns
+        -------
+        finished : bool
+            False if the timeout has been exceeded.
+        """
+        return self.finished.wait(timeout)
+
+    def execute(self):
+        try:
+            todo = deque(i for i in range(len(self.chunks)) if i not in self.done)
+            if self.cancelled or len(todo) == 0:
+                return
+            self.addon._change_status.emit(self.addon.cp.STATUS_Running)
+
+            # the workers are spawned, so that they do not inherit the gui, and have to be able to import the add-on
+            module = sys.modules[type(self.addon).__module__]
+            addon_path = os.path.dirname(os.path.dirname(os.path.abspath(module.__file__)))
+            if addon_path not in sys.path:
+                sys.path.append(addon_path)
+            function = type(self.addon).batch_function
+            parameters = self.addon.batchParameters()
+            database_filename = self.addon.db._database_filename
+
+            processes = min(self.processes or os.cpu_count(), len(todo))
+            executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+            try:
+                # keep a few chunks per process queued, the results are stored in the order of the frames
+                pending = deque()
+
+                def submit():
+                    index = todo.popleft()
+                    images = list(self.addon.db.getImages(frame=self.chunks[index], layer=self.layer))
+                    future = executor.submit(function, database_filename, [image.id for image in images], parameters)
+                    pending.append((index, images, future))
+
+                while len(todo) and len(pending) < 2 * processes:
+                    submit()
+                while len(pending):
+                    index, images, future = pending.popleft()
+                    while True:
+                        if self.cancelled:
+                            if self.verbose:
+                                print("Cancelled batch job of %s" % self.addon.addon_name)
+                            return
+                        try:
+                            results = future.result(timeout=0.1)
+                            break
+                        except TimeoutError:
+                            pass
+                    if len(todo):
+                        submit()
+
+                    # only this thread writes the results to the database
+                    self.addon.batchResults(images, results)
+                    self.done.add(index)
+                    self.save()
+                    if self.verbose:
+                        print("%s: %d of %d chunks" % ((self.addon.addon_name,) + self.progress()))
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+        except Exception as err:
+            self.error = err
+            traceback.print_exc()
+        finally:
+            self.finished.set()
+            if not self.addon.is_running():
+                self.addon.run_stopped()
+
+
+class JobScheduler:
+    """
+    Executes the queued batch jobs one after another in a background thread.
+    """
+
+    def __init__(self):
+        self.queue = deque()
+        self.current = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, job):
+        """
+        Add a job to the queue.
+        """
+        with self.lock:
+            self.queue.append(job)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+        return job
+
+    def getJobs(self):
+        """
+        Get the running job and the queued jobs.
+        """
+        with self.lock:
+            return ([self.current] if self.current is not None else []) + list(self.queue)
+
+    def cancel(self, addon=None):
+        """
+        Cancel the running and queued jobs, either all of them or only the ones of the given add-on.
+        """
+        for job in self.getJobs():
+            if addon is None or job.addon is addon:
+                job.cancel()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if len(self.queue) == 0:
+                    self.current = None
+                    self.thread = None
+                    return
+                self.current = self.queue.popleft()
+            self.current.execute()
+
+
+job_scheduler = None
+
+
+def getJobScheduler():
+    """
+    Get the job scheduler of this process.
+    """
+    global job_scheduler
+    if job_scheduler is None:
+        job_scheduler = JobScheduler()
+    return job_scheduler
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# QueryProfiler.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# statements of which the query plan can be explained
+_explainable = ("SELECT", "WITH", "INSERT", "REPLACE", "UPDATE", "DELETE")
+
+# the files of peewee, the profiler and the DataFile, to find the call sites
+_internal_files = None
+
+
+def normalizeSQL(sql):
+    """
+    Replace the literals and the lists of parameters of a statement, so that the same queries with different values
+    are aggregated.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"(?<![\w\"])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", "?", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", sql)
+    sql = re.sub(r"(?:\(\?, \.\.\.\)\s*,\s*)+\(\?, \.\.\.\)", "(?, ...), ...", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _formatFrame(frame):
+    return "%s:%d %s" % (os.path.basename(frame.f_code.co_filename), frame.f_lineno, frame.f_code.co_name)
+
+
+def getCallSite():
+    # the first frame which is not part of peewee or of the profiler, for methods of the DataFile also their caller
+    global _internal_files
+    if _internal_files is None:
+        import peewee
+        _internal_files = (os.path.normcase(peewee.__file__), os.path.normcase(__file__),
+                           os.path.normcase(os.path.join(os.path.dirname(__file__), "DataFile.py")))
+    frame = sys._getframe(2)
+    while frame is not None and os.path.normcase(frame.f_code.co_filename) in _internal_files[:2]:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    call_site = _formatFrame(frame)
+    if os.path.normcase(frame.f_code.co_filename) == _internal_files[2]:
+        caller = frame.f_back
+        while caller is not None and os.path.normcase(caller.f_code.co_filename) in _internal_files:
+            caller = caller.f_back
+        if caller is not None:
+            call_site += " <- " + _formatFrame(caller)
+    return call_site
+
+
+class QueryStatistic:
+    """
+    The aggregated executions of one normalised statement.
+    """
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.slow = 0
+        self.call_sites = Counter()
+        self.example = None
+        self.plan = None
+
+    def toDict(self):
+        return dict(sql=self.sql, count=self.count, total=self.total, mean=self.total / self.count, max=self.max,
+                    slow=self.slow, call_sites=self.call_sites.most_common(), example=self.example, plan=self.plan)
+
+
+class QueryProfiler:
+    """
+    Records the execution time and the call site of every statement of a peewee database and the query plan of the
+    statements which take longer than a threshold. The time is measured until SQLite returns the first row.
+    """
+
+    def __init__(self, db, threshold=0.01):
+        self.db = db
+        self.threshold = threshold
+        self.statistics = {}
+        self.lock = threading.Lock()
+        self.execute_sql = None
+
+    def start(self):
+        if self.execute_sql is not None:
+            return
+        # the method is replaced only on this database instance
+        self.execute_sql = self.db.execute_sql
+        self.db.execute_sql = self.profiledExecuteSQL
+
+    def stop(self):
+        if self.execute_sql is None:
+            return
+        del self.db.execute_sql
+        self.execute_sql = None
+
+    def clear(self):
+        with self.lock:
+            self.statistics = {}
+
+    def profiledExecuteSQL(self, sql, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        cursor = self.execute_sql(sql, params, *args, **kwargs)
+        duration = time.perf_counter() - start
+
+        normalized = normalizeSQL(sql)
+        call_site = getCallSite()
+        explain = False
+        with self.lock:
+            try:
+                statistic = self.statistics[normalized]
+            except KeyError:
+                statistic = self.statistics[normalized] = QueryStatistic(normalized)
+            statistic.count += 1
+            statistic.total += duration
+            statistic.max = max(statistic.max, duration)
+            statistic.call_sites[call_site] += 1
+            if duration >= self.threshold:
+                statistic.slow += 1
+                # the plan is only explained for the first slow execution
+                if statistic.plan is None:
+                    statistic.plan = ""
+                    statistic.example = sql if params is None else "%s -- %s" % (sql, list(params)[:20])
+                    explain = True
+        if explain and sql.lstrip().upper().startswith(_explainable):
+            statistic.plan = self.explain(sql, params)
+        return cursor
+
+    def explain(self, sql, params=None):
+        """
+        Get the query plan of a statement as an indented tree.
+        """
+        try:
+            rows = self.execute_sql("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except Exception as err:
+            return "could not explain the query: %s" % err
+        depths = {0: -1}
+        lines = []
+        for id, parent, _, detail in rows:
+            depths[id] = depths.get(parent, -1) + 1
+            lines.append("  " * depths[id] + detail)
+        return "\n".join(lines)
+
+    def getStatistics(self, sort_by="total"):
+        """
+        The statistics of all recorded statements, sorted in descending order.
+        """
+        with self.lock:
+            statistics = [statistic.toDict() for statistic in self.statistics.values()]
+        return sorted(statistics, key=lambda statistic: statistic[sort_by], reverse=True)
+
+    def report(self, limit=20, sort_by="total"):
+        """
+        The statistics of the statements with the longest total time as text.
+        """
+        statistics = self.getStatistics(sort_by)
+        lines = ["%d statements, %d executions, %.1f ms in total, threshold %.1f ms" % (
+            len(statistics), sum(s["count"] for s in statistics), sum(s["total"] for s in statistics) * 1e3,
+            self.threshold * 1e3)]
+        for statistic in statistics[:limit]:
+            lines.append("")
+            lines.append("%.1f ms total, %d calls, %.2f ms mean, %.2f ms max, %d slow" % (
+                statistic["total"] * 1e3, statistic["count"], statistic["mean"] * 1e3, statistic["max"] * 1e3,
+                statistic["slow"]))
+            lines.append("    " + statistic["sql"])
+            for call_site, count in statistic["call_sites"][:3]:
+                lines.append("    called %dx from %s" % (count, call_site))
+            if statistic["plan"]:
+                if re.search(r"^\s*SCAN (?!.*USING (?:COVERING )?INDEX)", statistic["plan"], re.MULTILINE):
+                    lines.append("    query plan (full table scan):")
+                else:
+                    lines.append("    query plan:")
+                lines.extend("        " + line for line in statistic["plan"].split("\n"))
+        return "\n".join(lines)
@@ -22,6 +22,8 @@
 import importlib.metadata
 from importlib import import_module
 import os
+import sys
+import types
 from typing import Any
 
 os.environ.setdefault("QT_API", "pyside6")
@@ -53,6 +55,18 @@ __all__ = [
 ]
 
 
+class _Package(types.ModuleType):
+    def __setattr__(self, name: str, value: Any) -> None:
+        # importing a submodule sets it as attribute of the package, which would hide the class of the same name
+        if name in _lazy_imports and isinstance(value, types.ModuleType) and \
+                value.__name__ == __name__ + _lazy_imports[name][0]:
+            return
+        types.ModuleType.__setattr__(self, name, value)
+
+
+sys.modules[__name__].__class__ = _Package
+
+
 def __getattr__(name: str) -> Any:
     if name not in _lazy_imports:
         raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -19,7 +19,6 @@
 # You should have received a copy of the GNU General Public License
 # along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
 
-import sys
 import matplotlib.pyplot as plt
 import numpy as np
 from numpy.linalg import eig, inv
@@ -381,7 +380,24 @@ def count(im):
     # plt.show()
 
 
+def detectCells(database_filename, image_ids, parameters=None):
+    """ detect the cells in the given images. This runs in a worker process, which reads its images itself. """
+    # the debug plots of count_old should not open windows in the worker
+    plt.switch_backend("agg")
+    db = clickpoints.DataFile(database_filename)
+    results = []
+    for image_id in image_ids:
+        data = db.getImage(id=image_id).data
+        if len(data.shape) == 3:
+            data = np.mean(data, axis=2)
+        results.append(count_old(data))
+    db.db.close()
+    return results
+
+
 class Addon(clickpoints.Addon):
+    batch_function = detectCells
+
     def __init__(self, *args, **kwargs):
         clickpoints.Addon.__init__(self, *args, **kwargs)
 
@@ -392,25 +408,32 @@ class Addon(clickpoints.Addon):
         else:
             self.marker_type = self.db.getMarkerType("cell_nucleus")
 
-    def run(self, start_frame=0):
-        # get images and mask_types
-        images = self.db.getImages()
-
-        # iterate over all images
+        self.addOption(key="processes", display_name="Processes", default=0, value_type="int",
+                       tooltip="How many processes should detect cells in parallel. Use 0 for the number of cpus.")
+        self.addOption(key="chunkSize", display_name="Chunk Size", default=10, value_type="int",
+                       tooltip="How many images each process handles at once.")
+
+    def batchResults(self, images, points):
+        # replace the markers of the images of the chunk in one transaction
+        data = [dict(image=image.id, x=float(x), y=float(y), type=self.marker_type.id)
+                for image, p1 in zip(images, points) for x, y in p1.reshape(-1, 2)]
+        ids = [image.id for image in images]
+        with self.db.db.atomic():
+            self.db.table_marker.delete().where(self.db.table_marker.image.in_(ids)).execute()
+            if len(data):
+                self.db.saveInsertMany(self.db.table_marker, data)
         for image in images:
-            print(image.filename)
-            data = image.data
-            if len(data.shape) == 3:
-                data = np.mean(image.data, axis=2)
-            p1 = count_old(data)
-
-            self.db.table_marker.delete().where(self.db.table_marker.image == image.id).execute()
-            self.db.setMarkers(image=image.id, x=p1[:, 0], y=p1[:, 1], type=self.marker_type)
             self.cp.reloadMarker(image.sort_index)
 
-            # check if we should terminate
-            if self.cp.hasTerminateSignal():
-                print("Cancelled cell detection")
-                return
-
-        print("done")
+    def run(self, start_frame=0):
+        if self.db.getImages().count() == 0:
+            return
+
+        # detect the cells in all images, the scheduler splits them in chunks for the worker processes
+        job = self.run_batch(0, self.db.getImageCount() - 1, 1, chunk_size=self.getOption("chunkSize"),
+                             processes=self.getOption("processes"), verbose=True)
+        job.wait()
+        if job.cancelled:
+            print("Cancelled cell detection")
+        else:
+            print("done")
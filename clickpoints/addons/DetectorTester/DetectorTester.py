@@ -32,6 +32,9 @@ from PenguTrack import Detectors
 import traceback
 import os
 import sys
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from importlib import import_module, reload
 
 
@@ -86,10 +89,12 @@ def getEvalValuesGT(groundtruth_pos, pos_program, distance_cost_parameter):
         # calculate all distances
         cost = distance.cdist(pos_program, groundtruth_pos, 'sqeuclidean')
 
-        # solve the assignment to optimize the pairing
-        # row_ind, col_ind = linear_sum_assignment(cost)
-        from PenguTrack.Assignment import network_assignment
-        row_ind, col_ind = network_assignment(cost, threshold=distance_cost_parameter**2)
+        # solve the assignment to optimize the pairing, pairs above the threshold get a cost which is higher than the
+        # sum of all valid pairs, so that the assignment first maximizes the number of valid pairs
+        threshold = distance_cost_parameter**2
+        valid = cost < threshold
+        cost_thresholded = np.where(valid, cost, np.sum(cost[valid]) + 1)
+        row_ind, col_ind = linear_sum_assignment(cost_thresholded)
 
         # get the distances for the matches
         distance_cost = cost[row_ind, col_ind]
@@ -130,6 +135,59 @@ def getEvalValuesGT(groundtruth_pos, pos_program, distance_cost_parameter):
     return eval_values, tp_ind, fp_ind, fn_ind
 
 
+def filterInside(positions, rectangles):
+    # rectangles is an array of (x, y, width, height), without rectangles all positions are valid
+    if len(rectangles) == 0:
+        return np.ones(len(positions), dtype="bool")
+    x, y, width, height = np.asarray(rectangles, dtype=float).T[:, :, None]
+    return np.any((x <= positions[:, 0]) & (x + width >= positions[:, 0]) &
+                  (y <= positions[:, 1]) & (y + height >= positions[:, 1]), axis=0)
+
+
+class DetectorEvaluation:
+    """ Evaluates parameter sets of a detector on several frames with cached detector arguments and ground truth """
+
+    def __init__(self, detector, frames, distance_cost_parameter):
+        self.detector = detector
+        # a list of (arguments, groundtruth_pos, rectangles) for each frame
+        self.frames = frames
+        self.distance_cost_parameter = distance_cost_parameter
+
+    def __call__(self, p):
+        self.detector.ParameterList.setOptimisationValues(p)
+        tp = fp = fn = 0
+        for arguments, groundtruth_pos, rectangles in self.frames:
+            detections, mask = self.detector.detect(**arguments)
+            detections = np.array(detections[["PositionX", "PositionY"]])
+
+            if len(detections):
+                detections = detections[filterInside(detections, rectangles)]
+
+            # compare it to the detections
+            eval_values = getEvalValuesGT(groundtruth_pos, detections, self.distance_cost_parameter)[0]
+            tp += eval_values["tp"]
+            fp += eval_values["fp"]
+            fn += eval_values["fn"]
+        return tp, fp, fn
+
+
+# the evaluation of a worker process
+_evaluation = None
+
+
+def initEvaluationWorker(paths, evaluation):
+    global _evaluation
+    # the module of the detector has to be importable, before the evaluation can be unpickled
+    for path in paths:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    _evaluation = pickle.loads(evaluation)
+
+
+def evaluateParameters(p):
+    return _evaluation(p)
+
+
 
 class Addon(clickpoints.Addon):
     auto_apply = False
@@ -186,6 +244,10 @@ class Addon(clickpoints.Addon):
         self.optimization_count = QtShortCuts.QInputNumber(self.layout, "Optimizer iterations", 100, float=False)
         self.optimization_count.setHidden(True)
 
+        self.optimization_processes = QtShortCuts.QInputNumber(self.layout, "Processes", 0, float=False,
+                                                               tooltip="How many parameter sets are evaluated in parallel. Use 0 for the number of cpus.")
+        self.optimization_processes.setHidden(True)
+
         self.button = QtWidgets.QPushButton("apply")
         self.layout_buttons.addWidget(self.button)
         self.button.clicked.connect(self.start_detect_and_show)
@@ -208,6 +270,10 @@ class Addon(clickpoints.Addon):
         self.progressbar = QtWidgets.QProgressBar()
         self.layout.addWidget(self.progressbar)
 
+        # the ground truth positions and regions of each frame
+        self.groundtruth_cache = {}
+        self.detector_path = None
+
     def detectorModuleChanged(self, module):
         for i in range(len(self.detector_classes)+1):
             self.comboBox.removeItem(0)
@@ -218,6 +284,8 @@ class Addon(clickpoints.Addon):
 
     def detectorFileSelected(self):
         filename = self.detector_file.value()
+        # the folder from which the detector module is imported
+        self.detector_path = os.path.dirname(os.path.dirname(os.path.abspath(filename)))
         module = loadModule(filename)
         module = loadModule(filename, module)
         self.detectorModuleChanged(module)
@@ -263,9 +331,38 @@ class Addon(clickpoints.Addon):
             else:
                 self.scheduled_run = True
 
-    def getGroundTruthPositions(self, frame):
+    def getGroundTruth(self, frame):
         self.marker_type_truth = self.input_groundtruth_marktertype.value()
-        return np.array([x for x in self.db.getMarkers(frame=frame, type=self.marker_type_truth).select(self.db.table_marker.x, self.db.table_marker.y).tuples().execute()])
+        key = (frame, self.marker_type_truth.id)
+        # the ground truth is only loaded once for every frame
+        if key not in self.groundtruth_cache:
+            groundtruth_pos = np.array([x for x in self.db.getMarkers(frame=frame, type=self.marker_type_truth).select(self.db.table_marker.x, self.db.table_marker.y).tuples().execute()])
+            rectangles = np.array([x for x in self.db.getRectangles(frame=frame, type=self.marker_type_truth_region).select(self.db.table_rectangle.x, self.db.table_rectangle.y, self.db.table_rectangle.width, self.db.table_rectangle.height).tuples().execute()])
+            self.groundtruth_cache[key] = groundtruth_pos, rectangles
+        return self.groundtruth_cache[key]
+
+    def getGroundTruthPositions(self, frame):
+        return self.getGroundTruth(frame)[0]
+
+    def invalidateGroundTruth(self, entry):
+        # the events are sent for all markers and rectangles, only ground truth markers and regions change the cached
+        # ground truth of their frame
+        keys = [key for key in self.groundtruth_cache if entry.type_id in (key[1], self.marker_type_truth_region.id)]
+        if len(keys) == 0:
+            return
+        frame = entry.image.sort_index
+        for key in keys:
+            if key[0] == frame:
+                del self.groundtruth_cache[key]
+
+    def markerAddEvent(self, entry):
+        self.invalidateGroundTruth(entry)
+
+    def markerRemoveEvent(self, entry):
+        self.invalidateGroundTruth(entry)
+
+    def markerMoveFinishedEvent(self, entry):
+        self.invalidateGroundTruth(entry)
 
     def checkGroundTruth(self, detections, frame):
         # get the ground-truth data
@@ -296,15 +393,6 @@ class Addon(clickpoints.Addon):
         print("start_detect_and_show")
         self.run_threaded(function=self.detect_and_show)
 
-    def filter_inside(self, positions, rectangles):
-        if rectangles.count() == 0:
-            return np.ones(len(positions), dtype="bool")
-        valid = np.zeros(len(positions), dtype="bool")
-        for rect in rectangles:
-            valid += (rect.x <= positions[:, 0]) * (rect.x+rect.width >= positions[:, 0]) * \
-                     (rect.y <= positions[:, 1]) * (rect.y+rect.height >= positions[:, 1])
-        return valid
-
     def prepareDetectionParameters(self, current_frame, current_layer, detect):
         arguments = {}
         for parameter in detect.detection_parameters:
@@ -357,8 +445,8 @@ class Addon(clickpoints.Addon):
 
         # if the detector has returned positions, display them
         if len(positions):
-            rectangles = self.db.getRectangles(frame=frame, type=self.marker_type_truth_region)
-            inside = self.filter_inside(positions, rectangles)
+            rectangles = self.getGroundTruth(frame)[1]
+            inside = filterInside(positions, rectangles)
             positions = positions[inside]
             eval_values, tp, fp, fn = self.checkGroundTruth(positions, frame)
             if len(tp):
@@ -387,49 +475,91 @@ class Addon(clickpoints.Addon):
         self.button2.setHidden(self.display_ranges)
         self.button4.setHidden(not self.display_ranges)
         self.optimization_count.setHidden(not self.display_ranges)
+        self.optimization_processes.setHidden(not self.display_ranges)
         self.detector.ParameterList.displayRanges(self.display_ranges)
 
+    def getOptimisationFrames(self):
+        # all frames with ground truth markers, or the current frame if there are none
+        self.marker_type_truth = self.input_groundtruth_marktertype.value()
+        query = self.db.table_image.select(self.db.table_image.sort_index).join(self.db.table_marker)\
+            .where(self.db.table_marker.type == self.marker_type_truth).distinct().order_by(self.db.table_image.sort_index)
+        frames = [image.sort_index for image in query]
+        if len(frames) == 0:
+            frames = [self.cp.getCurrentFrame()]
+        return frames
+
+    def getOptimisationPool(self, evaluation, processes):
+        # the detector has to be sent to the worker processes without its connection to the gui
+        value_changed_event = getattr(self.detector.ParameterList, "valueChangedEvent", None)
+        self.detector.ParameterList.valueChangedEvent = None
+        try:
+            evaluation = pickle.dumps(evaluation)
+        except Exception as err:
+            print("Detector cannot be sent to other processes, evaluating in this process:", err)
+            return None
+        finally:
+            self.detector.ParameterList.valueChangedEvent = value_changed_event
+
+        # the workers are spawned, so that they do not inherit the gui, and have to be able to import this add-on
+        addon_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if addon_path not in sys.path:
+            sys.path.append(addon_path)
+        paths = [self.detector_path] if self.detector_path is not None else []
+        return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=initEvaluationWorker, initargs=(paths, evaluation))
+
     def do_optimize(self, start=0):
         import skopt
-        # get the current frame
-        frame = self.cp.getCurrentFrame()
         layer = self.cp.window.layer
-        arguments = self.prepareDetectionParameters(frame, layer, self.detector.detect)
 
-        # get the ground-truth data
-        groundtruth_pos = self.getGroundTruthPositions(frame)
+        # the detector arguments and the ground-truth data are only loaded once for every frame
+        frames = self.getOptimisationFrames()
+        print("Optimizing on frames", frames)
+        evaluation = DetectorEvaluation(self.detector, [(self.prepareDetectionParameters(frame, layer, self.detector.detect),) + self.getGroundTruth(frame) for frame in frames],
+                                        self.distance_cost_parameter.value())
 
-        rectangles = self.db.getRectangles(frame=frame, type=self.marker_type_truth_region)
-
-        self.iteration = 0
         self.max_iterations = self.optimization_count.value()
-        #self.progressbar.setRange(0, self.max_iterations)
-
-        def error(p):
-            self.detector.ParameterList.setOptimisationValues(p)
-            detections, mask = self.detector.detect(**arguments)
-            detections = np.array(detections[["PositionX", "PositionY"]])
-
-            if len(detections):
-                inside = self.filter_inside(detections, rectangles)
-                detections = detections[inside]
+        processes = min(self.optimization_processes.value() or os.cpu_count(), self.max_iterations)
+        executor = self.getOptimisationPool(evaluation, processes) if processes > 1 else None
+        if executor is None:
+            processes = 1
 
-            # compare it to the detections
-            eval_values, tp_ind, fp_ind, fn_ind = getEvalValuesGT(groundtruth_pos, detections,
-                                                                  self.distance_cost_parameter.value())
-
-            print("Iteration:", self.iteration, "Parameters:", p, "Precision", eval_values["Precision"])
-            self.iteration += 1
-            #self.progressbar.setValue(self.iteration)
-            print("progress set")
-            return 1-eval_values["Precision"]
+        def error(tp, fp, fn):
+            try:
+                return 1 - tp / (tp + fp)
+            except ZeroDivisionError:
+                return 1
 
         print("ranges", self.detector.ParameterList.getRanges())
-        res = skopt.gp_minimize(error, self.detector.ParameterList.getRanges(), verbose=False, n_calls=self.max_iterations)
+        optimizer = skopt.Optimizer(self.detector.ParameterList.getRanges())
+        res = None
+        try:
+            # evaluate the parameter sets proposed by the optimizer in batches of one set per process
+            self.iteration = 0
+            while self.iteration < self.max_iterations:
+                count = min(processes, self.max_iterations - self.iteration)
+                parameters = optimizer.ask(n_points=count)
+                if executor is None:
+                    results = [evaluation(p) for p in parameters]
+                else:
+                    results = list(executor.map(evaluateParameters, parameters))
+                res = optimizer.tell(parameters, [error(*result) for result in results])
+                self.iteration += count
+                print("Iteration:", self.iteration, "Best Parameters:", res.x, "Precision", 1 - res.fun)
+
+                # check if we should terminate
+                if self.cp.hasTerminateSignal():
+                    print("Cancelled optimization")
+                    break
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        if res is None:
+            return
         print("update values")
         if self.auto_apply:
             self.auto_apply = False
         self.detector.ParameterList.setOptimisationValues(res.x, update_widgets=True)
         print("Result:", "Parameters:", res.x, "Precision", 1-res.fun)
         self.detect_and_show()
-        #print(res)
@@ -19,8 +19,12 @@
 # You should have received a copy of the GNU General Public License
 # along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
 
+import os
 import cv2
 import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from scipy.ndimage.measurements import center_of_mass
 import peewee
 import sys
@@ -32,6 +36,82 @@ def contrastEnhance(image):
     return ((image-image.min()) / (image.max() - image.min())*255).astype(np.uint8)
 
 
+def grayscale(image):
+    # phase correlation needs single channel float images
+    if len(image.shape) == 3:
+        image = np.mean(image[:, :, :3], axis=2)
+    return image.astype(np.float32)
+
+
+def matchShift(image, template, border, match_func, contrast_enhance):
+    border_y, border_x = border
+    # template matching for drift correction
+    if contrast_enhance is True:
+        res = cv2.matchTemplate(contrastEnhance(image), contrastEnhance(template), match_func)
+    else:
+        res = cv2.matchTemplate(image, template, match_func)
+    res += np.amin(res)
+    res = res ** 4.
+
+    # get 2D max
+    shift = np.array(np.unravel_index(res.argmax(), res.shape)).astype("float")
+
+    # get sub pixel accurate center of mass
+    try:
+        # fail if there it is too close to border
+        if not (shift[0] > 2 and shift[1] > 2):
+            raise ValueError
+
+        subres = res[int(shift[0] - 2):int(shift[0] + 3), int(shift[1] - 2):int(shift[1] + 3)]
+        subshift = center_of_mass(subres)
+
+        # calculate coordinates of sub shift
+        shift = shift + (subshift - np.array([2., 2.]))
+
+        # calculate full image coordinates of shift
+        shift = shift - np.array([border_y, border_x])
+
+    except ValueError:
+        # calculate full image coordinates of shift
+        shift = shift - np.array([border_y, border_x])
+    return shift
+
+
+def phaseShift(image, reference, window):
+    # the shift of the whole frame, with the same sign as the template matching
+    (dx, dy), response = cv2.phaseCorrelate(reference, image, window)
+    return np.array([-dy, -dx])
+
+
+def estimateDrift(database_filename, image_ids, reference, parameters):
+    """ calculate the shifts of the given images, relative to the reference or, if the reference is None, relative to
+        the image before. This runs in a worker process, which reads its images itself. """
+    db = clickpoints.DataFile(database_filename)
+    rect_slice = parameters["rect_slice"]
+    template_slice = parameters["template_slice"]
+    window = None
+
+    shifts = []
+    for image_id in image_ids:
+        data = db.getImage(id=image_id).data
+        if parameters["phase_correlation"]:
+            data = grayscale(data)
+            if window is None:
+                window = cv2.createHanningWindow(data.shape[::-1], cv2.CV_32F)
+            if reference is not None:
+                shifts.append(phaseShift(data, reference, window))
+            if not parameters["compare_to_first"]:
+                reference = data
+        else:
+            if reference is not None:
+                shifts.append(matchShift(data[rect_slice], reference, parameters["border"], parameters["match_func"],
+                                         parameters["contrast_enhance"]))
+            if not parameters["compare_to_first"]:
+                reference = data[template_slice]
+    db.db.close()
+    return np.array(shifts).reshape(-1, 2)
+
+
 class Addon(clickpoints.Addon):
     def __init__(self, *args, **kwargs):
         clickpoints.Addon.__init__(self, *args, **kwargs)
@@ -45,6 +125,12 @@ class Addon(clickpoints.Addon):
         self.addOption(key="matchFunction", display_name="Match Function", default=3, value_type="choice", values=self.matchFunctions)
         self.addOption(key="contrastEnhance", display_name="Enhance the contrast of every image", default=False, value_type="bool",
                        tooltip="Weather each image should be contrast enhanced (minimum to maximum mapped to 0 to 255).")
+        self.addOption(key="phaseCorrelation", display_name="Phase Correlation", default=False, value_type="bool",
+                       tooltip="Estimate the drift of the whole image with a phase correlation instead of matching the drift_rect.")
+        self.addOption(key="processes", display_name="Processes", default=0, value_type="int",
+                       tooltip="How many processes should estimate the drift in parallel. Use 0 for the number of cpus.")
+        self.addOption(key="chunkSize", display_name="Chunk Size", default=50, value_type="int",
+                       tooltip="How many images each process handles at once.")
 
         # Check if the marker type is present
         if not self.db.getMarkerType("drift_rect"):
@@ -110,72 +196,83 @@ class Addon(clickpoints.Addon):
     def run(self, start_frame=0):
         # Define parameters
         compare_to_first = self.getOption("compareToFirst")
+        phase_correlation = self.getOption("phaseCorrelation")
         border_x, border_y = self.getOption("borderSize")
 
         # get range
         start_frame, end_frame, skip = self.cp.getFrameRange()
 
         # try to load marker
-        rect = self.db.getRectangles(type="drift_rect", frame=start_frame)
-        print(rect)
-        print("count:", rect.count())
-        if rect.count() < 1:
-            print("ERROR: no rectangle selected.\nPlease mark a rectangle with type 'drift_rect'.")
-            sys.exit(-1)
-        rect = rect[0]
-
-        # Get images and template
-        images = self.db.getImageIterator(start_frame=start_frame, end_frame=end_frame)
-        template = next(images).data[rect.slice((border_y, border_x))]
-
-        # get the match function
-        match_func = getattr(cv2, self.matchFunctions[self.getOption("matchFunction")])
-
-        # start iteration
-        last_shift = np.array([0, 0])
-        for image in images:
-            # template matching for drift correction
-            if self.getOption("contrastEnhance") is True:
-                res = cv2.matchTemplate(contrastEnhance(image.data[rect.slice()]), contrastEnhance(template), match_func)
-            else:
-                res = cv2.matchTemplate(image.data[rect.slice()], template, match_func)
-            res += np.amin(res)
-            res = res ** 4.
-
-            # get 2D max
-            shift = np.array(np.unravel_index(res.argmax(), res.shape)).astype("float")
-
-            # get sub pixel accurate center of mass
-            try:
-                # fail if there it is too close to border
-                if not (shift[0] > 2 and shift[1] > 2):
-                    raise ValueError
-
-                subres = res[int(shift[0] - 2):int(shift[0] + 3), int(shift[1] - 2):int(shift[1] + 3)]
-                subshift = center_of_mass(subres)
-
-                # calculate coordinates of sub shift
-                shift = shift + (subshift - np.array([2., 2.]))
-
-                # calculate full image coordinates of shift
-                shift = shift - np.array([border_y, border_x])
-
-            except ValueError:
-                # calculate full image coordinates of shift
-                shift = shift - np.array([border_y, border_x])
-
-            # get new template if compare_to_first is off
-            if not compare_to_first:
-                template = image.data[rect.slice_y().start - border_y: rect.slice_y().stop + border_y,
-                           rect.slice_x().start - border_x: rect.slice_x().stop + border_x]
-                shift += last_shift.astype("float")
-                last_shift = shift
-
-            # save the offset to the database
-            self.db.setOffset(image=image, x=float(shift[1]), y=float(shift[0]))
-            print("Drift Correction Frame", image.sort_index, shift)
-
-            # Check if ClickPoints wants to terminate us
-            if self.cp.hasTerminateSignal():
-                print("Cancel Stabilization")
-                return
+        rect_slice = template_slice = None
+        if not phase_correlation:
+            rect = self.db.getRectangles(type="drift_rect", frame=start_frame)
+            print(rect)
+            print("count:", rect.count())
+            if rect.count() < 1:
+                print("ERROR: no rectangle selected.\nPlease mark a rectangle with type 'drift_rect'.")
+                sys.exit(-1)
+            rect = rect[0]
+            rect_slice = rect.slice()
+            template_slice = rect.slice((border_y, border_x))
+
+        # Get images
+        images = [image.id for image in self.db.getImageIterator(start_frame=start_frame, end_frame=end_frame)]
+        if len(images) < 2:
+            return
+
+        parameters = dict(compare_to_first=compare_to_first, phase_correlation=phase_correlation,
+                          border=(border_y, border_x), rect_slice=rect_slice, template_slice=template_slice,
+                          match_func=getattr(cv2, self.matchFunctions[self.getOption("matchFunction")]),
+                          contrast_enhance=self.getOption("contrastEnhance"))
+
+        # the reference of the first image, if every image is compared to it
+        reference = None
+        if compare_to_first:
+            reference = self.db.getImage(id=images[0]).data
+            reference = grayscale(reference) if phase_correlation else reference[template_slice]
+
+        # split the frames in chunks, which start with the last image of the previous chunk
+        chunk_size = max(self.getOption("chunkSize"), 1)
+        chunks = [images[i:i + chunk_size + 1] for i in range(0, len(images) - 1, chunk_size)]
+        if compare_to_first:
+            chunks = [chunk[1:] for chunk in chunks]
+
+        # the workers are spawned, so that they do not inherit the gui, and have to be able to import this add-on
+        processes = min(self.getOption("processes") or os.cpu_count(), len(chunks))
+        executor = None
+        if processes > 1:
+            addon_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            if addon_path not in sys.path:
+                sys.path.append(addon_path)
+            executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+            tasks = [executor.submit(estimateDrift, self.db._database_filename, chunk, reference, parameters).result
+                     for chunk in chunks]
+        else:
+            tasks = [partial(estimateDrift, self.db._database_filename, chunk, reference, parameters)
+                     for chunk in chunks]
+
+        # estimate the shifts
+        shifts = [None] * len(chunks)
+        try:
+            for index, task in enumerate(tasks):
+                shifts[index] = task()
+                print("Drift Correction Frames", index * chunk_size + start_frame + 1, "to",
+                      min((index + 1) * chunk_size, len(images) - 1) + start_frame)
+
+                # Check if ClickPoints wants to terminate us
+                if self.cp.hasTerminateSignal():
+                    print("Cancel Stabilization")
+                    break
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        shifts = np.concatenate([shift for shift in shifts if shift is not None])
+
+        # the shifts relative to the previous image add up
+        if not compare_to_first:
+            shifts = np.cumsum(shifts, axis=0)
+
+        # save all offsets to the database at once
+        self.db.saveReplaceMany(self.db.table_offset, [dict(image=image, x=float(shift[1]), y=float(shift[0]))
+                                                       for image, shift in zip(images[1:], shifts)])
+        print("Drift Correction finished", len(shifts), "frames")
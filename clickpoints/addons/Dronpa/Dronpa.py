@@ -47,6 +47,8 @@ class Addon(clickpoints.Addon):
         self.addOption(key="delta_t", display_name="Delta t", default=2, value_type="float")
         self.addOption(key="color_channel", display_name="Color Channel", default=1, value_type="int")
         self.addOption(key="output_folder", display_name="Output Folder", default="output", value_type="string")
+        self.addOption(key="processes", display_name="Processes", default=0, value_type="int",
+                       tooltip="How many processes should load the images in parallel. Use 0 for the number of cpus.")
 
         # create a line type "connect"
         if not self.db.getMarkerType("connect"):
@@ -115,33 +117,25 @@ class Addon(clickpoints.Addon):
         # get times
         for t, im in enumerate(self.db.getImages()):
             self.times.append(t * self.input_delta_t.value())
+        # get the intensities of all cells in one pass over the images
+        cells = list(self.db.getMaskTypes())
+        sums, areas, means, stds = self.db.getMaskIntensities(mask_type=cells, channel=self.input_color.value(),
+                                                              processes=self.getOption("processes"))
         # iterate over cells
         self.cell_intensities = []
         self.cell_names = []
         self.cell_colors = []
         self.cell_indices = []
         self.cell_areas = []
-        for m, cell in enumerate(self.db.getMaskTypes()):
+        for m, cell in enumerate(cells):
             self.cell_names.append(cell.name)
             self.cell_colors.append(cell.color)
             self.cell_indices.append(cell.index)
-            inte_list = []
-            size = 0
-            for t, im in enumerate(self.db.getImages()):
-                mask = (im.mask.data == cell.index)
-                if not np.any(mask):
-                    break
-                im1 = im.data
-                if len(im1.shape) == 3:
-                    if im1.shape[2] == 1:
-                        im1 = im1[:, :, 0]
-                    else:
-                        im1 = im1[:, :, self.input_color.value()]
-                inte_list.append(np.mean(im1[mask]))
-                if t == 0:
-                    size = np.sum(mask)
-            self.cell_intensities.append(inte_list)
-            self.cell_areas.append(size)
+            # the time series ends with the first image where the cell is not present
+            empty = np.where(areas[m] == 0)[0]
+            length = empty[0] if len(empty) else areas.shape[1]
+            self.cell_intensities.append(list(means[m, :length]))
+            self.cell_areas.append(areas[m, 0] if length else 0)
 
         self.link_pairs = []
         for connection in self.db.getLines(type="connect"):
@@ -25,54 +25,26 @@ import os
 import matplotlib.pyplot as plt
 
 
-def stderr(values):
-    return np.std(values) / np.sqrt(len(values))
-
-
-def bootstrap(values):
-    values = values.ravel()
-    count = 10
-    means = np.zeros(count)
-    for i in range(count):
-        indices = np.random.randint(0, len(values), len(values))
-        means[i] = np.mean(values[indices])
-    return np.std(means)
-
-
-def getIntensities(db, delta_t, color_channel, output_folder):
+def getIntensities(db, delta_t, color_channel, output_folder, processes=0):
     inte_list2 = []
     error_list2 = []
-    error_list2B = []
     sizes = []
     times = []
     valid_cells = []
     for t, im in enumerate(db.getImages()):
         times.append(t * delta_t)
-    for m, cell in enumerate(db.getMaskTypes()):
-        inte_list = []
-        error_list = []
+    # get the intensities of all cells in one pass over the images
+    cells = list(db.getMaskTypes())
+    sums, areas, means, stds = db.getMaskIntensities(mask_type=cells, channel=color_channel, processes=processes)
+    for m, cell in enumerate(cells):
         print("---------------------", m)
-        size = 0
-        for t, im in enumerate(db.getImages()):
-            mask = (im.mask.data == cell.index)
-            if not np.any(mask):
-                break
-            im1 = im.data
-            if len(im1.shape) == 3:
-                if im1.shape[2] == 1:
-                    im1 = im1[:, :, 0]
-                else:
-                    im1 = im1[:, :, color_channel]
-            inte_list.append(np.mean(im1[mask]))
-            error_list.append(bootstrap(im1[mask]))
-            error_list2B.append(stderr(im1[mask]))
-            if t == 0:
-                size = np.sum(mask)
-        else:
+        # only cells which are present in every image are valid
+        if np.all(areas[m] > 0):
             valid_cells.append(cell)
-            sizes.append(size)
-            inte_list2.append(np.array(inte_list))
-            error_list2.append(np.array(error_list))
+            sizes.append(areas[m, 0])
+            inte_list2.append(means[m])
+            # the standard error of the mean
+            error_list2.append(stds[m] / np.sqrt(areas[m]))
 
     plt.figure(0, (15, 6))
     plt.clf()
@@ -19,11 +19,81 @@
 # You should have received a copy of the GNU General Public License
 # along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
 
-import xlwt
+import os
+import csv
+import itertools
 import clickpoints
 from clickpoints.includes.QtShortCuts import AddQComboBox, AddQSaveFileChoose
 from qtpy import QtCore, QtGui, QtWidgets
 
+
+class CSVWriter:
+    """ Writes the rows of each sheet directly to a csv file. Multiple sheets are written to "<filename>_<sheet>.csv". """
+
+    def __init__(self, filename, sheet_files=False):
+        self.filename = filename
+        self.sheet_files = sheet_files
+        self.files = []
+
+    def add_sheet(self, name):
+        filename = self.filename
+        if self.sheet_files:
+            base, ext = os.path.splitext(self.filename)
+            filename = "%s_%s%s" % (base, "".join(c if c.isalnum() or c in " -_" else "_" for c in name), ext)
+        file = open(filename, "w", newline="")
+        self.files.append(file)
+        return CSVSheet(file)
+
+    def close(self):
+        for file in self.files:
+            file.close()
+
+
+class CSVSheet:
+    def __init__(self, file):
+        self.writer = csv.writer(file)
+
+    def writerow(self, values):
+        self.writer.writerow(["" if value is None else value for value in values])
+
+
+class XlsxWriter:
+    """ Writes the rows of each sheet to a xlsx file, rows are flushed to disk as soon as the next row is started. """
+
+    def __init__(self, filename):
+        import xlsxwriter
+        self.workbook = xlsxwriter.Workbook(filename, {"constant_memory": True})
+        self.names = set()
+
+    def add_sheet(self, name):
+        # sheet names are limited to 31 characters without []:*?/\
+        name = "".join("_" if c in "[]:*?/\\" else c for c in name)
+        # and have to be unique (ignoring the case), names that are equal after cutting them get a number
+        unique_name = name[:31]
+        index = 1
+        while unique_name.lower() in self.names:
+            index += 1
+            suffix = "_%d" % index
+            unique_name = name[:31 - len(suffix)] + suffix
+        self.names.add(unique_name.lower())
+        return XlsxSheet(self.workbook.add_worksheet(unique_name))
+
+    def close(self):
+        self.workbook.close()
+
+
+class XlsxSheet:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.row = 0
+
+    def writerow(self, values):
+        for column, value in enumerate(values):
+            if value is not None:
+                self.worksheet.write(self.row, column, value)
+        self.row += 1
+
+
 class Addon(clickpoints.Addon):
     def __init__(self, *args, **kwargs):
         clickpoints.Addon.__init__(self, *args, **kwargs)
@@ -32,7 +102,7 @@ class Addon(clickpoints.Addon):
         layout = QtWidgets.QVBoxLayout(self)
 
         # add a file chooser for the output
-        self.line_edit_file = AddQSaveFileChoose(layout, "Path", value=self.db._database_filename.replace('.cdb', '.xls'), file_type="Excel Workbook (*.xls)")
+        self.line_edit_file = AddQSaveFileChoose(layout, "Path", value=self.db._database_filename.replace('.cdb', '.xlsx'), file_type="Excel Workbook (*.xlsx);;CSV File (*.csv)")
         # add a mode selector, which formatting should be used for the output
         self.combo_style = AddQComboBox(layout, "Mode", values=["Marker Count", "Marker Positions", "Track Positions"])
         self.button_run = QtWidgets.QPushButton("Export")
@@ -42,164 +112,131 @@ class Addon(clickpoints.Addon):
     def buttonPressedEvent(self):
         self.show()
 
-    def exportMarkerCount(self, wb):
-        wb_sheet = wb.add_sheet('data')
-
-        # get types and images
-        q_types = self.db.getMarkerTypes()
-        q_images = self.db.getImages()
-
-        # write xls header
-        wb_sheet.write(0, 0, "sort_idx")
-        wb_sheet.write(0, 1, "filename")
-        for idx, type in enumerate(q_types):
-            wb_sheet.write(0, idx + 2, type.name + '_count')
-        header_offset = 1
+    def getTable(self, type):
+        # the table which contains the entries of the marker type
+        if type.mode == self.db.TYPE_Rect:
+            return self.db.table_rectangle
+        if type.mode == self.db.TYPE_Line:
+            return self.db.table_line
+        if type.mode == self.db.TYPE_Ellipse:
+            return self.db.table_ellipse
+        if type.mode == self.db.TYPE_Polygon:
+            return self.db.table_polygon
+        return self.db.table_marker
+
+    def iterImageRows(self, query, params=()):
+        # stream the rows of a query, which starts with image id, sort index and filename, grouped by image
+        cursor = self.db.db.execute_sql(query, params)
+        for (id, sort_index, filename), rows in itertools.groupby(cursor, key=lambda row: row[:3]):
+            yield sort_index, filename, [row[3:] for row in rows]
+
+    def exportMarkerCount(self, writer):
+        sheet = writer.add_sheet('data')
+
+        # get types
+        q_types = list(self.db.getMarkerTypes())
+
+        # write header
+        sheet.writerow(["sort_idx", "filename"] + [type.name + '_count' for type in q_types])
+
+        # count the entries per image and type of all tables in one grouped query
+        tables = set(self.getTable(type)._meta.table_name for type in q_types)
+        entries = " UNION ALL ".join("SELECT image_id, type_id FROM %s" % table for table in sorted(tables))
+        if entries == "":
+            entries = "SELECT NULL AS image_id, NULL AS type_id WHERE 0"
+        query = "SELECT i.id, i.sort_index, i.filename, c.type_id, c.count FROM image i LEFT JOIN " \
+                "(SELECT image_id, type_id, COUNT(*) AS count FROM (%s) GROUP BY image_id, type_id) c " \
+                "ON c.image_id = i.id ORDER BY i.sort_index, i.id" % entries
 
         # write marker counts per image
-        for ridx, image in enumerate(q_images):
-            ridx += header_offset
-            wb_sheet.write(ridx, 0, image.sort_index)
-            wb_sheet.write(ridx, 1, image.filename)
-
-            # extract type information
-            for idx, type in enumerate(q_types):
-                if type.mode == 1:
-                    q_marker = self.db.getRectangles(type=type, image=image)
-                elif type.mode == 2:
-                    q_marker = self.db.getLines(type=type, image=image)
-                else:
-                    q_marker = self.db.getMarkers(type=type, image=image)
-
-                wb_sheet.write(ridx, idx + 2, q_marker.count())
-
-    def exportMarkerPositions(self, wb):
-
-        # get types and images
-        q_types = self.db.getMarkerTypes()
-        q_images = self.db.getImages()
-
-        for type in q_types:
-            wb_sheet = wb.add_sheet(type.name)
-
-            # write xls header
-            wb_sheet.write(0, 0, "sort_idx")
-            wb_sheet.write(0, 1, "filename")
-            header_offset = 1
-            maximum_header_column = -1
-
-            # write marker counts per image
-            for ridx, image in enumerate(q_images):
-                ridx += header_offset
-                wb_sheet.write(ridx, 0, image.sort_index)
-                wb_sheet.write(ridx, 1, image.filename)
-
-                # extract type information for markers
-                try:
-                    marker_query = self.db.getMarkers(image=image, type=type)
-                except ValueError:
-                    # not a marker type
-                    continue
-                for idx, marker in enumerate(marker_query):
-                    wb_sheet.write(ridx, idx*2 + 2, marker.x)
-                    wb_sheet.write(ridx, idx*2 + 3, marker.y)
-
-                    # add headers x, y
-                    if idx > maximum_header_column:
-                        wb_sheet.write(0, idx * 2 + 2, "x")
-                        wb_sheet.write(0, idx * 2 + 3, "y")
-                        maximum_header_column = idx
-
-                # extract type information for lines
-                try:
-                    line_query = self.db.getLines(image=image, type=type)
-                except ValueError:
-                    # type is not a line type
-                    continue
-                for idx, marker in enumerate(line_query):
-                    wb_sheet.write(ridx, idx * 4 + 2, marker.x1)
-                    wb_sheet.write(ridx, idx * 4 + 3, marker.y1)
-                    wb_sheet.write(ridx, idx * 4 + 4, marker.x2)
-                    wb_sheet.write(ridx, idx * 4 + 5, marker.y2)
-
-                    # add headers x1, y1, x2, y2
-                    if idx > maximum_header_column:
-                        wb_sheet.write(0, idx * 4 + 2, "x1")
-                        wb_sheet.write(0, idx * 4 + 3, "y1")
-                        wb_sheet.write(0, idx * 4 + 4, "x2")
-                        wb_sheet.write(0, idx * 4 + 5, "y2")
-                        maximum_header_column = idx
-
-                # extract type information for rectangles
-                for idx, marker in enumerate(self.db.getRectangles(image=image, type=type)):
-                    wb_sheet.write(ridx, idx * 4 + 2, marker.x)
-                    wb_sheet.write(ridx, idx * 4 + 3, marker.y)
-                    wb_sheet.write(ridx, idx * 4 + 4, marker.width)
-                    wb_sheet.write(ridx, idx * 4 + 5, marker.height)
-
-                    # add headers x, y, width, height
-                    if idx > maximum_header_column:
-                        wb_sheet.write(0, idx * 4 + 2, "x")
-                        wb_sheet.write(0, idx * 4 + 3, "y")
-                        wb_sheet.write(0, idx * 4 + 4, "width")
-                        wb_sheet.write(0, idx * 4 + 5, "height")
-                        maximum_header_column = idx
-
-    def exportTrackPositions(self, wb):
-        wb_sheet = wb.add_sheet('data')
-
-        # get types and images
-        q_types = self.db.getMarkerTypes()
-        q_images = self.db.getImages()
-
-        # write xls header
-        wb_sheet.write(0, 0, "sort_idx")
-        wb_sheet.write(0, 1, "filename")
+        for sort_index, filename, counts in self.iterImageRows(query):
+            counts = dict(counts)
+            sheet.writerow([sort_index, filename] + [counts.get(type.id, 0) for type in q_types])
+
+    def exportMarkerPositions(self, writer):
+        # the exported fields for each kind of marker type
+        fields = {self.db.TYPE_Normal: ["x", "y"], self.db.TYPE_Track: ["x", "y"],
+                  self.db.TYPE_Line: ["x1", "y1", "x2", "y2"], self.db.TYPE_Rect: ["x", "y", "width", "height"]}
+
+        for type in self.db.getMarkerTypes():
+            sheet = writer.add_sheet(type.name)
+            table = self.getTable(type)._meta.table_name
+            type_fields = fields.get(type.mode, [])
+
+            # the columns are needed for the maximal number of entries in one image
+            maximum_count = 0
+            if len(type_fields):
+                maximum_count = self.db.db.execute_sql("SELECT MAX(count) FROM (SELECT COUNT(*) AS count FROM %s "
+                                                       "WHERE type_id = ? GROUP BY image_id)" % table,
+                                                       (type.id,)).fetchone()[0] or 0
+
+            # write header
+            sheet.writerow(["sort_idx", "filename"] + type_fields * maximum_count)
+
+            # write the entries of each image
+            if len(type_fields):
+                query = "SELECT i.id, i.sort_index, i.filename, %s FROM image i LEFT JOIN %s t " \
+                        "ON t.image_id = i.id AND t.type_id = ? ORDER BY i.sort_index, i.id, t.id" % \
+                        (", ".join("t." + field for field in type_fields), table)
+                params = (type.id,)
+            else:
+                query = "SELECT i.id, i.sort_index, i.filename, NULL FROM image i ORDER BY i.sort_index, i.id"
+                params = ()
+            for sort_index, filename, entries in self.iterImageRows(query, params):
+                sheet.writerow([sort_index, filename] + [value for entry in entries if entry[0] is not None for value in entry])
+
+    def exportTrackPositions(self, writer):
+        sheet = writer.add_sheet('data')
+
         # get the tracks for each type
-        tracks = []
-        for idx, type in enumerate(q_types):
+        tracks = {}
+        header = ["sort_idx", "filename"]
+        for type in self.db.getMarkerTypes():
             try:
                 track_query = self.db.getTracks(type=type)
             except ValueError:
                 # ignore marker types that are not tracks
                 continue
             for track in track_query:
-                wb_sheet.write(0, len(tracks)*2 + 2, type.name + ' #%d' % track.id)
-                tracks.append(track)
-        header_offset = 1
-
-        # write marker counts per image
-        for ridx, image in enumerate(q_images):
-            ridx += header_offset
-            wb_sheet.write(ridx, 0, image.sort_index)
-            wb_sheet.write(ridx, 1, image.filename)
-
-            # write the marker position for each track
-            for idx, track in enumerate(tracks):
-                marker = self.db.getMarkers(image=image, track=track)
-                if marker.count():
-                    x, y = marker[0].pos()
-                    wb_sheet.write(ridx, idx*2 + 2, x)
-                    wb_sheet.write(ridx, idx*2 + 3, y)
+                tracks[track.id] = len(tracks)
+                header.extend([type.name + ' #%d' % track.id, None])
+        sheet.writerow(header)
+
+        # write the marker position for each track per image
+        query = "SELECT i.id, i.sort_index, i.filename, m.track_id, m.x, m.y FROM image i LEFT JOIN marker m " \
+                "ON m.image_id = i.id AND m.track_id IS NOT NULL ORDER BY i.sort_index, i.id"
+        for sort_index, filename, markers in self.iterImageRows(query):
+            row = [sort_index, filename] + [None] * (len(tracks) * 2)
+            for track_id, x, y in markers:
+                if track_id in tracks:
+                    row[tracks[track_id] * 2 + 2:tracks[track_id] * 2 + 4] = [x, y]
+            sheet.writerow(row)
 
     def run(self, start_frame=0):
-        # prepare write to excel
+        # prepare the writer, depending on the file extension
         wb_name = self.line_edit_file.text()
-        wb = xlwt.Workbook()
-
-        # List Marker Count
-        if self.combo_style.currentIndex() == 0:
-            self.exportMarkerCount(wb)
-        # List Marker Positions
-        if self.combo_style.currentIndex() == 1:
-            self.exportMarkerPositions(wb)
-        # List Track Positions
-        if self.combo_style.currentIndex() == 2:
-            self.exportTrackPositions(wb)
+        base, ext = os.path.splitext(wb_name)
+        if ext.lower() != ".csv" and ext.lower() != ".xlsx":
+            wb_name = base + ".xlsx"
 
         print("Writing to %s" % wb_name)
         try:
-            wb.save(wb_name)
+            if wb_name.lower().endswith(".csv"):
+                writer = CSVWriter(wb_name, sheet_files=self.combo_style.currentIndex() == 1)
+            else:
+                writer = XlsxWriter(wb_name)
+            try:
+                # List Marker Count
+                if self.combo_style.currentIndex() == 0:
+                    self.exportMarkerCount(writer)
+                # List Marker Positions
+                if self.combo_style.currentIndex() == 1:
+                    self.exportMarkerPositions(writer)
+                # List Track Positions
+                if self.combo_style.currentIndex() == 2:
+                    self.exportTrackPositions(writer)
+            finally:
+                writer.close()
         except PermissionError as err:
             QtWidgets.QMessageBox.critical(self, 'Error - ClickPoints',
                                            '%s\n\nMaybe the file is still open in Excel. Please close it and try again.' % err,
@@ -36,9 +36,12 @@ import skimage.segmentation
 import sklearn.cluster
 import skimage.color
 import os, sys
+import hashlib
+import tempfile
 import scipy.ndimage.filters
 import distutils.util
 import scipy as scp
+from collections import OrderedDict
 
 #region import QT-Widget for Gui
 from qtpy import QtCore, QtGui
@@ -61,6 +64,119 @@ icon_path = os.path.join(os.path.dirname(__file__), "icons")
 
 #endregion
 
+#region superpixel cache and label-indexed reductions
+# superpixel segmentations are stored per (image, parameters) so that clicking again on the same frame reuses them
+superpixel_cache_path = os.path.join(tempfile.gettempdir(), "ClickPointsHighlightObjects")
+superpixel_cache_size = 20
+# only the most recently used segmentations are kept in memory
+superpixel_memory_cache_size = 4
+superpixel_cache = OrderedDict()
+
+
+def get_superpixel_labels(image, n_segments, compactness, enforce_connectivity, min_size_factor, verbose=False):
+    """
+    Superpixel segmentation of an image with the slic-algorithm, which is cached per image and parameters
+
+    :param int8 RGB image: input image
+    :param int n_segments: number of superpixels (also look in Docu of slic-algorithm)
+    :param double compactness: compactness used for superpixelization
+    :param Bool enforce_connectivity: Enforces Connectivity of the superpixelization
+    :param double min_size_factor: Minimum size of a superpixel compared to the average size
+    :return: image with the superpixel labels
+    """
+    image = np.ascontiguousarray(image)
+    key = hashlib.sha1(image.tobytes())
+    key.update(repr((image.shape, image.dtype.str, n_segments, compactness, enforce_connectivity, min_size_factor)).encode())
+    key = key.hexdigest()
+
+    # cached by this process
+    if key in superpixel_cache:
+        superpixel_cache.move_to_end(key)
+        return superpixel_cache[key]
+
+    # cached by a previous invocation of the addon
+    filename = os.path.join(superpixel_cache_path, key + ".npz")
+    try:
+        with np.load(filename) as data:
+            labels = data["labels"]
+        os.utime(filename)
+        if verbose:
+            print('Loaded superpixelization from cache')
+    except (IOError, ValueError):
+        labels = skimage.segmentation.slic(image, n_segments=n_segments, compactness=compactness,
+                                           multichannel=True, max_iter=10,
+                                           enforce_connectivity=enforce_connectivity,
+                                           min_size_factor=min_size_factor)  # segmentiert in regions
+        # the labels are stored with 4 bytes per pixel
+        labels = labels.astype(np.int32)
+        try:
+            if not os.path.exists(superpixel_cache_path):
+                os.makedirs(superpixel_cache_path)
+            np.savez_compressed(filename, labels=labels)
+            # only keep the most recently used segmentations
+            files = sorted((os.path.join(superpixel_cache_path, name) for name in os.listdir(superpixel_cache_path)),
+                           key=os.path.getmtime)
+            for old_file in files[:-superpixel_cache_size]:
+                os.remove(old_file)
+        except (IOError, OSError):
+            pass
+
+    superpixel_cache[key] = labels
+    while len(superpixel_cache) > superpixel_memory_cache_size:
+        superpixel_cache.popitem(last=False)
+    return labels
+
+
+def get_label_means(labels, image):
+    """
+    Mean of every color of the image in every superpixel (the same as regionprops(labels, image).mean_intensity)
+
+    :param image labels: superpixel labels, label 0 is ignored
+    :param image image: image with the colors in the last axis
+    :return: array with shape number_of_superpixels x number_of_colors, the row label-1 belongs to the label
+    """
+    labels = labels.ravel()
+    number_of_labels = labels.max() + 1
+    counts = np.bincount(labels, minlength=number_of_labels)[1:].astype(float)
+    values = image.reshape(labels.shape[0], -1)
+    means = np.zeros((number_of_labels - 1, values.shape[1]), float)
+    for color in range(values.shape[1]):
+        means[:, color] = np.bincount(labels, weights=values[:, color], minlength=number_of_labels)[1:]
+    return means / np.maximum(counts, 1)[:, None]
+
+
+def get_label_histograms(labels, image, bins, value_range=(0, 255)):
+    """
+    Normalized histogram of every color of the image in every superpixel (the same as np.histogram(density=True) for
+    every color, concatenated and divided by its sum)
+
+    :param image labels: superpixel labels, label 0 is ignored
+    :param image image: image with the colors in the last axis
+    :param int bins: number of histogram bins per color
+    :return: array with shape number_of_superpixels x (number_of_colors*bins), the row label-1 belongs to the label
+    """
+    labels = labels.ravel()
+    number_of_labels = labels.max() + 1
+    values = image.reshape(labels.shape[0], -1)
+    colors = values.shape[1]
+    edges = np.linspace(value_range[0], value_range[1], bins + 1)
+    histograms = np.zeros((number_of_labels, colors, bins), float)
+    for color in range(colors):
+        value = values[:, color]
+        # the bins are half open, only the last bin includes its right edge
+        index = np.searchsorted(edges, value, side="right") - 1
+        index[value == edges[-1]] = bins - 1
+        valid = (value >= edges[0]) & (value <= edges[-1])
+        histograms[:, color, :] = np.bincount(labels[valid] * bins + index[valid],
+                                              minlength=number_of_labels * bins).reshape(number_of_labels, bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        histograms /= histograms.sum(axis=2, keepdims=True) * np.diff(edges)
+        histograms = histograms.reshape(number_of_labels, colors * bins)
+        histograms /= histograms.sum(axis=1, keepdims=True)
+    return histograms[1:]
+
+#endregion
+
 class image_segmenter():
     def __init__(self, image, coords, mean_pixel_size=200, k_mean_cluster_number=5, compactness=24, iterations=10, enforced_connectivity=True, min_size=0.4,
                  verbose=True, k_means_cluster_mode=1, colorspace=1, ratio_sobel_image=0.3, connect_first=True,
@@ -99,7 +215,7 @@ class image_segmenter():
         self.image=image
         self.superpixel_segmentation_labels=[]
         self.mean_regions_col=[]
-        self.props_col=[]
+        self.means_col=None
         self.regions_for_mask=[]
 
 
@@ -240,10 +356,8 @@ class image_segmenter():
             number_of_superpixels = int(np.shape(self.image)[0] * np.shape(self.image)[1] / mean_pixel_size)
             # im_l_b_grad = self.im_color_space[:,:,0:3]
             # im_l_b_grad[:,:,1] = self.im_color_space[:,:,3]
-            self.superpixel_segmentation_labels = skimage.segmentation.slic(self.image, n_segments=number_of_superpixels, compactness=compactness,
-                                                                            multichannel=True, max_iter=10,
-                                                                            enforce_connectivity=enforced_connectivity,
-                                                                            min_size_factor=min_size)  # segmentiert in regions
+            self.superpixel_segmentation_labels = get_superpixel_labels(self.image, number_of_superpixels, compactness,
+                                                                        enforced_connectivity, min_size, verbose=self.verbose)
             # plt.figure(19)
             # plt.imshow(im_l_b_grad[:,:,0])
             # plt.figure(20)
@@ -263,33 +377,18 @@ class image_segmenter():
             # region k_means_clustering
             self.colors = self.im_color_space.shape[2]
             if k_means_cluster_mode == 1:
-                self.k_mean_clustered_regions = np.zeros((np.shape(self.image)[0], np.shape(self.image)[1]), int)
-
-                #create 3xregionprops(image) for each color of image
-
-                for i in range(self.colors):
-                    self.props_col.append(skimage.measure.regionprops(self.superpixel_segmentation_labels, self.im_color_space[:, :, i]))
+                #create list with shape number_of_superpixels x number_of_colors with mean of every superpixel in every color
+                self.means_col = get_label_means(self.superpixel_segmentation_labels, self.im_color_space)
 
                 if self.verbose:
-                    print('Created regionprops')
-
-                #create list with shape number_of_superpixels x number_of_colors with mean of every superpixel in every color
-                means_col = np.zeros(np.shape(self.props_col), float)
-                for row in range(means_col.shape[0]):
-                    for column in range(means_col.shape[1]):
-                        means_col[row][column] = self.props_col[row][column].mean_intensity
+                    print('Created means of superpixels')
 
                 #actual k-means-clustering
                 kmeans_col = sklearn.cluster.KMeans(k_mean_cluster_number)
-                means_col = means_col.transpose()
-                cluster_labels_col = kmeans_col.fit_predict(means_col)
+                cluster_labels_col = kmeans_col.fit_predict(self.means_col)
 
                 # create labeled image
-                for row in range(np.shape(self.image)[0]):
-                    for column in range(np.shape(self.image)[1]):
-                        self.k_mean_clustered_regions[row, column] = cluster_labels_col[self.superpixel_segmentation_labels[row, column] - 1]  # Regionen nach kmeans-Clustering
-                    if row % 50 == 0 and self.verbose:
-                        print('Creating Clustered Image row=%i Processed Percentage %i' % (row, 100 * row / np.shape(self.image)[0]))
+                self.k_mean_clustered_regions = cluster_labels_col[self.superpixel_segmentation_labels - 1]  # Regionen nach kmeans-Clustering
 
                 if self.verbose:
                     print('clustering done')
@@ -298,28 +397,10 @@ class image_segmenter():
 
             #region histogram_clustering
             if (k_means_cluster_mode == 2):
-                self.k_mean_clustered_regions = np.zeros((np.shape(self.image)[0], np.shape(self.image)[1]), int)
-
                 #region create histograms for each superpixel
-                self.histogramms = []
-                for num_superpixel in range(np.max(self.superpixel_segmentation_labels) + 1):
-                    local_superpixel = self.im_color_space[self.superpixel_segmentation_labels == num_superpixel]
-                    local_hist = np.zeros((self.colors, histogram_bins), float)
-                    for color in range(self.colors):
-                        local_hist[color, :], _ = np.histogram(local_superpixel[:,color],range=(0,255), bins=histogram_bins, density=True)
-                    local_hist = local_hist.reshape(histogram_bins * self.colors)
-                    local_hist /= sum(local_hist)
-                    self.histogramms.append(local_hist)
-                    if num_superpixel % 1000 == 0 & self.verbose:
-                        print('%i histograms of superpixels created. Processed Percentage %i' % (
-                        num_superpixel, 100 * num_superpixel / np.max(self.superpixel_segmentation_labels)))
-                    # if num_superpixel%1000==0:
-                    #     plt.figure(1)
-                    #     plt.plot(range(histogram_bins),local_hist)
-                    #     plt.figure(2)
-                    #     plt.imshow(skimage.segmentation.mark_boundaries(self.image, np.asarray(self.superpixel_segmentation_labels == num_superpixel,dtype=int)))
-                    #     plt.show()
-
+                self.histogramms = get_label_histograms(self.superpixel_segmentation_labels, self.im_color_space, histogram_bins)
+                if self.verbose:
+                    print('%i histograms of superpixels created' % len(self.histogramms))
                 #endregion
 
                 #actual kmeans clustering
@@ -328,14 +409,7 @@ class image_segmenter():
                 #endregion
 
                 #region create image with cluster labels
-                for row in range(np.shape(self.image)[0]):
-                    for column in range(np.shape(self.image)[1]):
-                        self.k_mean_clustered_regions[row, column] = cluster_labels_col[
-                            self.superpixel_segmentation_labels[row, column] - 1]  # Regionen nach kmean-Clustering
-
-                    if row % 50 == 0 & self.verbose:
-                        print('Creating image with cluster labels row=%i Processed Percentage %i' % (
-                        row, 100 * row / np.shape(self.image)[0]))
+                self.k_mean_clustered_regions = cluster_labels_col[self.superpixel_segmentation_labels - 1]  # Regionen nach kmean-Clustering
                 #endregion
 
                 if self.verbose:
@@ -427,19 +501,9 @@ class image_segmenter():
 
     #creates mean of superpixel for each color in lab-space
     def get_mean_regions(self):
-        self.mean_regions_col = np.zeros((np.shape(self.im_color_space)), float)
-        # if self.colors>3:
-        #     colors_for_mean_image=3
-        # elif self.colors==2:
-        #     colors_for_mean_image=1
-        # else:
-        #     colors_for_mean_image=self.colors
-        for color in range(self.colors):
-            for row in range(self.mean_regions_col.shape[0]):
-                for column in range(self.mean_regions_col.shape[1]):
-                    self.mean_regions_col[row, column, color] = self.props_col[color][self.superpixel_segmentation_labels[row, column]-1].mean_intensity
-                if row % 50 == 0 & self.verbose :
-                    print('row=%i color=%i Processed Percentage %i Creating Mean Image' % (row,color,100 * row / np.shape(self.image)[0]))
+        if getattr(self, 'means_col', None) is None:
+            self.means_col = get_label_means(self.superpixel_segmentation_labels, self.im_color_space)
+        self.mean_regions_col = self.means_col[self.superpixel_segmentation_labels - 1]
 
 
     def get_super_pixel_marked_image(self):
@@ -19,6 +19,11 @@
 # You should have received a copy of the GNU General Public License
 # along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
 
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import clickpoints
 from clickpoints.includes.QtShortCuts import AddQComboBox, AddQSaveFileChoose, AddQSpinBox, AddQLineEdit
 from qtpy import QtCore, QtGui, QtWidgets
@@ -28,6 +33,71 @@ from matplotlib import pyplot as plt
 import time
 
 
+def getLineCoordinates(line, height, mirror, offset=(0, 0)):
+    """ the positions where to sample the image, the rows are parallel to the line """
+    x1, y1, x2, y2 = line
+    if mirror:
+        y1, y2 = y2, y1
+    w = x2 - x1
+    h = y2 - y1
+    length = np.sqrt(w ** 2 + h ** 2)
+    w2 = h/length
+    h2 = -w/length
+
+    x1 -= offset[0]
+    y1 -= offset[1]
+
+    j = (np.arange(0, height)-height/2.+0.5)[:, None]
+    i = np.linspace(0, 1, int(np.ceil(length)))[None, :]
+    return x1 + w * i + w2 * j, y1 + h * i + h2 * j
+
+
+def sampleImage(image, x, y):
+    """ bilinear interpolation of the image at the given positions """
+    x0 = np.clip(x.astype(int), 0, image.shape[1] - 1)
+    y0 = np.clip(y.astype(int), 0, image.shape[0] - 1)
+    x1 = np.clip(x0 + 1, 0, image.shape[1] - 1)
+    y1 = np.clip(y0 + 1, 0, image.shape[0] - 1)
+    xp = x - np.floor(x)
+    yp = y - np.floor(y)
+    if len(image.shape) == 3:
+        xp = xp[:, :, None]
+        yp = yp[:, :, None]
+    # every weighted pixel is converted to the image type before summing, like a sum with dtype=image.dtype
+    return np.sum([(image[y0, x0] * ((1 - yp) * (1 - xp))).astype(image.dtype),
+                   (image[y0, x1] * ((1 - yp) * xp)).astype(image.dtype),
+                   (image[y1, x0] * (yp * (1 - xp))).astype(image.dtype),
+                   (image[y1, x1] * (yp * xp)).astype(image.dtype)], axis=0, dtype=image.dtype)
+
+
+def getLineCut(image, line, height, mirror, offset=(0, 0)):
+    x, y = getLineCoordinates(line, height, mirror, offset)
+    cut = sampleImage(image, x, y)
+    if mirror:
+        return cut[:, ::-1]
+    return cut[::-1, :]
+
+
+def cutLines(database, image_ids, lines, height, mirror, start_offset):
+    """ cut all lines out of the given images. In a worker process the database is given as filename and the worker
+        reads the images itself. """
+    db = clickpoints.DataFile(database) if isinstance(database, str) else database
+    cuts = [[] for line in lines]
+    for image_id in image_ids:
+        image = db.getImage(id=image_id)
+        data = image.data
+        if image.offset:
+            offset = (image.offset.x - start_offset[0], image.offset.y - start_offset[1])
+        else:
+            offset = (-start_offset[0], -start_offset[1])
+        # all lines are cut from one decoded image
+        for cut, line in zip(cuts, lines):
+            cut.append(getLineCut(data, line, height, mirror, offset))
+    if db is not database:
+        db.db.close()
+    return [np.concatenate(cut) for cut in cuts]
+
+
 class Addon(clickpoints.Addon):
     signal_update_plot = QtCore.Signal()
     signal_plot_finished = QtCore.Signal()
@@ -36,6 +106,7 @@ class Addon(clickpoints.Addon):
     updating = False
     exporting = False
     exporting_index = 0
+    exported = set()
 
     def __init__(self, *args, **kwargs):
         clickpoints.Addon.__init__(self, *args, **kwargs)
@@ -77,6 +148,12 @@ class Addon(clickpoints.Addon):
         self.input_colormap.setEditable(True)
         self.linkOption("colormap", self.input_colormap)
 
+        # the parallel cutting of the lines
+        self.addOption(key="processes", display_name="Processes", default=0, value_type="int",
+                       tooltip="How many processes should cut the kymographs in parallel. Use 0 for the number of cpus.")
+        self.addOption(key="chunkSize", display_name="Chunk Size", default=100, value_type="int",
+                       tooltip="How many images each process handles at once.")
+
         # the table listing the line objects
         self.tableWidget = QtWidgets.QTableWidget(0, 1, self)
         self.layout.addWidget(self.tableWidget)
@@ -187,44 +264,11 @@ class Addon(clickpoints.Addon):
         return x1 + w * percentage/length, y1 + h * percentage/length
 
     def getLine(self, image, line, height, image_entry=None):
-        x1 = line.x1
-        x2 = line.x2
-        y1 = line.y1
-        y2 = line.y2
-        if self.mirror:
-            y1, y2 = y2, y1
-        w = x2 - x1
-        h = y2 - y1
-        length = np.sqrt(w ** 2 + h ** 2)
-        w2 = h/length
-        h2 = -w/length
-
         if image_entry and image_entry.offset:
-            offx, offy = image_entry.offset.x, image_entry.offset.y
+            offset = (image_entry.offset.x - self.start_offx, image_entry.offset.y - self.start_offy)
         else:
-            offx, offy = 0, 0
-        x1 -= offx - self.start_offx
-        y1 -= offy - self.start_offy
-
-        datas = []
-        for j in np.arange(0, self.h)-self.h/2.+0.5:
-            data = []
-            print (np.ceil(length))
-            for i in np.linspace(0, 1, int(np.ceil(length))):
-                x = x1 + w * i + w2 * j
-                y = y1 + h * i + h2 * j
-                xp = x - np.floor(x)
-                yp = y - np.floor(y)
-                v = np.dot(np.array([[1 - yp, yp]]).T, np.array([[1 - xp, xp]]))
-                if len(image.shape) == 3:
-                    data.append(np.sum(image[int(y):int(y) + 2, int(x):int(x) + 2, :] * v[:, :, None], axis=(0, 1), dtype=image.dtype))
-                else:
-                    data.append(np.sum(image[int(y):int(y) + 2, int(x):int(x) + 2] * v, dtype=image.dtype))
-            datas.append(data)
-
-        if self.mirror:
-            return np.array(datas)[:, ::-1]
-        return np.array(datas)[::-1, :]
+            offset = (-self.start_offx, -self.start_offy)
+        return getLineCut(image, (line.x1, line.y1, line.x2, line.y2), height, self.mirror, offset)
 
     def updatePlot(self):
         if self.selected is None:
@@ -250,15 +294,23 @@ class Addon(clickpoints.Addon):
         else:
             self.n = int(self.input_count.value())
         self.progressbar.setRange(0, self.n-1)
-        data = image_start.data
-        line_cut = self.getLine(data, self.bar, self.h, image_start)
-        self.w = line_cut.shape[1]
 
-        if len(data.shape) == 3:
-            self.current_data = np.zeros((self.h * self.n, self.w, data.shape[2]), dtype=line_cut.dtype)
-        else:
-            self.current_data = np.zeros((self.h * self.n, self.w), dtype=line_cut.dtype)
-        self.current_data[0:self.h, :] = line_cut
+        # when exporting, the other lines starting in the same image are cut from the same frames
+        self.kymograph_bars = [self.bar]
+        if self.exporting:
+            self.kymograph_bars += [bar for bar in self.bars if bar.image_id == self.bar.image_id and
+                                    bar.id != self.bar.id and bar.id not in self.exported]
+
+        # preallocate the kymographs
+        data = image_start.data
+        self.kymographs = []
+        for bar in self.kymograph_bars:
+            line_cut = self.getLine(data, bar, self.h, image_start)
+            kymograph = np.zeros((self.h * self.n,) + line_cut.shape[1:], dtype=line_cut.dtype)
+            kymograph[0:self.h, :] = line_cut
+            self.kymographs.append(kymograph)
+        self.current_data = self.kymographs[0]
+        self.w = self.current_data.shape[1]
 
         extent = (0, self.current_data.shape[1]*self.input_scale1.value(), self.current_data.shape[0]*self.input_scale2.value(), 0)
         if self.input_colormap.currentText() != "None":
@@ -293,48 +345,86 @@ class Addon(clickpoints.Addon):
         self.progressbar.setValue(self.index)
 
     def run(self, start_frame=0):
-        for index, image in enumerate(self.db.getImageIterator(start_frame)):
-            index += 1
-            self.index = index
-            line_cut = self.getLine(image.data, self.bar, self.h, image)
-            self.current_data[index*self.h:(index+1)*self.h, :] = line_cut
-            self.signal_update_plot.emit()
-            if index >= self.n - 1 or self.cp.stop:
-                self.signal_plot_finished.emit()
-                break
+        # the images after the first image of the kymograph
+        image_table = self.db.table_image
+        images = [image.id for image in image_table.select(image_table.id).where(
+            (image_table.sort_index >= start_frame) & (image_table.sort_index < start_frame + self.n - 1) &
+            (image_table.layer == self.bar.image.layer_id)).order_by(image_table.sort_index)]
+        lines = [(bar.x1, bar.y1, bar.x2, bar.y2) for bar in self.kymograph_bars]
+
+        # split the images in chunks
+        chunk_size = max(self.getOption("chunkSize"), 1)
+        chunks = [images[i:i + chunk_size] for i in range(0, len(images), chunk_size)]
+
+        # the workers are spawned, so that they do not inherit the gui, and have to be able to import this add-on
+        processes = min(self.getOption("processes") or os.cpu_count(), len(chunks))
+        executor = None
+        if processes > 1:
+            addon_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            if addon_path not in sys.path:
+                sys.path.append(addon_path)
+            executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+            tasks = [executor.submit(cutLines, self.db._database_filename, chunk, lines, self.h, self.mirror,
+                                     (self.start_offx, self.start_offy)).result for chunk in chunks]
+        else:
+            tasks = [partial(cutLines, self.db, chunk, lines, self.h, self.mirror, (self.start_offx, self.start_offy))
+                     for chunk in chunks]
+
+        # fill the kymographs chunk by chunk and show the progress
+        try:
+            self.index = 0
+            for task in tasks:
+                cuts = task()
+                for kymograph, cut in zip(self.kymographs, cuts):
+                    kymograph[(self.index + 1) * self.h:(self.index + 1) * self.h + cut.shape[0]] = cut
+                self.index += cuts[0].shape[0] // self.h
+                self.signal_update_plot.emit()
+                if self.cp.stop:
+                    break
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self.signal_plot_finished.emit()
 
     def plotFinishedEvent(self):
         if self.exporting:
-            self.export()
-            self.exporting_index += 1
-            if self.exporting_index < len(self.bars):
+            for bar, kymograph in zip(self.kymograph_bars, self.kymographs):
+                self.exportKymograph(bar, kymograph)
+                self.exported.add(bar.id)
+            remaining = [index for index, bar in enumerate(self.bars) if bar.id not in self.exported]
+            if len(remaining):
+                self.exporting_index = remaining[0]
                 self.cellSelected(self.exporting_index, 0)
             else:
                 self.exporting_index = 0
                 self.exporting = False
 
     def export(self):
+        self.exportKymograph(self.bar, self.current_data)
+
+    def exportKymograph(self, bar, kymograph):
         filename = "kymograph%d.%s"
         # convert to grayscale if it is a color image that should be saved with a colormap
-        if len(self.current_data.shape) == 3 and self.input_colormap.currentText() != "None":
-            data_gray = np.dot(self.current_data[..., :3], [0.299, 0.587, 0.114])
+        if len(kymograph.shape) == 3 and self.input_colormap.currentText() != "None":
+            data_gray = np.dot(kymograph[..., :3], [0.299, 0.587, 0.114])
         # if not just keep it
         else:
-            data_gray = self.current_data
+            data_gray = kymograph
         # save the data as a numpy file
-        np.savez(filename % (self.bar.id, "npz"), data_gray)
+        np.savez(filename % (bar.id, "npz"), data_gray)
         # get the colormap
         cmap = self.input_colormap.currentText()
         if cmap == "None":
             cmap = "gray"
         # save the kymograph as an image
-        plt.imsave(filename % (self.bar.id, "png"), data_gray, cmap=cmap)
+        plt.imsave(filename % (bar.id, "png"), data_gray, cmap=cmap)
         # print a log in the console
-        print("Exported", filename % (self.bar.id, "npz"))
+        print("Exported", filename % (bar.id, "npz"))
 
     def export2(self):
         self.exporting_index = 0
         self.exporting = True
+        self.exported = set()
         self.cellSelected(self.exporting_index, 0)
 
     def markerMoveEvent(self, marker):
@@ -26,6 +26,66 @@ from qtpy import QtCore, QtGui, QtWidgets
 import numpy as np
 from qimage2ndarray import array2qimage
 import json
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TileCache:
+    """ A least recently used cache of the rendered tiles. The tiles are loaded in a background thread, which decodes
+    every frame only once for all tiles that belong to it. """
+
+    def __init__(self, db, tile_size, size=500):
+        self.db = db
+        self.tile_size = tile_size
+        self.size = size
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+        # a single thread loads the images, as the image reader of the database is not thread safe
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+
+    def get(self, index):
+        with self.lock:
+            tile = self.tiles.get(index)
+            if tile is not None:
+                self.tiles.move_to_end(index)
+            return tile
+
+    def put(self, index, tile):
+        with self.lock:
+            self.tiles[index] = tile
+            self.tiles.move_to_end(index)
+            while len(self.tiles) > self.size:
+                self.tiles.popitem(last=False)
+
+    def missing(self, indices):
+        with self.lock:
+            return [index for index in indices if index not in self.tiles]
+
+    def load(self, data, indices):
+        # group the tiles by their frame, to load every frame only once
+        indices = sorted(self.missing(indices), key=lambda index: data[index][0])
+        for frame, group in itertools.groupby(indices, key=lambda index: data[index][0]):
+            image = self.db.getImage(frame)
+            im = image.data if image is not None else None
+            for index in group:
+                x, y = data[index][1], data[index][2]
+                try:
+                    tile = array2qimage(im[int(y-self.tile_size/2):int(y+self.tile_size/2), int(x-self.tile_size/2):int(x+self.tile_size/2)])
+                except (ValueError, TypeError):
+                    tile = QtGui.QImage()
+                self.put(index, tile)
+
+    def request(self, data, indices):
+        # load the tiles in the background thread, returns a future or None if all tiles are already cached
+        if len(self.missing(indices)) == 0:
+            return None
+        return self.executor.submit(self.load, data, indices)
 
 
 class Addon(clickpoints.Addon):
@@ -34,6 +94,8 @@ class Addon(clickpoints.Addon):
     item_fields = 2
     column_count = 3
     tile_size = 84
+    # emitted by the loading thread, when tiles of the current page have been loaded
+    tiles_loaded = QtCore.Signal()
 
     def __init__(self, *args, **kwargs):
         clickpoints.Addon.__init__(self, *args, **kwargs)
@@ -85,6 +147,10 @@ class Addon(clickpoints.Addon):
         # connect the cell clicked event
         self.tableWidget.cellClicked.connect(self.cellSelected)
 
+        # the rendered tiles
+        self.tile_cache = TileCache(self.db, self.tile_size)
+        self.tiles_loaded.connect(self.updateTiles)
+
         # start with an empty table
         self.data = []
         self.setPage(0)
@@ -107,6 +173,7 @@ class Addon(clickpoints.Addon):
         # load the data from the file
         with open(file, "r") as fp:
             self.data = json.loads(fp.read())
+        self.tile_cache.clear()
         # go to the first page
         self.setPage(0)
 
@@ -134,12 +201,15 @@ class Addon(clickpoints.Addon):
             item = QtWidgets.QTableWidgetItem("")
             self.tableWidget.setItem(row, column, item)
 
-        # if we have an array set the image
-        if isinstance(text, np.ndarray):
+        # if we have an image set the image
+        if isinstance(text, (np.ndarray, QtGui.QImage)):
             #item.setIcon(QtGui.QIcon(QtGui.QPixmap(array2qimage(text))))
             # the image is the background if the cell
             try:
-                item.setBackground(QtGui.QBrush(array2qimage(text)))
+                if isinstance(text, np.ndarray):
+                    text = array2qimage(text)
+                if not text.isNull():
+                    item.setBackground(QtGui.QBrush(text))
             except ValueError as err:
                 pass
             # set the cell size to fit the image
@@ -155,7 +225,14 @@ class Addon(clickpoints.Addon):
             if text:
                 self.tableWidget.resizeColumnToContents(column)
 
+    def getPageIndices(self, page):
+        return list(range(max(page, 0) * self.row_count * self.column_count, min((page + 1) * self.row_count * self.column_count, len(self.data))))
+
     def updateTable(self):
+        # load the tiles of the page, which are not cached yet, they are filled in when they are loaded
+        future = self.tile_cache.request(self.data, self.getPageIndices(self.page))
+        if future is not None:
+            future.add_done_callback(self.tilesLoaded)
         # set the row count
         self.tableWidget.setRowCount(self.row_count)
         # fill the rows with the data
@@ -168,22 +245,44 @@ class Addon(clickpoints.Addon):
         for row in range(idx+1, self.row_count * self.column_count):
             self.setTableText(row, 0, "")
             self.setTableText(row, 1, "")
+        # prefetch the next and the previous page in the background
+        self.tile_cache.request(self.data, self.getPageIndices(self.page + 1))
+        self.tile_cache.request(self.data, self.getPageIndices(self.page - 1) if self.page > 0 else [])
 
     def updateRow(self, row, idx):
         # get the data from the list
         data = self.data[idx]
         # set the additional data
         self.setTableText(row, 0, "#%d\nImage: %d\nx: %d\ny: %d" % (idx, data[0], data[1], data[2]))
-        # set the image
-        image = self.db.getImage(data[0])
-        im = image.data
-        im = im[int(data[2]-self.tile_size/2):int(data[2]+self.tile_size/2), int(data[1]-self.tile_size/2):int(data[1]+self.tile_size/2)]
-        self.setTableText(row, 1, im)
+        # set the image, or leave the cell empty until the tile is loaded
+        tile = self.tile_cache.get(idx)
+        self.setTableText(row, 1, tile if tile is not None else "")
+
+    def tilesLoaded(self, future):
+        # called in the loading thread, the signal passes it on to the gui thread
+        try:
+            self.tiles_loaded.emit()
+        except RuntimeError:
+            # the add-on has already been deleted
+            pass
+
+    def updateTiles(self):
+        # fill in the loaded tiles of the current page
+        page_start = self.page * self.row_count * self.column_count
+        for idx in self.getPageIndices(self.page):
+            tile = self.tile_cache.get(idx)
+            if tile is not None:
+                self.setTableText(idx - page_start, 1, tile)
 
     def buttonPressedEvent(self):
         # show the addon window when the button in ClickPoints is pressed
         self.show()
 
+    def delete(self):
+        # stop the background loading
+        self.tile_cache.executor.shutdown(wait=False, cancel_futures=True)
+        clickpoints.Addon.delete(self)
+
 
 if __name__ == "__main__":
     import sys, ctypes
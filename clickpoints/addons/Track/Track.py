@@ -19,6 +19,7 @@
 # You should have received a copy of the GNU General Public License
 # along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
 
+import time
 import clickpoints
 import numpy as np
 import cv2
@@ -26,6 +27,9 @@ from qtpy import QtGui, QtCore
 
 
 class Addon(clickpoints.Addon):
+    # the optical flow is cpu bound, run it in a separate process to keep ClickPoints responsive
+    run_in_process = True
+
     def __init__(self, *args, **kwargs):
         clickpoints.Addon.__init__(self, *args, **kwargs)
 
@@ -37,6 +41,11 @@ class Addon(clickpoints.Addon):
                        tooltip="Iteration stops when the search window moves less than epsilon.")
         self.addOption(key="maxLevel", display_name="Maximum Pyramid Level", default=0, value_type="int",
                        tooltip="How many pyramids the Lucas Kanade Algorithm should use.")
+        self.addOption(key="batchSize", display_name="Batch Size", default=100, value_type="int",
+                       tooltip="How many frames are tracked before the markers are written to the database.")
+        self.addOption(key="updateInterval", display_name="View Update Interval", default=0.5, value_type="float",
+                       tooltip="The time in seconds between two updates of the ClickPoints view during tracking.\n"
+                               "Use 0 to show every tracked frame.")
 
         # find a track type
         for type in self.db.getMarkerTypes():
@@ -73,49 +82,79 @@ class Addon(clickpoints.Addon):
         # get points and corresponding tracks
         points = self.db.getMarkers(image=image_last, processed=0)
         p0 = np.array([[point.x, point.y] for point in points if point.track_id]).astype(np.float32)
-        tracks = np.array([point.track for point in points if point.track_id])
-        types = np.array([point.type for point in points if point.track_id])
+        tracks = np.array([point.track_id for point in points if point.track_id])
+        types = np.array([point.type_id for point in points if point.track_id])
 
         # if no tracks are supplied, stop
         if len(tracks) == 0:
             print("Nothing to track")
             return
 
+        # the new marker positions are buffered and written to the database in batches
+        batch_size = max(self.getOption("batchSize"), 1)
+        update_interval = self.getOption("updateInterval")
+        buffer = []
+        buffered_frames = 0
+
+        def addMarkers(image, p, tracks, types, processed):
+            for (x, y), track, type in zip(p, tracks, types):
+                buffer.append(dict(image=image.id, x=float(x), y=float(y), processed=processed, track=int(track),
+                                   type=int(type) if type is not None else None))
+
+        def writeMarkers():
+            if len(buffer):
+                self.db.saveReplaceMany(self.db.table_marker, buffer)
+                buffer.clear()
+
+        last_update = time.time()
+
         # start iterating over all images
         image_last_data8 = image_last.data8
-        for image in images:
-            print("Tracking frame number %d, %d tracks" % (image.sort_index, len(tracks)), image.id, image_last.id)
-            image_data8 = image.data8
-
-            # calculate next positions
-            p1, st, err = cv2.calcOpticalFlowPyrLK(image_last_data8, image_data8, p0, None, **lk_params)
-
-            # filter valid tracks (i.e. not out of bounds of the image)
-            valid = (p1[:, 0] > 0)*(p1[:, 0] < image_data8.shape[1])*(p1[:, 1] > 0)*(p1[:, 1] < image_data8.shape[0])
-
-            # set the new positions
-            self.db.setMarkers(image=image, x=p1[:, 0], y=p1[:, 1], processed=0, track=list(tracks), type=list(types))
-
-            # mark the marker in the last frame as processed
-            self.db.setMarkers(image=image_last, x=p0[:, 0], y=p0[:, 1], processed=1, track=list(tracks),
-                               type=list(types))
-
-            # update ClickPoints
-            self.cp.jumpToFrameWait(image.sort_index)
-
-            # store positions and image
-            p0 = p1[valid]
-            tracks = tracks[valid]
-            types = types[valid]
-            image_last = image
-            image_last_data8 = image_data8
-
-            # stop if there are no valid tracks
-            if len(p0) == 0:
-                print("No tracks left")
-                return
-
-            # check if we should terminate
-            if self.cp.hasTerminateSignal():
-                print("Cancelled Tracking")
-                return
+        try:
+            for image in images:
+                image_data8 = image.data8
+
+                # calculate next positions
+                p1, st, err = cv2.calcOpticalFlowPyrLK(image_last_data8, image_data8, p0, None, **lk_params)
+
+                # filter valid tracks (i.e. not out of bounds of the image)
+                valid = (p1[:, 0] > 0)*(p1[:, 0] < image_data8.shape[1])*(p1[:, 1] > 0)*(p1[:, 1] < image_data8.shape[0])
+
+                # mark the marker in the last frame as processed and store the lost markers
+                addMarkers(image_last, p0, tracks, types, 1)
+                addMarkers(image, p1[~valid], tracks[~valid], types[~valid], 0)
+                buffered_frames += 1
+
+                # store positions and image
+                p0 = p1[valid]
+                tracks = tracks[valid]
+                types = types[valid]
+                image_last = image
+                image_last_data8 = image_data8
+
+                # update ClickPoints only from time to time, as this waits for the gui
+                if time.time() - last_update >= update_interval:
+                    print("Tracking frame number %d, %d tracks" % (image.sort_index, len(tracks)))
+                    addMarkers(image_last, p0, tracks, types, 0)
+                    writeMarkers()
+                    buffered_frames = 0
+                    self.cp.jumpToFrameWait(image.sort_index)
+                    last_update = time.time()
+                elif buffered_frames >= batch_size:
+                    writeMarkers()
+                    buffered_frames = 0
+
+                # stop if there are no valid tracks
+                if len(p0) == 0:
+                    print("No tracks left")
+                    return
+
+                # check if we should terminate
+                if self.cp.hasTerminateSignal():
+                    print("Cancelled Tracking")
+                    return
+        finally:
+            # the markers of the last tracked frame are not processed yet
+            addMarkers(image_last, p0, tracks, types, 0)
+            writeMarkers()
+            self.cp.jumpToFrameWait(image_last.sort_index)
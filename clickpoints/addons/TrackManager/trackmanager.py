@@ -72,28 +72,28 @@ class Addon(clickpoints.Addon):
         # add filter for min count
         minCount = self.spinBox_minLength.value()
         if minCount > 0:
-            query_filters.append("count(marker.track_id) > ?")
+            query_filters.append("count > ?")
             query_parameters.append(minCount)
         # add filter for max count
         maxCount = self.spinBox_maxLength.value()
         if maxCount > -1:
-            query_filters.append("count(marker.track_id) < ?")
+            query_filters.append("count < ?")
             query_parameters.append(maxCount)
         # add filter for min displacement
         minDisplacement = self.spinBox_minDisplacement.value()
         if minDisplacement > 0:
-            query_filters.append("((min(marker.x)-max(marker.x))*(min(marker.x)-max(marker.x)))+((min(marker.y)-max(marker.y))*(min(marker.y)-max(marker.y))) > ?")
+            query_filters.append("((max_x-min_x)*(max_x-min_x))+((max_y-min_y)*(max_y-min_y)) > ?")
             query_parameters.append(minDisplacement**2)
         # add filter for max displacement
         maxDisplacement = self.spinBox_maxDisplacement.value()
         if maxDisplacement > -1:
-            query_filters.append(
-                "((min(marker.x)-max(marker.x))*(min(marker.x)-max(marker.x)))+((min(marker.y)-max(marker.y))*(min(marker.y)-max(marker.y))) < ?")
+            query_filters.append("((max_x-min_x)*(max_x-min_x))+((max_y-min_y)*(max_y-min_y)) < ?")
             query_parameters.append(maxDisplacement ** 2)
 
-        # apply filters
+        # apply filters on the statistics table instead of grouping all markers
         if len(query_filters) > 0:
-            self.db.db.execute_sql("UPDATE track SET hidden = (SELECT 1-("+" AND ".join(query_filters)+") FROM marker WHERE track.id = marker.track_id GROUP BY track_id)", query_parameters)
+            self.db.updateTrackStatistics()
+            self.db.db.execute_sql("UPDATE track SET hidden = (SELECT 1-("+" AND ".join(query_filters)+") FROM trackstatistic WHERE track.id = trackstatistic.track_id)", query_parameters)
         # or show all if no filters are active
         else:
             self.db.db.execute_sql("UPDATE track SET hidden = 0")
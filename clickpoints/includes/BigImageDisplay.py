@@ -28,6 +28,7 @@ from qtpy import QtGui, QtCore, QtWidgets
 from clickpoints.includes.Database import DataFileExtended
 from clickpoints.includes.Tools import GraphicsItemEventFilter
 from clickpoints.includes.Tools import array2qimage
+from clickpoints.includes.FrameTrace import frame_trace
 
 
 def BoundBy(value, min, max):
@@ -94,7 +95,12 @@ class MyQGraphicsPixmapItem(QtWidgets.QGraphicsPixmapItem):
     def setImageDirect(self, image: np.ndarray) -> None:
         if image.dtype != self.current_dtype:
             return self.setImageFirstTime(image)
-        self.setPixmap(QtGui.QPixmap(array2qimage(image.astype(np.uint8))))
+        self.setArray(image.astype(np.uint8))
+
+    def setArray(self, image: np.ndarray) -> None:
+        # convert the 8 bit image data to a pixmap
+        with frame_trace.stage("qimage"):
+            self.setPixmap(QtGui.QPixmap(array2qimage(image)))
 
     def getMaxValue(self, image: np.ndarray) -> None:
         if image.dtype.itemsize == 2:
@@ -113,20 +119,24 @@ class MyQGraphicsPixmapItem(QtWidgets.QGraphicsPixmapItem):
             self.getMaxValue(image)
 
         if self.conversion is None:
-            self.setPixmap(QtGui.QPixmap(array2qimage(image.astype(np.uint8))))
+            self.setArray(image.astype(np.uint8))
         else:
-            self.setPixmap(QtGui.QPixmap(array2qimage(self.conversion[image[:, :, :3]])))
+            with frame_trace.stage("lut"):
+                image = self.conversion[image[:, :, :3]]
+            self.setArray(image)
 
     def setImageContrastSpread(self, image: np.ndarray) -> None:
         if self.max_value is None:
             self.getMaxValue(image)
 
-        self.min, self.max = np.percentile(np.asarray(image), self.percentile).astype(int)
-        self.conversion = generateLUT(self.min, self.max, self.gamma, self.max_value)
-        if len(image.shape)>2:
-            self.setPixmap(QtGui.QPixmap(array2qimage(self.conversion[image[:, :, :3]])))
-        else:
-            self.setPixmap(QtGui.QPixmap(array2qimage(self.conversion[image[:, :, None]])))
+        with frame_trace.stage("lut"):
+            self.min, self.max = np.percentile(np.asarray(image), self.percentile).astype(int)
+            self.conversion = generateLUT(self.min, self.max, self.gamma, self.max_value)
+            if len(image.shape)>2:
+                image = self.conversion[image[:, :, :3]]
+            else:
+                image = self.conversion[image[:, :, None]]
+        self.setArray(image)
 
     def setConversion(self, conversion: np.ndarray) -> None:
         self.conversion = conversion
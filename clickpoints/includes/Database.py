@@ -19,6 +19,7 @@
 # You should have received a copy of the GNU General Public License
 # along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
 
+import contextlib
 import itertools
 import math
 import os
@@ -37,6 +38,7 @@ from qtpy import QtGui
 
 from clickpoints.DataFile import DataFile
 from clickpoints.includes.ConfigLoad import dotdict
+from clickpoints.includes.FrameTrace import frame_trace
 
 # remove decompression bomb warning which is now an exception
 PIL.Image.MAX_IMAGE_PIXELS = None
@@ -100,43 +102,6 @@ class PseudoSlide:
         return self.image.__getitem__(item)
 
 
-def max_sql_variables() -> int:
-    """Get the maximum number of arguments allowed in a query by the current
-    sqlite3 implementation. Based on `this question
-    `_
-
-    Returns
-    -------
-    int
-        inferred SQLITE_MAX_VARIABLE_NUMBER
-    """
-    import sqlite3
-    db = sqlite3.connect(':memory:')
-    cur = db.cursor()
-    cur.execute('CREATE TABLE t (test)')
-    low, high = 0, 100000
-    while (high - 1) > low:
-        guess = (high + low) // 2
-        query = 'INSERT INTO t VALUES ' + ','.join(['(?)' for _ in
-                                                    range(guess)])
-        args = [str(i) for i in range(guess)]
-        try:
-            cur.execute(query, args)
-        except sqlite3.OperationalError as e:
-            if "too many SQL variables" in str(e) or "too many terms in compound SELECT" in str(e):
-                high = guess
-            else:
-                raise
-        else:
-            low = guess
-    cur.close()
-    db.close()
-    return low
-
-
-SQLITE_MAX_VARIABLE_NUMBER = max_sql_variables()
-
-
 def SQLMemoryDBFromFile(filename: str, *args, **kwargs):
     db_file = peewee.SqliteDatabase(filename, *args, **kwargs)
 
@@ -199,6 +164,9 @@ def date_linspace(start_date, end_date, frames):
 
 
 class DataFileExtended(DataFile):
+    # the undo journal of the ChangeTracker
+    undo = None
+
     def __init__(self, database_filename: Optional[str] = None, config: Optional[dotdict] = None,
                  storage_path: Optional[str] = None) -> None:
         database_filename = str(database_filename)
@@ -273,9 +241,31 @@ class DataFileExtended(DataFile):
 
         self.signals = DataFileSignals()
 
+        # record the queries, if the profiling is turned on for this project
+        if self.getOption("query_profiling"):
+            self.enableQueryProfiling(self.getOption("query_profiling_threshold") * 1e-3)
+
+    def saveReplaceMany(self, table, data):
+        # bulk operations are not recorded by the undo journal
+        with self.undoSuspended(table):
+            return DataFile.saveReplaceMany(self, table, data)
+
+    def saveInsertMany(self, table, data, fields=None):
+        with self.undoSuspended(table):
+            return DataFile.saveInsertMany(self, table, data, fields)
+
+    def undoSuspended(self, table):
+        if self.undo is None:
+            return contextlib.nullcontext()
+        return self.undo.suspended(table._meta.table_name)
+
     def optionsChanged(self, key: None = None) -> None:
         self.buffer.setBufferCount(self.getOption("buffer_size"), self.getOption("buffer_memory"),
                                    self.getOption("buffer_mode"))
+        if self.getOption("query_profiling"):
+            self.enableQueryProfiling(self.getOption("query_profiling_threshold") * 1e-3)
+        else:
+            self.disableQueryProfiling()
 
     def setChangesMade(self) -> None:
         self.made_changes = True
@@ -429,7 +419,9 @@ class DataFileExtended(DataFile):
         # try to perform the bulk insert
         try:
             # Insert the maximum of allowed rows at a time
-            chunk_size = (SQLITE_MAX_VARIABLE_NUMBER // len(data[0])) - 1
+            if self._SQLITE_MAX_VARIABLE_NUMBER is None:
+                self._SQLITE_MAX_VARIABLE_NUMBER = self.max_sql_variables()
+            chunk_size = (self._SQLITE_MAX_VARIABLE_NUMBER // len(data[0])) - 1
             with self.db.atomic():
                 for idx in range(0, len(data), chunk_size):
                     self.table_image.insert_many(data[idx:idx + chunk_size]).execute()
@@ -523,7 +515,8 @@ class DataFileExtended(DataFile):
         image_data = None
         if self.reader is not None:
             try:
-                image_data = self.reader.get_data(image.frame)
+                with frame_trace.stage("decode"):
+                    image_data = self.reader.get_data(image.frame)
             except ValueError:
                 pass
 
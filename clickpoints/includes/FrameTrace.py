@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# FrameTrace.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class FrameTrace:
+    """
+    Records how long the stages of a frame change take, e.g. the database lookup, decoding, the LUT, the conversion to
+    a QImage and every broadcast handler. For every stage the last durations are kept to compute rolling percentiles.
+    The single events can be saved in the trace event format (e.g. for chrome://tracing).
+    """
+
+    def __init__(self, history: int = 200, max_events: int = 100000) -> None:
+        # the stages are only recorded if the trace is enabled
+        self.enabled = False
+        self.history = history
+        # the last durations of every stage
+        self.durations = {}
+        # the recorded events as (name, thread, start, duration, frame)
+        self.events = deque(maxlen=max_events)
+        self.frame = None
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def setEnabled(self, enabled: bool) -> None:
+        self.enabled = enabled
+
+    def record(self, name: str, start: float, duration: float) -> None:
+        """
+        Add the duration of a stage.
+        """
+        with self.lock:
+            try:
+                self.durations[name].append(duration)
+            except KeyError:
+                self.durations[name] = deque([duration], maxlen=self.history)
+            self.events.append((name, threading.get_ident(), start - self.start, duration, self.frame))
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Record the duration of the enclosed block as the given stage.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter() - start)
+
+    @contextmanager
+    def frameChange(self, frame: int):
+        """
+        Record the enclosed block as the stage "frame" and assign the stages inside it to the frame.
+        """
+        if not self.enabled:
+            yield
+            return
+        self.frame = frame
+        try:
+            with self.stage("frame"):
+                yield
+        finally:
+            self.frame = None
+
+    def getPercentiles(self, percentiles=(50, 90, 99)) -> dict:
+        """
+        The percentiles of the last durations of every stage.
+
+        Returns
+        -------
+        percentiles : dict
+            for every stage the number of durations and the percentiles in seconds.
+        """
+        with self.lock:
+            durations = {name: list(values) for name, values in self.durations.items()}
+        return {name: (len(values),) + tuple(np.percentile(values, percentiles)) for name, values in durations.items()}
+
+    def report(self, max_stages: int = 12) -> str:
+        """
+        The percentiles of the slowest stages as a text table.
+        """
+        percentiles = self.getPercentiles()
+        names = sorted(percentiles, key=lambda name: (name != "frame", -percentiles[name][1]))[:max_stages]
+        lines = ["%-32s %5s %7s %7s %7s" % ("stage [ms]", "n", "p50", "p90", "p99")]
+        for name in names:
+            count, p50, p90, p99 = percentiles[name]
+            lines.append("%-32s %5d %7.1f %7.1f %7.1f" % (name[:32], count, p50 * 1e3, p90 * 1e3, p99 * 1e3))
+        return "\n".join(lines)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.durations = {}
+            self.events.clear()
+
+    def save(self, filename: str) -> None:
+        """
+        Save the recorded events in the trace event format.
+        """
+        with self.lock:
+            events = list(self.events)
+        trace = []
+        for name, thread, start, duration, frame in events:
+            trace.append(dict(name=name, ph="X", pid=os.getpid(), tid=thread, ts=start * 1e6, dur=duration * 1e6,
+                              args=dict(frame=frame)))
+        with open(filename, "w") as fp:
+            json.dump(dict(traceEvents=trace), fp)
+
+
+frame_trace = FrameTrace()
+# the environment variable enables the trace, if it is a .json filename the trace is saved there when ClickPoints closes
+frame_trace_setting = os.environ.get("CLICKPOINTS_TRACE_FRAMES")
+frame_trace_forced = frame_trace_setting not in (None, "", "0", "false", "False")
+frame_trace_file = frame_trace_setting if frame_trace_forced and frame_trace_setting.endswith(".json") else None
+frame_trace.setEnabled(frame_trace_forced)
@@ -22,7 +22,6 @@
 import colorsys
 import os
 
-import matplotlib as mpl
 import numpy as np
 from qtpy import QtCore, QtGui, QtWidgets
 from . import HTMLColorToRGB
@@ -270,6 +269,8 @@ class QInputColor(QInput):
                 self.setValue(self.color)
 
     def _openDialog(self):
+        # matplotlib is only needed to convert the colors of the dialog
+        import matplotlib as mpl
         # get new color from color picker
         color = QtWidgets.QColorDialog.getColor(QtGui.QColor(*tuple(int(x) for x in mpl.colors.to_rgba_array(self.value())[0] * 255)),
                                                 self.parent(), self.label.text() + " choose color")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# StartupTrace.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTrace:
+    """
+    Records a hierarchical timing trace of the ClickPoints startup until the first frame is displayed. It is enabled by
+    the environment variable CLICKPOINTS_PROFILE_STARTUP. If the variable is a filename ending in .json, the trace is
+    additionally saved there in the trace event format (e.g. for chrome://tracing).
+    """
+
+    def __init__(self, setting: str = None) -> None:
+        self.enabled = setting not in (None, "", "0", "false", "False")
+        self.filename = setting if self.enabled and setting.endswith(".json") else None
+        self.start = time.perf_counter()
+        self.last = self.start
+        # the recorded spans as [label, depth, start, duration], marks have no duration
+        self.events = []
+        # the spans which have not ended yet
+        self.open = []
+        self.finished = False
+        # only the main thread is traced
+        self.thread = threading.get_ident()
+
+    def _active(self) -> bool:
+        return self.enabled and not self.finished and threading.get_ident() == self.thread
+
+    def mark(self, label: str) -> None:
+        """
+        Record a point in time and print the time since the last mark.
+        """
+        if not self._active():
+            return
+        now = time.perf_counter()
+        self.events.append([label, len(self.open), now - self.start, None])
+        print("[CLICKPOINTS_PROFILE_STARTUP] "
+              f"{label}: +{now - self.last:.3f}s total={now - self.start:.3f}s", flush=True)
+        self.last = now
+
+    @contextmanager
+    def span(self, label: str):
+        """
+        Record the duration of the enclosed block, spans can be nested.
+        """
+        if not self._active():
+            yield
+            return
+        start = time.perf_counter()
+        event = [label, len(self.open), start - self.start, 0]
+        self.events.append(event)
+        self.open.append(event)
+        try:
+            yield
+        finally:
+            self.open.remove(event)
+            event[3] = time.perf_counter() - start
+
+    def report(self) -> str:
+        """
+        The recorded spans and marks as an indented tree.
+        """
+        lines = []
+        for label, depth, start, duration in self.events:
+            if duration is None:
+                lines.append("%8.3fs %s* %s" % (start, "  " * depth, label))
+            else:
+                lines.append("%8.3fs %s%s: %.3fs" % (start, "  " * depth, label, duration))
+        return "\n".join(lines)
+
+    def save(self, filename: str) -> None:
+        """
+        Save the trace in the trace event format.
+        """
+        events = []
+        for label, depth, start, duration in self.events:
+            event = dict(name=label, pid=os.getpid(), tid=0, ts=start * 1e6)
+            if duration is None:
+                event.update(ph="i", s="g")
+            else:
+                event.update(ph="X", dur=duration * 1e6)
+            events.append(event)
+        with open(filename, "w") as fp:
+            json.dump(dict(traceEvents=events), fp)
+
+    def finish(self, label: str = "first frame displayed") -> None:
+        """
+        End the trace and print the report.
+        """
+        if not self._active():
+            return
+        self.mark(label)
+        self.finished = True
+        # spans which contain the first frame end with it
+        for event in self.open:
+            event[3] = self.last - self.start - event[2]
+        print("[CLICKPOINTS_PROFILE_STARTUP] trace\n" + self.report(), flush=True)
+        if self.filename is not None:
+            self.save(self.filename)
+
+
+startup_trace = StartupTrace(os.environ.get("CLICKPOINTS_PROFILE_STARTUP"))
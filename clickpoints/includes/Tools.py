@@ -27,6 +27,8 @@ import numpy as np
 import qtawesome as qta
 from qtpy import QtGui, QtCore, QtWidgets
 
+from .FrameTrace import frame_trace
+
 
 def array2qimage(a: np.ndarray) -> QtGui.QImage:
     # get the dimensions and color channels
@@ -67,34 +69,53 @@ def rotate_list(l: list, n: list) -> list:
 
 broadcast_modules = []
 
+# the handlers of every event name for every list of modules, the table of a list is built when its modules are
+# registered and the handlers of an event name are looked up once, when the event is first broadcast
+subscriber_tables = {}
+
+
+def GetSubscribers(modules: List[Any], function: str) -> List[Any]:
+    table = subscriber_tables.get(id(modules))
+    # rebuild the table, if modules have been added or removed
+    if table is None or table[0] is not modules or table[1] != len(modules):
+        table = (modules, len(modules), {})
+        subscriber_tables[id(modules)] = table
+    try:
+        return table[2][function]
+    except KeyError:
+        handlers = [getattr(module, function) for module in modules if function in dir(module)]
+        table[2][function] = handlers
+        return handlers
+
 
 def SetBroadCastModules(modules: List[Any]) -> None:
     global broadcast_modules
     broadcast_modules = modules
+    # the modules are registered, so their handlers have to be looked up again
+    subscriber_tables.pop(id(modules), None)
 
 
 def BroadCastEvent(modules: List[Any], function: str, *args, **kwargs) -> None:
-    global broadcast_modules
-    for module in modules:
-        if function in dir(module):
-            getattr(module, function)(*args, **kwargs)
-    args = list(args)
-    args.insert(0, function)
-    for module in modules:
-        if "receiveBroadCastEvent" in dir(module):
-            getattr(module, "receiveBroadCastEvent")(*args, **kwargs)
+    if frame_trace.enabled:
+        return BroadCastEventTraced(modules, function, *args, **kwargs)
+    for handler in GetSubscribers(modules, function):
+        handler(*args, **kwargs)
+    for handler in GetSubscribers(modules, "receiveBroadCastEvent"):
+        handler(function, *args, **kwargs)
+
+
+def BroadCastEventTraced(modules: List[Any], function: str, *args, **kwargs) -> None:
+    # the same as BroadCastEvent, but every handler is recorded in the frame trace
+    for handler in GetSubscribers(modules, function):
+        with frame_trace.stage(function + " " + type(getattr(handler, "__self__", handler)).__name__):
+            handler(*args, **kwargs)
+    for handler in GetSubscribers(modules, "receiveBroadCastEvent"):
+        with frame_trace.stage(function + " " + type(getattr(handler, "__self__", handler)).__name__):
+            handler(function, *args, **kwargs)
 
 
 def BroadCastEvent2(function: str, *args, **kwargs) -> None:
-    global broadcast_modules
-    for module in broadcast_modules:
-        if function in dir(module):
-            getattr(module, function)(*args, **kwargs)
-    args = list(args)
-    args.insert(0, function)
-    for module in broadcast_modules:
-        if "receiveBroadCastEvent" in dir(module):
-            getattr(module, "receiveBroadCastEvent")(*args, **kwargs)
+    BroadCastEvent(broadcast_modules, function, *args, **kwargs)
 
 
 def HiddeableLayout(parent_layout: QtWidgets.QLayout, layout_class: QtWidgets.QLayout) -> QtWidgets.QLayout:
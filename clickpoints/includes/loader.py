@@ -34,9 +34,15 @@ from qtpy import QtWidgets
 from clickpoints import DataFile
 from clickpoints.includes import BroadCastEvent
 from clickpoints.includes import Database
+from clickpoints.includes.StartupTrace import startup_trace
 
 formats = None
 def loadFileFormats(verbose=False):
+    with startup_trace.span("load file formats"):
+        _loadFileFormats(verbose)
+
+
+def _loadFileFormats(verbose=False):
     global natsorted, openslide_loaded, imgformats, vidformats, specialformats, formats
     def do_print(*args, **kwargs):
         if verbose is True:
@@ -48,14 +54,15 @@ def loadFileFormats(verbose=False):
     except (ImportError, ModuleNotFoundError):
         natsorted = sorted
 
-    try:
-        import openslide
-        openslide_loaded = True
-        print("openslide", openslide.__version__)
-    except (ImportError, ModuleNotFoundError):
-        from .slide import myslide
-        openslide_loaded = False
-        print("use custom openslide variant with tifffile")
+    with startup_trace.span("openslide"):
+        try:
+            import openslide
+            openslide_loaded = True
+            print("openslide", openslide.__version__)
+        except (ImportError, ModuleNotFoundError):
+            from .slide import myslide
+            openslide_loaded = False
+            print("use custom openslide variant with tifffile")
 
     # add plugins to imageIO if available
     plugin_searchpath = os.path.join(os.path.split(__file__)[0], '..', r'addons/imageio_plugin')
@@ -73,28 +80,30 @@ def loadFileFormats(verbose=False):
                                                               os.path.sep.join([os.path.abspath(plugin_searchpath), plugin])
                                                               )
                 imageio_plugin = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(imageio_plugin)
+                with startup_trace.span("imageio plugin " + plugin):
+                    spec.loader.exec_module(imageio_plugin)
                 # importlib.import_module(os.path.sep.join([os.path.abspath(plugin_searchpath), plugin]))
                 # print(os.path.abspath(plugin_searchpath))
                 print('Adding %s' % plugin)
 
     # check for ffmpeg
-    try:
-        # check if imageio already has an exe file
-        imageio.plugins.ffmpeg.get_exe()
-        print("ffmpeg found from imageio")
-    except imageio.core.fetching.NeedDownloadError:
-        # try to find an ffmpeg.exe in the ClickPoints folder
-        files = glob.glob(os.path.join(os.path.dirname(__file__), "..", "ffmpeg*.exe"))
-        files.extend(glob.glob(os.path.join(os.path.dirname(__file__), "..", "external", "ffmpeg*.exe")))
-        # if an ffmpeg exe has been found, set the environmental variable accordingly
-        if len(files):
-            print("ffmpeg found", files[0])
-            os.environ['IMAGEIO_FFMPEG_EXE'] = files[0]
-        # if not, try to download it
-        else:
-            print("try to download ffmpeg")
-            imageio.plugins.ffmpeg.download()
+    with startup_trace.span("ffmpeg"):
+        try:
+            # check if imageio already has an exe file
+            imageio.plugins.ffmpeg.get_exe()
+            print("ffmpeg found from imageio")
+        except imageio.core.fetching.NeedDownloadError:
+            # try to find an ffmpeg.exe in the ClickPoints folder
+            files = glob.glob(os.path.join(os.path.dirname(__file__), "..", "ffmpeg*.exe"))
+            files.extend(glob.glob(os.path.join(os.path.dirname(__file__), "..", "external", "ffmpeg*.exe")))
+            # if an ffmpeg exe has been found, set the environmental variable accordingly
+            if len(files):
+                print("ffmpeg found", files[0])
+                os.environ['IMAGEIO_FFMPEG_EXE'] = files[0]
+            # if not, try to download it
+            else:
+                print("try to download ffmpeg")
+                imageio.plugins.ffmpeg.download()
 
 
     imgformats = []
@@ -124,14 +133,16 @@ def reset_database(filename: str = "", window=None) -> None:
 
     config = None
     # open new database
-    data_file = Database.DataFileExtended(filename, config, storage_path=os.environ["CLICKPOINTS_TMP"])
+    with startup_trace.span("open database"):
+        data_file = Database.DataFileExtended(filename, config, storage_path=os.environ["CLICKPOINTS_TMP"])
     # self.data_file.signals.loaded.connect(self.FrameLoaded)
     if window is not None:
         window.data_file = data_file
         # apply image rotation from config
         if data_file.getOption("rotation") != 0:
             window.view.rotate(data_file.getOption("rotation"))
-        BroadCastEvent(window.modules, "updateDataFile", data_file, filename == "")
+        with startup_trace.span("updateDataFile"):
+            BroadCastEvent(window.modules, "updateDataFile", data_file, filename == "")
         window.GetModule("Timeline").ImagesAdded()
     return data_file
 
@@ -283,6 +294,13 @@ def addPath(data_file: DataFile,
             select_file: str = None,
             window: "ClickPointsWindow" = None,
             callback_finished=None):
+    with startup_trace.span("add images"):
+        _addPath(data_file, iterator, layer_entry, select_file, window)
+    if callback_finished is not None:
+        callback_finished(data_file)
+
+
+def _addPath(data_file, iterator, layer_entry, select_file, window):
     paths = {}
     data = []
 
@@ -334,8 +352,6 @@ def addPath(data_file: DataFile,
                 QtWidgets.QApplication.processEvents()
 
         data_file.add_bulk(data)
-    if callback_finished is not None:
-        callback_finished(data_file)
 
 
 def getFrameNumber(file: str, extension: str) -> int:
@@ -19,30 +19,14 @@
 # You should have received a copy of the GNU General Public License
 # along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
 import os
-import time
 
 os.environ.setdefault("QT_API", "pyside6")
 
-_startup_profile_enabled = os.environ.get("CLICKPOINTS_PROFILE_STARTUP") not in (None, "", "0", "false", "False")
-_startup_profile_exit_after_show = os.environ.get("CLICKPOINTS_PROFILE_EXIT_AFTER_SHOW") not in (None, "", "0", "false", "False")
-_startup_profile_start = time.perf_counter()
-_startup_profile_last = _startup_profile_start
-
-
-def _profile_startup(label):
-    global _startup_profile_last
-    if not _startup_profile_enabled:
-        return
-    now = time.perf_counter()
-    print(
-        "[CLICKPOINTS_PROFILE_STARTUP] "
-        f"{label}: +{now - _startup_profile_last:.3f}s total={now - _startup_profile_start:.3f}s",
-        flush=True,
-    )
-    _startup_profile_last = now
+from clickpoints.includes.StartupTrace import startup_trace
 
+_startup_profile_exit_after_show = os.environ.get("CLICKPOINTS_PROFILE_EXIT_AFTER_SHOW") not in (None, "", "0", "false", "False")
 
-_profile_startup("launch module imported")
+startup_trace.mark("launch module imported")
 
 
 def create_clickpoints_application(QtCore, QtWidgets, args):
@@ -69,7 +53,7 @@ def create_clickpoints_application(QtCore, QtWidgets, args):
 
 def main(*args):
     import sys
-    _profile_startup("main entered")
+    startup_trace.mark("main entered")
     if len(args) == 0:
         args = sys.argv
     else:
@@ -109,11 +93,11 @@ def main(*args):
                     imageio.plugins.ffmpeg.download()
             return
 
-    from clickpoints import print_status
-    _profile_startup("imported clickpoints.print_status")
+    with startup_trace.span("import clickpoints.print_status"):
+        from clickpoints import print_status
     # print
     print_status()
-    _profile_startup("printed status")
+    startup_trace.mark("printed status")
 
     """ some magic to prevent PyQt5 from swallowing exceptions """
     # Back up the reference to the exceptionhook
@@ -121,23 +105,23 @@ def main(*args):
     # Set the exception hook to our wrapping function
     sys.excepthook = lambda *args: sys._excepthook(*args)
 
-    from qtpy import QtCore, QtWidgets, QtGui
-    _profile_startup("imported Qt")
+    with startup_trace.span("import Qt"):
+        from qtpy import QtCore, QtWidgets, QtGui
     import sys
     import ctypes
-    from clickpoints.Core import ClickPointsWindow
-    _profile_startup("imported ClickPointsWindow")
-    from clickpoints.includes import LoadConfig
-    _profile_startup("imported LoadConfig")
+    with startup_trace.span("import ClickPointsWindow"):
+        from clickpoints.Core import ClickPointsWindow
+    with startup_trace.span("import LoadConfig"):
+        from clickpoints.includes import LoadConfig
 
 
     from clickpoints import define_paths
 
     define_paths()
-    _profile_startup("defined paths")
+    startup_trace.mark("defined paths")
 
     app = create_clickpoints_application(QtCore, QtWidgets, args)
-    _profile_startup("created QApplication")
+    startup_trace.mark("created QApplication")
 
     # set an application id, so that windows properly stacks them in the task bar
     if sys.platform[:3] == 'win':
@@ -146,12 +130,12 @@ def main(*args):
 
     # load config and exec addon code
     config = LoadConfig(*args)
-    _profile_startup("loaded config")
+    startup_trace.mark("loaded config")
 
     # Initialize and show the ClickPoints window
-    window = ClickPointsWindow(config, app)
+    with startup_trace.span("construct ClickPointsWindow"):
+        window = ClickPointsWindow(config, app)
     app.clickpoints_window = window
-    _profile_startup("constructed ClickPointsWindow")
     if os.environ.get("_PYI_SPLASH_IPC"):
         try:
             import pyi_splash
@@ -159,7 +143,7 @@ def main(*args):
         except ImportError:
             pass
     window.show()
-    _profile_startup("showed ClickPointsWindow")
+    startup_trace.mark("showed ClickPointsWindow")
     for path in app.open_files:
         QtCore.QTimer.singleShot(0, lambda path=path: window.loadUrl(path, reset=True))
     app.open_files.clear()
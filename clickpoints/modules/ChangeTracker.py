@@ -19,7 +19,10 @@
 # You should have received a copy of the GNU General Public License
 # along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
 
+import itertools
 import re
+import threading
+from contextlib import contextmanager
 from typing import List, Tuple, Union
 
 import peewee
@@ -42,10 +45,18 @@ class undo:
 
     next_text = ""
 
-    def __init__(self, db: SqliteDatabase, tables: List[str]) -> None:
+    # the approximate overhead of a log entry in bytes
+    entry_size = 32
+
+    def __init__(self, db: SqliteDatabase, tables: List[str], max_size: int = None) -> None:
         # store the database and the tables
         self.db = db
         self.tables = tables
+        # the maximal size of the undo and redo stack in bytes (None for no limit)
+        self.max_size = max_size
+        # the column names of the tables
+        self.columns = {}
+        self.suspend_count = 0
 
     def activate(self) -> None:
         """
@@ -54,7 +65,8 @@ class undo:
         # already active? do nothing
         if self.active:
             return
-        # create the triggers to log changes
+        # create the triggers to log changes, they only fire for the connection of this thread
+        self.thread = threading.get_ident()
         self._create_triggers()
         # initialize the stacks
         self.undo_stack = []
@@ -102,7 +114,7 @@ class undo:
         if self.frozen < 0:
             return
         # delete the recorded changes during the frozen period
-        self.db.execute_sql("DELETE FROM undolog WHERE seq > ?", (self.frozen,))
+        self._delete_log(self.frozen + 1, self._get_last_index())
         # reset the frozen variable
         self.frozen = -1
 
@@ -123,13 +135,53 @@ class undo:
         if begin == self.first_log:
             self.refresh()
             return
-        # add the interval to the undo stack, together with the optional descriptive text
-        self.undo_stack.append((begin, end, text))
+        # add the interval to the undo stack, together with the optional descriptive text and its size
+        self.undo_stack.append((begin, end, text, self._get_size(begin, end)))
         # delete the redo stack
+        for redo_begin, redo_end, redo_text, redo_size in self.redo_stack:
+            self._delete_log(redo_begin, redo_end)
         self.redo_stack = []
+        # drop the oldest steps if the stacks got too large
+        self._limit()
         # refresh the gui
         self.refresh()
 
+    def clear(self) -> None:
+        """
+        Delete the undo and redo stacks
+        """
+        if not self.active:
+            return
+        self._delete_log(0, self._get_last_index())
+        self.undo_stack = []
+        self.redo_stack = []
+        self.frozen = -1
+        self._start_interval()
+        self.refresh()
+
+    @contextmanager
+    def suspended(self, table: str):
+        """
+        Do not record the changes of a bulk operation on the given table
+
+        Recording bulk operations would be slow and they could not be undone anyway with a bounded journal. As the
+        recorded steps do not fit the database anymore, the undo and redo stacks are deleted afterwards.
+        """
+        # only the connection of the thread that created the triggers records changes
+        if not self.active or table not in self.tables or threading.get_ident() != self.thread:
+            yield
+            return
+        self.suspend_count += 1
+        if self.suspend_count == 1:
+            self.db.execute_sql("UPDATE undostate SET recording = 0")
+        try:
+            yield
+        finally:
+            self.suspend_count -= 1
+            if self.suspend_count == 0:
+                self.db.execute_sql("UPDATE undostate SET recording = 1")
+                self.clear()
+
     def __call__(self, text: str = "") -> "undo":
         self.next_text = text
         return self
@@ -206,56 +258,60 @@ class undo:
         """
         Create change recording triggers for all tables listed
 
-        Create a temporary table in the database named "undolog". Create triggers that fire on any insert, delete, or
-        update of TABLE1, TABLE2, .... When those triggers fire, insert records in undolog that contain SQL text for
-        statements that will undo the insert, delete, or update.
+        Create the temporary tables "undolog" and "undolog_TABLE" in the database. Create triggers that fire on any
+        insert, delete, or update of TABLE1, TABLE2, .... When those triggers fire, they insert the rowid of the changed
+        row in undolog and the old values of the changed columns in undolog_TABLE. These are used to undo the insert,
+        delete, or update.
         """
-        # delete a potential previous undo log table
-        try:
-            self.db.execute_sql('DROP TABLE undolog')
-        except peewee.OperationalError:
-            pass
-        # create a new undo log table
-        self.db.execute_sql('CREATE TEMP TABLE undolog(seq integer primary key, sql text)')
+        # delete potential previous undo log tables
+        self._drop_log_tables()
+        # create the new undo log tables
+        self.db.execute_sql('CREATE TEMP TABLE undolog(seq integer primary key, tbl text, op text, rid integer, '
+                            'size integer)')
+        self.db.execute_sql('CREATE TEMP TABLE undostate(recording integer)')
+        self.db.execute_sql('INSERT INTO undostate VALUES(1)')
 
         # iterate over the tables to track
         for tbl in self.tables:
             # get a list of all columns
-            collist = self.db.execute_sql('pragma table_info({tbl})'.format(tbl=tbl)).fetchall()
+            columns = [column[1] for column in self.db.execute_sql('pragma table_info({tbl})'.format(tbl=tbl))]
+            self.columns[tbl] = columns
+            # the old values of the columns (without type, so that the values keep their type)
+            self.db.execute_sql('CREATE TEMP TABLE undolog_{tbl}(seq integer primary key, changed integer, {cols})'
+                                .format(tbl=tbl, cols=", ".join(columns)))
+
+            # expressions for the changed columns of an update
+            changed = ["old.{name} IS NOT new.{name}".format(name=name) for name in columns]
+            changed_values = ["CASE WHEN {changed} THEN old.{name} END".format(changed=c, name=name)
+                              for c, name in zip(changed, columns)]
+            changed_mask = " | ".join("(({changed}) << {bit})".format(changed=c, bit=bit) for bit, c in enumerate(changed))
 
             # create a trigger for insert commands on the table
-            sql = "CREATE TEMP TRIGGER _{tbl}_it AFTER INSERT ON {tbl} BEGIN\n"
-            sql += "  INSERT INTO undolog VALUES(NULL,"
-            sql += "'DELETE FROM {tbl} WHERE rowid='||new.rowid);\nEND\n"
+            sql = "CREATE TEMP TRIGGER _{tbl}_it AFTER INSERT ON {tbl} WHEN (SELECT recording FROM undostate) BEGIN\n"
+            sql += "  INSERT INTO undolog VALUES(NULL, '{tbl}', 'I', new.rowid, {entry_size});\nEND\n"
             # add the trigger
-            self.db.execute_sql(sql.format(tbl=tbl))
-
-            # create a trigger for update commands on the table
-            sql = "CREATE TEMP TRIGGER _{tbl}_ut AFTER UPDATE ON {tbl} BEGIN\n"
-            sql += "  INSERT INTO undolog VALUES(NULL,"
-            sql += "'UPDATE {tbl} "
-            # add a set with the old values
-            sep = "SET "
-            for x1, name, x2, x3, x4, x5 in collist:
-                sql += "{sep}{name}='||quote(old.{name})||'".format(sep=sep, name=name)
-                sep = ","
-            sql += " WHERE rowid='||old.rowid);\nEND\n"
+            self.db.execute_sql(sql.format(tbl=tbl, entry_size=self.entry_size))
+
+            # create a trigger for update commands on the table, which stores the old values of the changed columns
+            sql = "CREATE TEMP TRIGGER _{tbl}_ut AFTER UPDATE ON {tbl} WHEN (SELECT recording FROM undostate) AND ({any}) BEGIN\n"
+            sql += "  INSERT INTO undolog VALUES(NULL, '{tbl}', 'U', new.rowid, {entry_size} + {size});\n"
+            sql += "  INSERT INTO undolog_{tbl} VALUES(last_insert_rowid(), {mask}, {values});\nEND\n"
             # add the trigger
-            self.db.execute_sql(sql.format(tbl=tbl))
-
-            # create a trigger for delete commands on the table
-            sql = "CREATE TEMP TRIGGER _{tbl}_dt BEFORE DELETE ON {tbl} BEGIN\n"
-            sql += "  INSERT INTO undolog VALUES(NULL,"
-            sql += "'INSERT INTO {tbl}(rowid"
-            # add a set with the old values
-            for x1, name, x2, x3, x4, x5 in collist:
-                sql += "," + name
-            sql += ") VALUES('||old.rowid||'"
-            for x1, name, x2, x3, x4, x5 in collist:
-                sql += ",'||quote(old.{name})||'".format(name=name)
-            sql += ")');\nEND\n"
+            self.db.execute_sql(sql.format(tbl=tbl, any=" OR ".join(changed), entry_size=self.entry_size,
+                                           size=" + ".join("coalesce(length({value}), 0)".format(value=value)
+                                                           for value in changed_values),
+                                           mask=changed_mask, values=", ".join(changed_values)))
+
+            # create a trigger for delete commands on the table, which stores all old values
+            sql = "CREATE TEMP TRIGGER _{tbl}_dt BEFORE DELETE ON {tbl} WHEN (SELECT recording FROM undostate) BEGIN\n"
+            sql += "  INSERT INTO undolog VALUES(NULL, '{tbl}', 'D', old.rowid, {entry_size} + {size});\n"
+            sql += "  INSERT INTO undolog_{tbl} VALUES(last_insert_rowid(), {mask}, {values});\nEND\n"
             # add the trigger
-            self.db.execute_sql(sql.format(tbl=tbl))
+            self.db.execute_sql(sql.format(tbl=tbl, entry_size=self.entry_size,
+                                           size=" + ".join("coalesce(length(old.{name}), 0)".format(name=name)
+                                                           for name in columns),
+                                           mask=(1 << len(columns)) - 1,
+                                           values=", ".join("old.{name}".format(name=name) for name in columns)))
 
     def _drop_triggers(self) -> None:
         """
@@ -271,11 +327,39 @@ class undo:
                 # remove the trigger
                 self.db.execute_sql("DROP TRIGGER {trigger}".format(trigger=trigger))
 
-        # drop the undo log table
-        try:
-            self.db.execute_sql('DROP TABLE undolog')
-        except peewee.OperationalError:
-            pass
+        # drop the undo log tables
+        self._drop_log_tables()
+
+    def _drop_log_tables(self) -> None:
+        for table in ["undolog", "undostate"] + ["undolog_" + tbl for tbl in self.tables]:
+            try:
+                self.db.execute_sql('DROP TABLE {table}'.format(table=table))
+            except peewee.OperationalError:
+                pass
+
+    def _delete_log(self, begin: int, end: int) -> None:
+        # delete the entries of an interval from the undo log
+        self.db.execute_sql("DELETE FROM undolog WHERE seq>=? AND seq<=?", (begin, end))
+        for tbl in self.tables:
+            self.db.execute_sql("DELETE FROM undolog_{tbl} WHERE seq>=? AND seq<=?".format(tbl=tbl), (begin, end))
+
+    def _get_size(self, begin: int, end: int) -> int:
+        # get the approximate memory size of an interval of the undo log
+        return self.db.execute_sql("SELECT coalesce(sum(size),0) FROM undolog WHERE seq>=? AND seq<=?",
+                                   (begin, end)).fetchone()[0]
+
+    def _limit(self) -> None:
+        """
+        Drop the oldest undo steps (and then the farthest redo steps) until the stacks fit in the maximal size
+        """
+        if self.max_size is None:
+            return
+        total = sum(step[3] for step in self.undo_stack + self.redo_stack)
+        while total > self.max_size and (len(self.undo_stack) or len(self.redo_stack)):
+            stack = self.undo_stack if len(self.undo_stack) else self.redo_stack
+            begin, end, text, size = stack.pop(0)
+            self._delete_log(begin, end)
+            total -= size
 
     def _start_interval(self) -> None:
         """
@@ -283,7 +367,41 @@ class undo:
         """
         self.first_log = self._get_last_index() + 1
 
-    def _step(self, stack_source: List[Tuple[int, int, str]], stack_target: List[Tuple[int, int, str]]) -> None:
+    def _get_statements(self, begin: int, end: int) -> List[Tuple[str, tuple]]:
+        """
+        Get the statements with their parameters that revert the changes of an interval, latest change first
+        """
+        entries = self.db.execute_sql("SELECT seq, tbl, op, rid FROM undolog WHERE seq>=? AND seq<=? ORDER BY seq DESC",
+                                      (begin, end)).fetchall()
+        # get the old values of the updated and deleted rows
+        values = {}
+        for tbl in self.tables:
+            cursor = self.db.execute_sql("SELECT * FROM undolog_{tbl} WHERE seq>=? AND seq<=?".format(tbl=tbl),
+                                         (begin, end))
+            values[tbl] = {row[0]: row[1:] for row in cursor}
+
+        statements = []
+        for seq, tbl, op, rid in entries:
+            columns = self.columns[tbl]
+            # an insert is reverted by deleting the row
+            if op == "I":
+                statements.append(("DELETE FROM {tbl} WHERE rowid=?".format(tbl=tbl), (rid,)))
+                continue
+            changed, *old_values = values[tbl][seq]
+            # a delete is reverted by inserting the old row
+            if op == "D":
+                statements.append(("INSERT INTO {tbl}(rowid, {cols}) VALUES(?, {params})"
+                                   .format(tbl=tbl, cols=", ".join(columns), params=", ".join("?" * len(columns))),
+                                   (rid, *old_values)))
+            # an update is reverted by setting the changed columns to their old values
+            else:
+                indices = [i for i in range(len(columns)) if changed & (1 << i)]
+                statements.append(("UPDATE {tbl} SET {sets} WHERE rowid=?"
+                                   .format(tbl=tbl, sets=", ".join(columns[i] + "=?" for i in indices)),
+                                   tuple(old_values[i] for i in indices) + (rid,)))
+        return statements
+
+    def _step(self, stack_source: List[Tuple[int, int, str, int]], stack_target: List[Tuple[int, int, str, int]]) -> None:
         """
         Do a single step of undo or redo
 
@@ -291,22 +409,22 @@ class undo:
         For a redo, stack_source = self.redo_stack and stack_target = self.undo_stack.
         """
         # pop begin and end from the current stack
-        begin, end, text = stack_source.pop(-1)
+        begin, end, text, size = stack_source.pop(-1)
 
         # get the list of sql commands to revert the action
-        sql_list = self.db.execute_sql("SELECT sql FROM undolog WHERE seq>=? AND seq<=? ORDER BY seq DESC",
-                                       (begin, end)).fetchall()
+        statements = self._get_statements(begin, end)
 
         # delete these entries from the undo log
-        self.db.execute_sql("DELETE FROM undolog WHERE seq>=? AND seq<=?", (begin, end))
+        self._delete_log(begin, end)
 
         # find the new first entry
         self.first_log = self._get_last_index() + 1
 
-        # execute all commands to revert the action
+        # execute all commands to revert the action, consecutive commands of the same kind are executed at once
         with self.db.atomic():
-            for sql, in sql_list:
-                self.db.execute_sql(sql)
+            cursor = self.db.cursor()
+            for sql, group in itertools.groupby(statements, key=lambda statement: statement[0]):
+                cursor.executemany(sql, [parameters for sql, parameters in group])
 
         # reload all stuff that depends on the database
         self.reload_all()
@@ -316,9 +434,11 @@ class undo:
         begin = self.first_log
 
         # add them to the other stack
-        stack_target.append((begin, end, text))
+        stack_target.append((begin, end, text, self._get_size(begin, end)))
         # start a new action interval
         self._start_interval()
+        # drop the oldest steps if the stacks got too large
+        self._limit()
         # refresh the gui
         self.refresh()
 
@@ -368,9 +488,17 @@ class ChangeTracker:
         self.data_file = data_file
         self.config = data_file.getOptionAccess()
 
-        self.undo = undo(self.data_file.db, ["mask"])
+        self.undo = undo(self.data_file.db, ["mask"], max_size=self.config.undo_memory * 1024 * 1024)
         self.undo.activate()
         self.undo.refresh = self.updateState
+        # bulk operations of the data file are not recorded
+        self.data_file.undo = self.undo
+
+    def optionsChanged(self, key: str = None) -> None:
+        if self.undo is not None and self.config is not None:
+            self.undo.max_size = self.config.undo_memory * 1024 * 1024
+            self.undo._limit()
+            self.undo.refresh()
 
     def do_undo(self) -> None:
         if self.undo.get_state()[0] is not None:
@@ -29,6 +29,7 @@ from PIL.ExifTags import TAGS
 from qtpy import QtCore, QtGui, QtWidgets
 
 from clickpoints.includes.Database import DataFileExtended
+from clickpoints.includes.FrameTrace import frame_trace, frame_trace_forced
 from clickpoints.includes.Tools import BoxGrabber
 
 try:
@@ -95,6 +96,8 @@ def get_meta(file: str) -> dict:
 class InfoHud(QtWidgets.QGraphicsRectItem):
     data_file = None
     config = None
+    # the text of the info hud string or of the add-on
+    info_text = ""
 
     def __init__(self, parent_hud: QtWidgets.QGraphicsPathItem, window: "ClickPointsWindow") -> None:
         QtWidgets.QGraphicsRectItem.__init__(self, parent_hud)
@@ -121,11 +124,19 @@ class InfoHud(QtWidgets.QGraphicsRectItem):
         BoxGrabber(self)
         self.dragged = False
 
+        # the frame latencies are updated regularly, as they change after the image has been loaded
+        self.latency_timer = QtCore.QTimer()
+        self.latency_timer.setInterval(500)
+        self.latency_timer.timeout.connect(self.showText)
+
         self.closeDataFile()
 
     def closeDataFile(self) -> None:
         self.data_file = None
         self.config = None
+        self.info_text = ""
+        self.latency_timer.stop()
+        frame_trace.setEnabled(frame_trace_forced)
 
         self.setVisible(False)
         self.hidden = True
@@ -133,12 +144,24 @@ class InfoHud(QtWidgets.QGraphicsRectItem):
     def updateDataFile(self, data_file: DataFileExtended, new_database: bool) -> None:
         self.data_file = data_file
         self.config = data_file.getOptionAccess()
+        self.updateFrameLatency()
 
-        if self.config.info_hud_string != "":
+        if self.hasContent():
             self.setVisible(True)
             self.hidden = False
             self.ToggleInterfaceEvent(self.hidden)
 
+    def hasContent(self) -> bool:
+        return self.config.info_hud_string != "" or self.config.frame_latency
+
+    def updateFrameLatency(self) -> None:
+        frame_trace.setEnabled(self.config.frame_latency or frame_trace_forced)
+        if self.config.frame_latency:
+            self.latency_timer.start()
+        else:
+            self.latency_timer.stop()
+            self.showText()
+
     def imageLoadedEvent(self, filename: str = "", frame_number: int = 0) -> None:
         if not self.data_file.getOption("info_hud_string") == "@script" and self.data_file.getOption(
                 "info_hud_string").strip():
@@ -152,17 +175,24 @@ class InfoHud(QtWidgets.QGraphicsRectItem):
             values = dict(exif=get_exif(file), regex=regex, meta=get_meta(file))
             fmt = PartialFormatter()
             text = fmt.format(self.data_file.getOption("info_hud_string"), **values)
-            text = text.replace("\\n", "\n")
-            self.text.setText(text)
-            rect = self.text.boundingRect()
-            rect.setWidth(rect.width() + 10)
-            rect.setHeight(rect.height() + 10)
-            self.setRect(rect)
+            self.info_text = text.replace("\\n", "\n")
+            self.showText()
+
+    def showText(self) -> None:
+        text = self.info_text
+        if self.config is not None and self.config.frame_latency:
+            text = (text + "\n\n" if text else "") + frame_trace.report()
+        self.text.setText(text)
+        rect = self.text.boundingRect()
+        rect.setWidth(rect.width() + 10)
+        rect.setHeight(rect.height() + 10)
+        self.setRect(rect)
 
     def optionsChanged(self, key) -> None:
-        if not self.hidden and self.data_file.getOption("info_hud_string") == "":
+        self.updateFrameLatency()
+        if not self.hidden and not self.hasContent():
             self.ToggleInterfaceEvent()
-        elif self.hidden and self.data_file.getOption("info_hud_string") != "":
+        elif self.hidden and self.hasContent():
             self.ToggleInterfaceEvent()
 
     def ToggleInterfaceEvent(self, hidden: bool = None) -> None:
@@ -171,7 +201,7 @@ class InfoHud(QtWidgets.QGraphicsRectItem):
             self.hidden = not self.hidden
         else:
             self.hidden = hidden
-        if self.config is not None and self.config.info_hud_string == "":
+        if self.config is not None and not self.hasContent():
             self.hidden = True
         self.setVisible(not self.hidden)
         if self.config is not None:
@@ -179,11 +209,8 @@ class InfoHud(QtWidgets.QGraphicsRectItem):
 
     def updateHUD(self, info_string: str) -> None:
         fmt = PartialFormatter()
-        self.text.setText(fmt.format(info_string))
-        rect = self.text.boundingRect()
-        rect.setWidth(rect.width() + 10)
-        rect.setHeight(rect.height() + 10)
-        self.setRect(rect)
+        self.info_text = fmt.format(info_string)
+        self.showText()
 
     @staticmethod
     def file() -> str:
@@ -31,12 +31,13 @@ import qtawesome as qta
 import numpy as np
 from sortedcontainers import SortedDict
 
-from qimage2ndarray import array2qimage, rgb_view
+from qimage2ndarray import array2qimage, rgb_view, alpha_view
 import imageio
 import uuid
 from clickpoints.includes.setCursor import setCursor
 
 import json
+from functools import lru_cache
 from threading import Thread
 
 from clickpoints.includes.QtShortCuts import AddQSpinBox, AddQLineEdit, AddQLabel, AddQComboBox, AddQColorChoose, GetColorByIndex, AddQCheckBox
@@ -219,6 +220,15 @@ def getMarker(image, color, width, shape):
     return marker
 
 
+@lru_cache(maxsize=1024)
+def ReadTrackMarkerStyle(style_text):
+    # the parsed style is shared by all track markers with the same style, it should not be modified
+    style = json.loads(style_text)
+    if "color" in style:
+        style["color"] = QtGui.QColor(*HTMLColorToRGB(style["color"]))
+    return style
+
+
 class TrackMarkerObject:
     save_pos = None
 
@@ -226,9 +236,7 @@ class TrackMarkerObject:
         self.pos = pos
         self.data = data
         if self.data["style"]:
-            self.style = json.loads(self.data["style"])
-            if "color" in self.style:
-                self.style["color"] = QtGui.QColor(*HTMLColorToRGB(self.style["color"]))
+            self.style = ReadTrackMarkerStyle(self.data["style"])
 
     def getStyle(self, name, default):
         if self.data["style"] and name in self.style:
@@ -327,7 +335,8 @@ def ReadTypeDict(string):
     return dictionary
 
 
-def GetColorFromMap(identifier, id):
+@lru_cache(maxsize=None)
+def GetColorMap(identifier):
     import matplotlib.pyplot as plt
 
     match = re.match(r"([^\(]*)\((\d*)\)", identifier)
@@ -336,15 +345,97 @@ def GetColorFromMap(identifier, id):
         result = match.groups()
         identifier = result[0]
         count = int(result[1])
-    cmap = plt.get_cmap(identifier)
+    return plt.get_cmap(identifier), count
+
+
+def GetColorMapIndex(identifier, id):
+    cmap, count = GetColorMap(identifier)
     if id is None:
         id = 0
-    index = int((id * 255 / count) % 256)
+    # id can also be an array of ids, then an array of indices is returned
+    return ((np.asarray(id) * 255 / count) % 256).astype(int)
+
+
+def GetColorFromMap(identifier, id):
+    cmap, count = GetColorMap(identifier)
+    # id can also be an array of ids, then an array of colors is returned
+    index = GetColorMapIndex(identifier, id)
     color = np.array(cmap(index))
-    color = color[:3] * 255
+    color = color[..., :3] * 255
     return color
 
 
+class StyleCache:
+    """ Resolves the styles of display items.
+
+    The style of every marker type is parsed only once and items with the same type and style share the same style
+    dictionary, color and pen. The style text and color of the type are part of the key, so editing a type does not
+    need an explicit invalidation.
+    """
+    line_styles = dict(solid=Qt.SolidLine, dash=Qt.DashLine, dot=Qt.DotLine, dashdot=Qt.DashDotLine,
+                       dashdotdot=Qt.DashDotDotLine)
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.type_styles = {}
+        self.styles = {}
+
+    @staticmethod
+    def parseStyle(entry):
+        try:
+            return json.loads(entry.style)
+        except ValueError:
+            print("WARNING: %d style could not be read: %s" % (entry.id, entry.style))
+            return {}
+
+    def getTypeStyle(self, type):
+        """ the parsed style of a marker type, with the color of the type as default color """
+        key = (type.id, type.style, type.color)
+        if key not in self.type_styles:
+            style = self.parseStyle(type) if type.style else {}
+            # get color from old color field
+            if "color" not in style:
+                style["color"] = type.color
+            self.type_styles[key] = style
+        return key, self.type_styles[key]
+
+    def getStyle(self, data):
+        """ the resolved style dictionary, color and pen for a marker, line, rectangle, ellipse, polygon or track """
+        if data.type:
+            type_key, type_style = self.getTypeStyle(data.type)
+        else:
+            type_key, type_style = None, {}
+        key = (type_key, data.style or None)
+        style = self.styles.get(key)
+        if style is None:
+            style = dict(type_style)
+            if data.style:
+                style.update(self.parseStyle(data))
+            self.styles[key] = style
+
+        # change color text to rgb by interpreting it as html text or a color map (which gives every item an own color)
+        if "resolved" not in style and style["color"][0] != "#":
+            # the colormap has 256 colors, so items are keyed by their color and not by their id
+            key = key + (int(GetColorMapIndex(style["color"], data.id)),)
+            if key not in self.styles:
+                self.styles[key] = dict(style, color=GetColorFromMap(style["color"], data.id))
+            style = self.styles[key]
+        elif "resolved" not in style:
+            style["color"] = HTMLColorToRGB(style["color"])
+
+        # color and pen are created only once per style
+        if "resolved" not in style:
+            color = QtGui.QColor(*style["color"])
+            pen = QtGui.QPen(color)
+            pen.setWidthF(style.get("line-width", 2))
+            pen.setStyle(self.line_styles[style.get("line-style", "solid")])
+            pen.setCosmetic(True)
+            style["resolved"] = (color, pen, QtGui.QBrush(color))
+        return style
+
+
 class DeleteType(QtWidgets.QDialog):
     def __init__(self, type, count, types):
         QtWidgets.QDialog.__init__(self)
@@ -1153,7 +1244,7 @@ class MarkerEditor(QtWidgets.QWidget):
             new_mode = self.typeWidget.mode_values[self.typeWidget.mode.currentIndex()]
             if new_mode != self.data.mode:
                 if not new_type:
-                    count = self.data.markers.count() + self.data.lines.count() + self.data.rectangles.count() + self.data.ellipses.count() + self.data.polygons.count()
+                    count = self.data_file.data_file.getFrameSummaryCount(type=self.data)
                     if count:
                         reply = QtWidgets.QMessageBox.question(self, 'Warning',
                                                                'Changing the mode of this markertype will delete all %d previous markers of this type.\nDo you want to proceed?' % count,
@@ -1388,7 +1479,7 @@ class MarkerEditor(QtWidgets.QWidget):
 
         # currently selected a type -> remove the type
         elif type(data) == self.data_file.table_markertype:
-            count = data.markers.count()+data.lines.count()+data.rectangles.count()+data.ellipses.count()+data.polygons.count()
+            count = self.data_file.data_file.getFrameSummaryCount(type=data)
             # if this type doesn't have markers delete it without asking
             if count == 0:
                 data.delete_instance()
@@ -1733,43 +1824,15 @@ class MyDisplayItem:
         self.setText(self.GetText())
 
     def GetStyle(self):
-        self.style = {}
-        entries = [self.data.type, self.data]
-
-        for entry in entries:
-            if entry and entry.style:
-                style_text = entry.style
-                try:
-                    type_style = json.loads(style_text)
-                except ValueError:
-                    type_style = {}
-                    print("WARNING: %d style could not be read: %s" % (entry.id, style_text))
-                self.style.update(type_style)
-
-        # get color from old color field
-        if "color" not in self.style and self.data.type:
-            self.style["color"] = self.data.type.color
-
-        # change color text to rgb by interpreting it as html text or a color map
-        if self.style["color"][0] != "#":
-            self.style["color"] = GetColorFromMap(self.style["color"], self.data.id)
-        else:
-            self.style["color"] = HTMLColorToRGB(self.style["color"])
-
-        # store color
-        self.color = QtGui.QColor(*self.style["color"])
+        # the style is shared with all items of the same type and style, it should not be modified
+        self.style = self.marker_handler.style_cache.getStyle(self.data)
+        self.color, self.style_pen, self.style_brush = self.style["resolved"]
 
     def ApplyStyle(self):
         if self.text:
-            self.text.setBrush(QtGui.QBrush(self.color))
+            self.text.setBrush(self.style_brush)
         self.setScale(None)
-        line_styles = dict(solid=Qt.SolidLine, dash=Qt.DashLine, dot=Qt.DotLine, dashdot=Qt.DashDotLine,
-                           dashdotdot=Qt.DashDotDotLine)
-        pen = self.pen()
-        pen.setColor(self.color)
-        pen.setWidthF(self.style.get("line-width", 2))
-        pen.setStyle(line_styles[self.style.get("line-style", "solid")])
-        self.setPen(pen)
+        self.setPen(self.style_pen)
         i = 1
         while True:
             grabber = getattr(self, "g%d" % i, None)
@@ -1813,7 +1876,7 @@ class MyDisplayItem:
             self.text.setFont(self.font)
             self.text.setPos(5, 5)
             self.text.setZValue(10)
-            self.text.setBrush(QtGui.QBrush(self.color))
+            self.text.setBrush(self.style_brush)
 
         # augment text
         if '$track_id' in text:
@@ -2103,6 +2166,288 @@ class MyMarkerItem(MyDisplayItem, QtWidgets.QGraphicsPathItem):
         MyDisplayItem.delete(self, just_display)
 
 
+class MarkerBucketGrid:
+    """ Sorts points into the buckets of a regular grid, to find the points in a region without visiting all points """
+
+    def __init__(self, x, y, cell_size=None):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        if len(self.x) == 0:
+            self.x0 = self.y0 = 0
+            self.x1 = self.y1 = 0
+        else:
+            self.x0, self.x1 = np.min(self.x), np.max(self.x)
+            self.y0, self.y1 = np.min(self.y), np.max(self.y)
+        # choose the cell size to have a few points per bucket
+        if cell_size is None:
+            area = max((self.x1 - self.x0) * (self.y1 - self.y0), 1)
+            cell_size = max(np.sqrt(area / max(len(self.x), 1)) * 2, 1)
+        self.cell_size = cell_size
+        self.columns = int((self.x1 - self.x0) // cell_size) + 1
+        self.rows = int((self.y1 - self.y0) // cell_size) + 1
+        # sort the points by their bucket (column major)
+        keys = self.getColumn(self.x) * self.rows + self.getRow(self.y)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def getColumn(self, x):
+        return np.clip(np.floor((np.asarray(x) - self.x0) / self.cell_size), 0, self.columns - 1).astype(np.int64)
+
+    def getRow(self, y):
+        return np.clip(np.floor((np.asarray(y) - self.y0) / self.cell_size), 0, self.rows - 1).astype(np.int64)
+
+    def query(self, x0, y0, x1, y1):
+        """ the indices of all points in the buckets touched by the rectangle (x0, y0)-(x1, y1) """
+        if len(self.x) == 0 or x1 < self.x0 or y1 < self.y0 or x0 > self.x1 or y0 > self.y1:
+            return np.zeros(0, dtype=np.int64)
+        # the rectangle covers all points
+        if x0 <= self.x0 and y0 <= self.y0 and x1 >= self.x1 and y1 >= self.y1:
+            return self.order
+        # every column of the grid is a continuous range of the sorted keys
+        columns = np.arange(self.getColumn(x0), self.getColumn(x1) + 1)
+        starts = np.searchsorted(self.keys, columns * self.rows + self.getRow(y0), "left")
+        ends = np.searchsorted(self.keys, columns * self.rows + self.getRow(y1), "right")
+        # concatenate the ranges
+        lengths = ends - starts
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(np.sum(lengths)) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+        return self.order[positions]
+
+    def nearest(self, x, y, radius, mask=None):
+        """ the index of the nearest point within radius around (x, y) or None """
+        indices = self.query(x - radius, y - radius, x + radius, y + radius)
+        if mask is not None:
+            indices = indices[mask[indices]]
+        if len(indices) == 0:
+            return None
+        distances = (self.x[indices] - x) ** 2 + (self.y[indices] - y) ** 2
+        index = np.argmin(distances)
+        if distances[index] > radius ** 2:
+            return None
+        return indices[index]
+
+
+class MyMarkerBatchItem(QtWidgets.QGraphicsItem):
+    """ Draws all markers of one marker type, which are not interacted with, in a single paint call.
+
+    Only the markers inside the exposed region are drawn. The item does not accept hover events, a mouse press on a
+    marker turns this marker into a MyMarkerItem, which handles all further interaction.
+    """
+    # above this number of visible markers, markers are drawn as dots
+    lod_point_budget = 20000
+    # the minimal radius in pixels to pick a marker
+    pick_radius = 5
+
+    def __init__(self, marker_handler, parent, marker_type, ids, x, y):
+        QtWidgets.QGraphicsItem.__init__(self)
+        self.marker_handler = marker_handler
+        self.marker_type = marker_type
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.marker_x = np.asarray(x, dtype=float)
+        self.marker_y = np.asarray(y, dtype=float)
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.index_of_id = {id: index for index, id in enumerate(self.ids.tolist())}
+        self.grid = MarkerBucketGrid(self.marker_x, self.marker_y)
+
+        self.sprites = {}
+        self.forward_item = None
+        self.view_scale = marker_handler.scale
+
+        self.GetStyle()
+
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setAcceptHoverEvents(False)
+        # only add to the scene when boundingRect can be evaluated
+        self.setParentItem(parent)
+
+        self.marker_handler.GetCounter(self.marker_type).AddCount(len(self.ids))
+
+    def GetStyle(self):
+        self.style = self.marker_handler.style_cache.getTypeStyle(self.marker_type)[1]
+        color = self.style["color"]
+        # a color map assigns a color to every marker, otherwise all markers share the color
+        if color[0] != "#":
+            self.colors = GetColorFromMap(color, self.ids).astype(np.uint8)
+            self.color_alpha = 255
+        else:
+            color = HTMLColorToRGB(color)
+            self.colors = np.broadcast_to(np.array(color[:3], dtype=np.uint8), (len(self.ids), 3))
+            self.color_alpha = color[3] if len(color) > 3 else 255
+        self.marker_shape = self.style.get("shape", "cross")
+        self.marker_scale = self.style.get("scale", 1)
+        self.screen_transform = self.style.get("transform", "screen") == "screen"
+
+    def getSprite(self, view_scale, dots=False):
+        """ the pixel offsets and alpha values of one marker on the screen """
+        if dots:
+            shape, size = "circle", 0.3
+        else:
+            shape = self.marker_shape
+            size = self.marker_scale if self.screen_transform else self.marker_scale * 0.1 * view_scale
+        key = (shape, round(size, 3))
+        if key in self.sprites:
+            return self.sprites[key]
+        # the size of markers in image coordinates changes with every zoom
+        if len(self.sprites) > 16:
+            self.sprites = {}
+
+        outline = shape.endswith("-o")
+        path = paths[shape[:-2] if outline else shape]
+        rect = path.boundingRect()
+        extent = int(np.ceil(max(abs(rect.left()), abs(rect.right()), abs(rect.top()), abs(rect.bottom())) * size)) + 3
+
+        # render the marker path like MyGrabberItem does
+        image = QtGui.QImage(2 * extent + 1, 2 * extent + 1, QtGui.QImage.Format_ARGB32)
+        image.fill(QtGui.QColor(0, 0, 0, 0))
+        painter = QtGui.QPainter(image)
+        painter.translate(extent + 0.5, extent + 0.5)
+        painter.scale(size, size)
+        if outline:
+            pen = QtGui.QPen(QtGui.QColor("white"))
+            pen.setCosmetic(True)
+            pen.setWidthF(5)
+            painter.setPen(pen)
+            painter.setBrush(Qt.NoBrush)
+        else:
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QtGui.QBrush(QtGui.QColor("white")))
+        painter.drawPath(path)
+        painter.end()
+
+        alpha = np.array(alpha_view(image))
+        dy, dx = np.nonzero(alpha > 8)
+        self.sprites[key] = (dx - extent, dy - extent, alpha[dy, dx].astype(np.int64), extent)
+        return self.sprites[key]
+
+    def setViewScale(self, scale):
+        self.prepareGeometryChange()
+        self.view_scale = scale
+
+    def boundingRect(self):
+        extent = self.getSprite(self.view_scale)[3]
+        margin = extent / self.view_scale
+        grid = self.grid
+        return QtCore.QRectF(grid.x0 - margin, grid.y0 - margin, grid.x1 - grid.x0 + 2 * margin, grid.y1 - grid.y0 + 2 * margin)
+
+    def paint(self, painter, option, widget=None):
+        transform = painter.worldTransform()
+        view_scale = np.hypot(transform.m11(), transform.m12())
+        extent = self.getSprite(view_scale)[3]
+
+        # cull the markers to the exposed region
+        exposed = option.exposedRect
+        margin = extent / view_scale
+        indices = self.grid.query(exposed.left() - margin, exposed.top() - margin,
+                                  exposed.right() + margin, exposed.bottom() + margin)
+        indices = indices[self.alive[indices]]
+        if len(indices) == 0:
+            return
+
+        # the region of the device to draw to
+        device = painter.device()
+        target = transform.mapRect(exposed).toAlignedRect().intersected(QtCore.QRect(0, 0, device.width(), device.height()))
+        if target.isEmpty():
+            return
+        width, height = target.width(), target.height()
+
+        # map the markers to device pixels
+        x, y = self.marker_x[indices], self.marker_y[indices]
+        px = np.round(transform.m11() * x + transform.m21() * y + transform.dx()).astype(np.int64) - target.left()
+        py = np.round(transform.m12() * x + transform.m22() * y + transform.dy()).astype(np.int64) - target.top()
+        inside = (-extent <= px) & (px < width + extent) & (-extent <= py) & (py < height + extent)
+        indices, px, py = indices[inside], px[inside], py[inside]
+
+        # level of detail: markers on the same pixel only need to be drawn once
+        _, first = np.unique((py + extent) * (width + 2 * extent) + (px + extent), return_index=True)
+        indices, px, py = indices[first], px[first], py[first]
+        dx, dy, alpha, extent = self.getSprite(view_scale, dots=len(indices) > self.lod_point_budget)
+        alpha = alpha * self.color_alpha // 255
+        colors = self.colors[indices]
+
+        # stamp the sprite for all markers at once, one sprite pixel after the other
+        image = np.zeros((height * width, 4), dtype=np.uint8)
+        for offset_x, offset_y, value in zip(dx, dy, alpha):
+            tx = px + offset_x
+            ty = py + offset_y
+            valid = np.nonzero((0 <= tx) & (tx < width) & (0 <= ty) & (ty < height))[0]
+            target_index = ty[valid] * width + tx[valid]
+            better = image[target_index, 3] < value
+            image[target_index[better], :3] = colors[valid[better]]
+            image[target_index[better], 3] = value
+
+        painter.save()
+        painter.resetTransform()
+        painter.drawImage(target.topLeft(), array2qimage(image.reshape(height, width, 4)))
+        painter.restore()
+
+    def hitTest(self, pos):
+        radius = max(self.getSprite(self.view_scale)[3] - 3, self.pick_radius) / self.view_scale
+        return self.grid.nearest(pos.x(), pos.y(), radius, self.alive)
+
+    def materialise(self, index):
+        """ remove the marker from the batch and create an individual MyMarkerItem for it """
+        self.alive[index] = False
+        self.update()
+        self.marker_handler.GetCounter(self.marker_type).AddCount(-1)
+        data = self.marker_handler.marker_file.table_marker.get(id=int(self.ids[index]))
+        item = MyMarkerItem(self.marker_handler, self.marker_handler.MarkerParent, data)
+        item.setScale(1 / self.marker_handler.scale)
+        self.marker_handler.points.append(item)
+        return item
+
+    def getItem(self, id):
+        """ the MyMarkerItem for the marker with the given id, if this batch displays it """
+        index = self.index_of_id.get(id)
+        if index is None or not self.alive[index]:
+            return None
+        return self.materialise(index)
+
+    def mousePressEvent(self, event):
+        index = self.hitTest(event.pos())
+        # no marker was hit, let the event pass to the items below
+        if index is None:
+            event.ignore()
+            return
+        # the new item takes over, its grabber receives the events of this press
+        self.forward_item = self.materialise(index)
+        self.forward_item.g1.mousePressEvent(event)
+        event.accept()
+
+    def mouseMoveEvent(self, event):
+        if self.forward_item is not None and self.forward_item.g1.parentItem() is self.forward_item:
+            self.forward_item.g1.mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.forward_item is not None and self.forward_item.g1.parentItem() is self.forward_item:
+            self.forward_item.g1.mouseReleaseEvent(event)
+        self.forward_item = None
+
+    def draw(self, image, start_x, start_y, scale=1, image_scale=1, rotation=0):
+        marker_scale = scale * self.marker_scale
+        for index in np.nonzero(self.alive)[0]:
+            x, y = (self.marker_x[index] - start_x) * image_scale, (self.marker_y[index] - start_y) * image_scale
+            drawMarker(image, np.array([x, y]), tuple(int(c) for c in self.colors[index]), marker_scale * 10, self.marker_shape)
+
+    def draw2(self, image, start_x, start_y, scale=1, image_scale=1, rotation=0):
+        pass
+
+    def drawSvg(self, image, start_x, start_y, scale=1, image_scale=1, rotation=0):
+        marker_scale = scale * self.marker_scale
+        for index in np.nonzero(self.alive)[0]:
+            x, y = (self.marker_x[index] - start_x) * image_scale, (self.marker_y[index] - start_y) * image_scale
+            marker = getMarker(image, QtGui.QColor(*self.colors[index]), marker_scale * 10, self.marker_shape)
+            line = image.add(image.polyline([(x, y)]))
+            line['marker-end'] = marker.get_funciri()
+
+    def draw2Svg(self, image, start_x, start_y, scale=1, image_scale=1, rotation=0):
+        pass
+
+    def delete(self, just_display=True):
+        self.marker_handler.GetCounter(self.marker_type).AddCount(-int(np.sum(self.alive)))
+        self.scene().removeItem(self)
+
+
 class MyLineItem(MyDisplayItem, QtWidgets.QGraphicsLineItem):
     default_shape = "rect"
 
@@ -2831,8 +3176,7 @@ class MyTrackItem(MyDisplayItem, QtWidgets.QGraphicsPathItem):
 
     def ApplyStyle(self):
         MyDisplayItem.ApplyStyle(self)
-        line_styles = dict(solid=Qt.SolidLine, dash=Qt.DashLine, dot=Qt.DotLine, dashdot=Qt.DashDotLine,
-                           dashdotdot=Qt.DashDotDotLine)
+        line_styles = StyleCache.line_styles
 
         # the line between points
         pen = self.pen()
@@ -3368,6 +3712,8 @@ class MarkerHandler:
         self.Crosshair = Crosshair(parent, view, image_display)
 
         self.points = []
+        self.marker_batches = {}
+        self.style_cache = StyleCache()
         self.tracks = {}
         self.marker_lists = {}
         self.cached_images = set()
@@ -3433,6 +3779,7 @@ class MarkerHandler:
         for list in self.display_lists:
             while len(list):
                 list[0].delete(just_display=True)
+        self.ClearMarkerBatches()
 
         # remove all counters
         for counter in self.counter:
@@ -3448,6 +3795,7 @@ class MarkerHandler:
 
         self.marker_file = MarkerFile(data_file)
         self.tracks_loaded = False
+        self.style_cache.clear()
 
         # if a new database is created fill it with markers from the config
         if new_database:
@@ -3463,57 +3811,35 @@ class MarkerHandler:
 
         #return
         # place tick marks for already present markers
-        # frames from markers
-        try:
-            frames1 = np.array(self.marker_file.get_marker_frames1().tuples())[:, 0]
-        except IndexError:
-            frames1 = []
-        # frames for rectangles
-        try:
-            frames2 = np.array(self.marker_file.get_marker_frames2().tuples())[:, 0]
-        except IndexError:
-            frames2 = []
-            pass
-        # frames for lines
-        try:
-            frames3 = np.array(self.marker_file.get_marker_frames3().tuples())[:, 0]
-        except IndexError:
-            frames3 = []
-            pass
-        # frames for ellipses
-        try:
-            frames4 = np.array(self.marker_file.get_marker_frames4().tuples())[:, 0]
-        except IndexError:
-            frames4 = []
-            pass
-        # frames for polygons
-        try:
-            frames5 = np.array(self.marker_file.get_marker_frames5().tuples())[:, 0]
-        except IndexError:
-            frames5 = []
-            pass
-        # join sets
-        frames = set(frames1) | set(frames2) | set(frames3) | set(frames4) | set(frames5)
+        frames = self.data_file.getMarkedFrames(kind=["marker", "rectangle", "line", "ellipse", "polygon"])
         # if we have marker, set ticks accordingly
         if len(frames):
             BroadCastEvent(self.modules, "MarkerPointsAddedList", frames)
 
     def drawToImage(self, image, start_x, start_y, scale=1, image_scale=1, rotation=0):
+        for batch in self.marker_batches.values():
+            batch.draw(image, start_x, start_y, scale, image_scale, rotation)
         for list in self.display_lists:
             for point in list:
                 point.draw(image, start_x, start_y, scale, image_scale, rotation)
 
     def drawToImage2(self, image, start_x, start_y, scale=1, image_scale=1, rotation=0):
+        for batch in self.marker_batches.values():
+            batch.draw2(image, start_x, start_y, scale, image_scale, rotation)
         for list in self.display_lists:
             for point in list:
                 point.draw2(image, start_x, start_y, scale, image_scale, rotation)
 
     def drawToImageSvg(self, image, start_x, start_y, scale=1, image_scale=1, rotation=0):
+        for batch in self.marker_batches.values():
+            batch.drawSvg(image, start_x, start_y, scale, image_scale, rotation)
         for list in self.display_lists:
             for point in list:
                 point.drawSvg(image, start_x, start_y, scale, image_scale, rotation)
 
     def drawToImage2Svg(self, image, start_x, start_y, scale=1, image_scale=1, rotation=0):
+        for batch in self.marker_batches.values():
+            batch.draw2Svg(image, start_x, start_y, scale, image_scale, rotation)
         for list in self.display_lists:
             for point in list:
                 point.draw2Svg(image, start_x, start_y, scale, image_scale, rotation)
@@ -3654,8 +3980,11 @@ class MarkerHandler:
             chunk_size = (self.data_file._SQLITE_MAX_VARIABLE_NUMBER - 1) // 2
             with self.data_file.db.atomic():
                 for idx in range(0, len(new_tracks), chunk_size):
-                    new_track_query.extend(self.marker_file.table_track.select().where(
-                        self.marker_file.table_track.id << new_tracks[idx:idx + chunk_size]))
+                    # fetch the types together with the tracks
+                    new_track_query.extend(self.marker_file.table_track
+                                           .select(self.marker_file.table_track, self.marker_file.table_markertype)
+                                           .join(self.marker_file.table_markertype)
+                                           .where(self.marker_file.table_track.id << new_tracks[idx:idx + chunk_size]))
 
             # and crate track display items from it
             for track in new_track_query:
@@ -3736,9 +4065,36 @@ class MarkerHandler:
                 track.delete()
         self.LoadTracks()
 
+    def ClearMarkerBatches(self):
+        for batch in self.marker_batches.values():
+            batch.delete()
+        self.marker_batches = {}
+
+    def LoadMarkerBatches(self, image_id):
+        # markers without own style or text can be drawn in batches, one batch per marker type
+        table_marker = self.marker_file.table_marker
+        table_markertype = self.marker_file.table_markertype
+        plain_marker = (table_marker.text.is_null() | (table_marker.text == "")) & \
+                       (table_marker.style.is_null() | (table_marker.style == "")) & \
+                       (table_markertype.text.is_null() | (table_markertype.text == ""))
+        types = {type.id: type for type in table_markertype.select().where(table_markertype.hidden == False)}
+        query = (table_marker.select(table_marker.id, table_marker.x, table_marker.y, table_marker.type)
+                 .join(table_markertype)
+                 .where(table_marker.image == image_id, table_marker.track.is_null(), table_markertype.hidden == False)
+                 .where(plain_marker)
+                 .tuples())
+        markers = np.array(list(query), dtype=float).reshape(-1, 4)
+        for type_id in np.unique(markers[:, 3]).astype(int).tolist():
+            batch_markers = markers[markers[:, 3] == type_id]
+            self.marker_batches[type_id] = MyMarkerBatchItem(self, self.MarkerParent, types[type_id], batch_markers[:, 0],
+                                                             batch_markers[:, 1], batch_markers[:, 2])
+        # the remaining markers still need individual items
+        return ~plain_marker
+
     def LoadPoints(self):
         while len(self.points):
             self.points[0].delete(just_display=True)
+        self.ClearMarkerBatches()
         frame = self.data_file.get_current_image()
         image_id = self.data_file.current_reference_image.id
         marker_list = (
@@ -3747,6 +4103,10 @@ class MarkerHandler:
                 .where(self.marker_file.table_marker.image == image_id)
                 .where(self.marker_file.table_markertype.hidden == False)
         )
+        # many markers are drawn in batches, only the remaining ones get their own items
+        batch_threshold = self.data_file.getOption("marker_batch_threshold")
+        if batch_threshold >= 0 and self.data_file.getFrameSummaryCount(image=image_id, kind="marker") >= batch_threshold:
+            marker_list = marker_list.where(self.LoadMarkerBatches(image_id))
         for marker in marker_list:
             if not marker.track:
                 self.points.append(MyMarkerItem(self, self.MarkerParent, marker))
@@ -3829,6 +4189,12 @@ class MarkerHandler:
                     break
                 if point.data.id == data.id:
                     return point
+        # a marker which is displayed in a batch gets its own item as soon as it is needed
+        if type(data) == self.data_file.table_marker:
+            for batch in self.marker_batches.values():
+                item = batch.getItem(data.id)
+                if item is not None:
+                    return item
 
     def GetTrackItem(self, data):
         for track in self.tracks:
@@ -3870,6 +4236,8 @@ class MarkerHandler:
         for list in self.display_lists:
             for point in list:
                 point.setScale(1 / scale)
+        for batch in self.marker_batches.values():
+            batch.setViewScale(scale)
         self.Crosshair.setScale(1 / scale)
 
     def setActiveModule(self, active, first_time=False):
@@ -932,11 +932,9 @@ class MaskHandler:
 
         # place tick marks for already present masks
         # but lets take care that there are masks ...
-        try:
-            frames = np.array(self.mask_file.get_mask_frames().tuples())[:, 0]
+        frames = self.data_file.getMarkedFrames(kind="mask")
+        if len(frames):
             BroadCastEvent(self.modules, "MarkerPointsAddedList", frames)
-        except IndexError:
-            pass
 
     def maskTypesChangedEvent(self) -> None:
         # update mask interface buttons
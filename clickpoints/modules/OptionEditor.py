@@ -25,7 +25,7 @@ import os
 import subprocess
 from packaging.version import Version
 from threading import Thread
-from typing import Any, List, Union, IO
+from typing import Any, List, Union, IO, TYPE_CHECKING
 from subprocess import PIPE, Popen
 
 import natsort
@@ -36,7 +36,8 @@ from clickpoints.DataFile import Option
 from clickpoints.includes import BroadCastEvent
 from clickpoints.includes import LoadConfig
 from clickpoints.includes import QtShortCuts
-from clickpoints.includes.Database import DataFileExtended
+if TYPE_CHECKING:
+    from clickpoints.includes.Database import DataFileExtended
 
 repo_path = "\"" + os.path.join(os.path.dirname(__file__), "..", "..") + "\""
 
@@ -231,7 +232,7 @@ def getOptionInputWidget(option: Option, layout: QtWidgets.QVBoxLayout, **kwargs
 
 class OptionEditorWindow(QtWidgets.QWidget):
 
-    def __init__(self, window: "ClickPointsWindow", data_file: DataFileExtended, parent: "OptionEditor") -> None:
+    def __init__(self, window: "ClickPointsWindow", data_file: "DataFileExtended", parent: "OptionEditor") -> None:
         QtWidgets.QWidget.__init__(self)
         self.window = window
         self.data_file = data_file
@@ -308,11 +309,26 @@ class OptionEditorWindow(QtWidgets.QWidget):
                 edit.has_error = False
                 self.edits.append(edit)
                 self.edits_by_name[option.key] = edit
+            if category == "Profiling":
+                self.button_report = QtWidgets.QPushButton("Show Query Report")
+                self.button_report.clicked.connect(self.showQueryReport)
+                self.layout.addWidget(self.button_report)
             self.layout.addStretch()
 
         self.edits_by_name["buffer_size"].setDisabled(options.buffer_mode != 1)
         self.edits_by_name["buffer_memory"].setDisabled(options.buffer_mode != 2)
 
+    def showQueryReport(self) -> None:
+        self.report_window = QtWidgets.QPlainTextEdit()
+        self.report_window.setWindowTitle("Query Report - ClickPoints")
+        self.report_window.setWindowIcon(qta.icon("ei.cogs"))
+        self.report_window.setReadOnly(True)
+        self.report_window.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+        self.report_window.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.report_window.setPlainText(self.data_file.getQueryReport())
+        self.report_window.resize(800, 600)
+        self.report_window.show()
+
     def updateEditField(self, edit: QtWidgets.QWidget, value: Any, option: Option) -> None:
         print(option.value_type, value, edit)
         edit.setValue(value)
@@ -519,7 +535,7 @@ class OptionEditor:
         if self.OptionsWindow:
             self.OptionsWindow.close()
 
-    def updateDataFile(self, data_file: DataFileExtended, new_database: bool) -> None:
+    def updateDataFile(self, data_file: "DataFileExtended", new_database: bool) -> None:
         self.data_file = data_file
         self.config = data_file.getOptionAccess()
 
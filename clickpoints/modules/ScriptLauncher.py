@@ -31,6 +31,8 @@ from qtpy import QtCore, QtGui, QtWidgets
 
 from clickpoints.includes.ConfigLoad import dotdict
 from clickpoints.includes.Database import DataFileExtended
+from clickpoints.includes.StartupTrace import startup_trace
+from clickpoints.includes.FrameTrace import frame_trace
 
 try:
     import SocketServer  # python 2
@@ -146,6 +148,7 @@ class Script(QtCore.QObject):
     def __init__(self, filename: str) -> None:
         QtCore.QObject.__init__(self)
         self.filename = filename
+        self.event_handlers = {}
         parser = ConfigParser.ConfigParser()
         # for python 2 compatibility implement the fallback parameter, which is already there for python 3
         parser.get = wrap_get(parser.get)
@@ -205,6 +208,10 @@ class Script(QtCore.QObject):
                 return
             for package_name in needed_packages:
                 install(package_name)
+        with startup_trace.span("add-on " + name):
+            return self._activate(script_launcher, path, name, silent)
+
+    def _activate(self, script_launcher: "ScriptLauncher", path: str, name: str, silent: bool) -> bool:
         folder, filename = os.path.split(path)
         path, folder = os.path.split(folder)
         basefilename, ext = os.path.splitext(filename)
@@ -235,6 +242,7 @@ class Script(QtCore.QObject):
         if "Addon" not in dir(self.addon_module):
             raise NameError("No addon module found in " + path)
         try:
+            self.event_handlers = {}
             self.addon_class_instance = self.addon_module.Addon(script_launcher.data_file, script_launcher, self.name,
                                                                 icon=self.icon)
         except peewee.OperationalError:
@@ -289,6 +297,19 @@ class Script(QtCore.QObject):
             self.button.setChecked(False)
             self.hourglassAnimationTimer.stop()
 
+    def getEventHandler(self, function: str) -> Callable:
+        # the handler of the add-on for this event is only looked up once
+        if self.addon_class_instance is None:
+            return None
+        try:
+            return self.event_handlers[function]
+        except KeyError:
+            handler = None
+            if function in dir(self.addon_class_instance):
+                handler = getattr(self.addon_class_instance, function)
+            self.event_handlers[function] = handler
+            return handler
+
     def run(self) -> None:
         self.addon_class_instance.buttonPressedEvent()
 
@@ -437,11 +458,22 @@ class ScriptLauncher(QtCore.QObject):
     scripts = None
     active_scripts = None
 
+    # events that fire on every mouse move are coalesced for the add-ons, they get at most one event per interval (in s)
+    # with the latest arguments, for the marker move event one per moved entry
+    coalesced_events = {"markerMoveEvent": True, "zoomEvent": False, "panEvent": False}
+    event_interval = 0.05
+
     def __init__(self, window: "ClickPointsWindow", modules: List[Any]) -> None:
         QtCore.QObject.__init__(self)
         self.window = window
         self.modules = modules
 
+        self.pending_events = {}
+        self.last_event_times = {}
+        self.event_timer = QtCore.QTimer()
+        self.event_timer.setSingleShot(True)
+        self.event_timer.timeout.connect(self.flushEvents)
+
         self.button = QtWidgets.QPushButton()
         self.button.setIcon(qta.icon("fa5s.external-link-alt"))
         self.button.clicked.connect(self.showScriptSelector)
@@ -483,11 +515,29 @@ class ScriptLauncher(QtCore.QObject):
         self.config = data_file.getOptionAccess()
         self.scripts = self.loadScripts()
 
+        # the add-ons are activated after the first frame has been displayed, to not delay the startup
+        QtCore.QTimer.singleShot(0, lambda: self.activateStoredScripts(data_file))
+
+    def activateStoredScripts(self, data_file: DataFileExtended) -> None:
+        # the data file might have been closed or replaced in the meantime
+        if data_file is not self.data_file:
+            return
+        previous_scripts = list(self.active_scripts)
         for script in self.data_file.getOption("scripts"):
             self.activateScript(script, silent=True)
 
         self.updateScripts()
 
+        # the newly activated add-ons missed the event of the already loaded frame
+        if self.data_file.image is not None:
+            for script in self.active_scripts:
+                if script in previous_scripts:
+                    continue
+                handler = script.getEventHandler("imageLoadedEvent")
+                if handler is not None:
+                    self.callEventHandler(handler, "imageLoadedEvent",
+                                          (self.data_file.image.filename, self.data_file.get_current_image()), {})
+
     def optionsImported(self, config):
         if config is not None and config.scripts is not None:
             for script in config.scripts:
@@ -508,6 +558,7 @@ class ScriptLauncher(QtCore.QObject):
         script = self.getScriptByFilename(script)
         if script is not None:
             self.active_scripts.remove(script)
+            self.dropEvents(script)
             script.deactivate()
 
     def getScriptByFilename(self, filename: Union[Script, str]) -> Script:
@@ -544,13 +595,55 @@ class ScriptLauncher(QtCore.QObject):
             script.button = button
 
     def receiveBroadCastEvent(self, function: str, *args, **kwargs) -> None:
+        coalesced = function in self.coalesced_events
         for script in self.scripts:
-            if function in dir(script.addon_class_instance):
-                try:
-                    getattr(script.addon_class_instance, function)(*args, **kwargs)
-                except:
-                    print("Calling", script.addon_class_instance, function, args, kwargs, file=sys.stderr)
-                    traceback.print_exc()
+            handler = script.getEventHandler(function)
+            if handler is None:
+                continue
+            if coalesced:
+                key = (script, function, id(args[0]) if self.coalesced_events[function] and len(args) else None)
+                now = time.time()
+                # defer the event if the add-on got this event less than an interval ago
+                if key in self.pending_events or now - self.last_event_times.get((script, function), 0) < self.event_interval:
+                    self.pending_events[key] = (handler, args, kwargs)
+                    if not self.event_timer.isActive():
+                        self.event_timer.start(int(self.event_interval * 1000))
+                    continue
+                self.last_event_times[(script, function)] = now
+            else:
+                # deliver deferred events first, to keep the order of the events
+                self.flushEvents(script)
+            self.callEventHandler(handler, function, args, kwargs)
+
+    def flushEvents(self, script: Script = None) -> None:
+        if not self.pending_events:
+            return
+        for key in list(self.pending_events):
+            if script is None or key[0] is script:
+                handler, args, kwargs = self.pending_events.pop(key)
+                self.last_event_times[key[:2]] = time.time()
+                self.callEventHandler(handler, key[1], args, kwargs)
+
+    def dropEvents(self, script: Script) -> None:
+        # the deferred events of an add-on refer to the handlers of its old instance
+        for key in list(self.pending_events):
+            if key[0] is script:
+                del self.pending_events[key]
+        for key in list(self.last_event_times):
+            if key[0] is script:
+                del self.last_event_times[key]
+
+    def callEventHandler(self, handler: Callable, function: str, args: tuple, kwargs: dict) -> None:
+        try:
+            if frame_trace.enabled:
+                name = getattr(getattr(handler, "__self__", None), "addon_name", "")
+                with frame_trace.stage(function + " add-on " + name):
+                    handler(*args, **kwargs)
+            else:
+                handler(*args, **kwargs)
+        except:
+            print("Calling", handler, function, args, kwargs, file=sys.stderr)
+            traceback.print_exc()
 
     def showScriptSelector(self) -> None:
         self.scriptSelector = ScriptChooser(self)
@@ -564,6 +657,7 @@ class ScriptLauncher(QtCore.QObject):
 
     def reload(self, index: int) -> None:
         script = self.active_scripts[index]
+        self.dropEvents(script)
         script.reload()
         print("Reload", index)
 
@@ -192,6 +192,128 @@ class TimeLineGrabberTime(TimeLineGrabber):
         self.updatePos()
 
 
+class TimeLineTicks(QtWidgets.QGraphicsItem):
+    """ The tick markers of the frame slider.
+
+    The marked frames of every tick type are stored in an array and counted in bins of about one pixel width. Each bin
+    is drawn as a bar, which is lower if only a part of the frames of the bin is marked. Marking or unmarking a frame
+    only changes the count of its bin, independent of the number of frames.
+    """
+
+    def __init__(self, slider: "TimeLineSlider") -> None:
+        QtWidgets.QGraphicsItem.__init__(self)
+        self.slider = slider
+        self.tick_styles = {}
+        # for every type a flag for every frame and the number of marked frames in every bin
+        self.marked = {}
+        self.bin_counts = {}
+        self.bin_count = 1
+        self.frames_per_bin = 1
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setParentItem(slider.parent)
+
+    def setTickStyle(self, type: int, color: QtGui.QColor, height: float) -> None:
+        self.prepareGeometryChange()
+        self.tick_styles[type] = (QtGui.QColor(color), height)
+        self.update()
+
+    def maxHeight(self) -> float:
+        return max([height for color, height in self.tick_styles.values()] + [0])
+
+    def frameToBin(self, frames: ndarray) -> ndarray:
+        bins = ((np.asarray(frames) - self.slider.min_value) / self.frames_per_bin).astype(int)
+        return np.clip(bins, 0, self.bin_count - 1)
+
+    def binToPixel(self, bins: ndarray) -> ndarray:
+        value_range = self.slider.max_value - self.slider.min_value
+        if value_range == 0:
+            return np.zeros(np.shape(bins))
+        return np.asarray(bins) * self.frames_per_bin / value_range * self.slider.length
+
+    def binRect(self, bin: int) -> QtCore.QRectF:
+        x0, x1 = self.binToPixel([bin, bin + 1])
+        height = self.maxHeight()
+        return QtCore.QRectF(x0 - 1, -3.5 - height - 1, max(x1 - x0, 2) + 2, height + 2)
+
+    def updateBins(self) -> None:
+        """ distribute the frames to the bins again, needed when the length or the range of the slider changes """
+        self.prepareGeometryChange()
+        frame_count = self.slider.max_value - self.slider.min_value + 1
+        self.bin_count = int(max(1, min(frame_count, self.slider.length)))
+        self.frames_per_bin = max(frame_count, 1) / self.bin_count
+        for type, marked in self.marked.items():
+            frames = np.flatnonzero(marked)
+            frames = frames[(self.slider.min_value <= frames) & (frames <= self.slider.max_value)]
+            self.bin_counts[type] = np.bincount(self.frameToBin(frames), minlength=self.bin_count)
+        self.update()
+
+    def setMarked(self, frames: Union[int, list, ndarray], type: int, marked: bool = True) -> None:
+        frames = np.atleast_1d(np.asarray(frames, dtype=int))
+        frames = frames[frames >= 0]
+        if type not in self.marked:
+            self.marked[type] = np.zeros(0, dtype=bool)
+            self.bin_counts[type] = np.zeros(self.bin_count, dtype=int)
+        if len(frames) == 0:
+            return
+        # grow the flag array if needed
+        if frames.max() >= len(self.marked[type]):
+            new_marked = np.zeros(max(frames.max() + 1, 2 * len(self.marked[type])), dtype=bool)
+            new_marked[:len(self.marked[type])] = self.marked[type]
+            self.marked[type] = new_marked
+
+        # only count the frames which actually change
+        frames = np.unique(frames)
+        frames = frames[self.marked[type][frames] != marked]
+        self.marked[type][frames] = marked
+        frames = frames[(self.slider.min_value <= frames) & (frames <= self.slider.max_value)]
+        bins = self.frameToBin(frames)
+        np.add.at(self.bin_counts[type], bins, 1 if marked else -1)
+
+        # only repaint the changed bins
+        bins = np.unique(bins)
+        if len(bins) > 100:
+            self.update()
+        else:
+            for bin in bins:
+                self.update(self.binRect(bin))
+
+    def isMarked(self, start: int, stop: int) -> ndarray:
+        """ whether the frames from start to stop (exclusive) have a tick of any type """
+        result = np.zeros(max(stop - start, 0), dtype=bool)
+        for marked in self.marked.values():
+            part = marked[max(start, 0):max(stop, 0)]
+            result[max(-start, 0):max(-start, 0) + len(part)] |= part
+        return result
+
+    def clear(self) -> None:
+        self.marked = {}
+        self.bin_counts = {}
+        self.update()
+
+    def boundingRect(self) -> QtCore.QRectF:
+        return self.binRect(0).united(self.binRect(self.bin_count - 1))
+
+    def paint(self, painter: QtGui.QPainter, option: QtWidgets.QStyleOptionGraphicsItem, widget=None) -> None:
+        # only draw the bins in the exposed area
+        rect = option.exposedRect
+        first, last = self.frameToBin([self.slider.PixelToValue(rect.left() - 1),
+                                       self.slider.PixelToValue(rect.right() + 1)])
+        for type in sorted(self.bin_counts):
+            counts = self.bin_counts[type][first:last + 1]
+            bins = np.flatnonzero(counts)
+            if len(bins) == 0:
+                continue
+            color, height = self.tick_styles[type]
+            heights = np.maximum(height * np.minimum(counts[bins] / self.frames_per_bin, 1), 2)
+            bins += first
+            x0 = self.binToPixel(bins)
+            widths = self.binToPixel(bins + 1) - x0
+            painter.setPen(QtGui.QPen(color))
+            painter.setBrush(QtGui.QBrush(color))
+            for x, width, height in zip(x0, widths, heights):
+                painter.drawRect(QtCore.QRectF(x, -3.5 - height, max(width, 2), height))
+
+
 class TimeLineSlider(QtWidgets.QGraphicsView):
     start_changed = QtCore.Signal(int)
     end_changed = QtCore.Signal(int)
@@ -267,7 +389,10 @@ class TimeLineSlider(QtWidgets.QGraphicsView):
 
         self.length = 1
 
-        self.tick_marker = {}
+        self.ticks = TimeLineTicks(self)
+        self.ticks.setZValue(1)
+        self.ticks.setTickStyle(0, QtGui.QColor("red"), 12)
+        self.ticks.setTickStyle(1, QtGui.QColor("green"), 8)
 
     def SliderBarMousePressEvent(self, event: QtWidgets.QGraphicsSceneMouseEvent) -> None:
         self.setValue(self.PixelToValue(self.slider_line.mapToScene(event.pos()).x()))
@@ -275,75 +400,55 @@ class TimeLineSlider(QtWidgets.QGraphicsView):
 
     def addTickMarker(self, pos: int, type: int = 0, color: QtGui.QColor = QtGui.QColor("red"),
                       height: int = 12) -> None:
-        if type == 1:
-            color = QtGui.QColor("green")
-            height = 8
-        if pos in self.tick_marker and type in self.tick_marker[pos]:
-            tick_marker = self.tick_marker[pos][type]
-        else:
-            width = self.ValueToPixel(1)
-            if pos == self.max_value:
-                width = 2
-            tick_marker = QtWidgets.QGraphicsRectItem(0.0, -3.5, width, -height, self.parent)
-        tick_marker.setPen(QtGui.QPen(color))
-        tick_marker.setBrush(QtGui.QBrush(color))
-        tick_marker.value = pos
-        tick_marker.type = type
-        tick_marker.height = height
-        tick_marker.setZValue(1 + type)
-        tick_marker.setPos(self.ValueToPixel(pos), 0)
-        if pos not in self.tick_marker:
-            self.tick_marker[pos] = {}
-        self.tick_marker[pos][type] = tick_marker
-        self.repaint()
+        if type not in self.ticks.tick_styles:
+            self.ticks.setTickStyle(type, color, height)
+        self.ticks.setMarked(pos, type, True)
+
+    def addTickMarkers(self, frames: Union[list, ndarray], type: int = 0) -> None:
+        self.ticks.setMarked(frames, type, True)
 
     def removeTickMarker(self, pos: int, type: int = 0) -> None:
-        if pos in self.tick_marker and type in self.tick_marker[pos]:
-            tick_marker = self.tick_marker[pos][type]
-            self.scene.removeItem(tick_marker)
-            del self.tick_marker[pos][type]
-            if self.tick_marker[pos] == {}:
-                del self.tick_marker[pos]
-            self.repaint()
+        self.ticks.setMarked(pos, type, False)
 
     def clearTickMarker(self) -> None:
-        for pos, ticks in self.tick_marker.items():
-            for type, tick in ticks.items():
-                self.scene.removeItem(tick)
-        self.tick_marker = {}
-        self.repaint()
+        self.ticks.clear()
 
     def getNextTick(self, pos: int, back: bool = False) -> int:
         if back is False:
-            my_range = range(pos + 1, self.max_value + 1, +1)
-        else:
-            my_range = range(pos - 1, self.min_value - 1, -1)
-        search_marked = True
-        for i in my_range:
-            if (i in self.tick_marker) == search_marked:
-                return i
-        if len(my_range) == 0:
-            if back is False:
+            if pos + 1 > self.max_value:
                 return pos + 1
-            return pos - 1
-        return my_range[-1]
+            marked = np.flatnonzero(self.ticks.isMarked(pos + 1, self.max_value + 1))
+            if len(marked):
+                return pos + 1 + marked[0]
+            return self.max_value
+        else:
+            if pos - 1 < self.min_value:
+                return pos - 1
+            marked = np.flatnonzero(self.ticks.isMarked(self.min_value, pos))
+            if len(marked):
+                return self.min_value + marked[-1]
+            return self.min_value
 
     def getNextTickChange(self, pos: int, back: bool = False) -> int:
         if back is False:
-            my_range = range(pos + 1, self.max_value, +1)
-        else:
-            my_range = range(pos - 1, self.min_value, -1)
-        search_marked = True
-        if len(my_range) == 0:
-            if back is False:
+            if pos + 1 >= self.max_value:
                 return pos + 1
-            return pos - 1
-        if pos in self.tick_marker and my_range[0] in self.tick_marker:
-            search_marked = False
-        for i in my_range:
-            if (i in self.tick_marker) == search_marked:
-                return i
-        return my_range[-1]
+            marked = self.ticks.isMarked(pos, self.max_value)
+            # inside a block search for its end, otherwise for the start of the next block
+            search_marked = not (marked[0] and marked[1])
+            found = np.flatnonzero(marked[1:] == search_marked)
+            if len(found):
+                return pos + 1 + found[0]
+            return self.max_value - 1
+        else:
+            if pos - 1 <= self.min_value:
+                return pos - 1
+            marked = self.ticks.isMarked(self.min_value + 1, pos + 1)
+            search_marked = not (marked[-1] and marked[-2])
+            found = np.flatnonzero(marked[:-1] == search_marked)
+            if len(found):
+                return self.min_value + 1 + found[-1]
+            return self.min_value + 1
 
     def resizeEvent(self, event: QtGui.QResizeEvent) -> None:
         self.length = (self.size().width() - 20) / self.parent.scale()
@@ -352,13 +457,7 @@ class TimeLineSlider(QtWidgets.QGraphicsView):
                                         self.ValueToPixel(self.slider_end.value) - self.ValueToPixel(
                                             self.slider_start.value), 5)
         self.ensureVisible(self.slider_line)
-        for pos, ticks in self.tick_marker.items():
-            for type, tick in ticks.items():
-                tick.setPos(self.ValueToPixel(pos), 0)
-                width = self.ValueToPixel(1)
-                if pos == self.max_value:
-                    width = 2
-                tick.setRect(0.0, -3.5, width, -tick.height)
+        self.ticks.updateBins()
         for marker in [self.slider_position, self.slider_start, self.slider_end]:
             marker.setPixelRange(0, self.length)
         self.repaint()
@@ -368,6 +467,7 @@ class TimeLineSlider(QtWidgets.QGraphicsView):
         self.max_value = max_value
         for marker in [self.slider_position, self.slider_start, self.slider_end]:
             marker.setValueRange(self.min_value, self.max_value)
+        self.ticks.updateBins()
 
     def setValue(self, value: float) -> None:
         self.slider_position.setValue(BoundBy(value, self.min_value, self.max_value))
@@ -473,6 +573,10 @@ class RealTimeSlider(QtWidgets.QGraphicsView):
         self.tick_marker = []
         self.tick_blocks = []
 
+        # the timestamps sorted by time and their frames
+        self.times = np.zeros(0, dtype="datetime64[us]")
+        self.frames = np.zeros(0, dtype=int)
+
         self.scale = 1
         self.pan = 0
 
@@ -571,6 +675,13 @@ class RealTimeSlider(QtWidgets.QGraphicsView):
     def ValueToPixel(self, value: float) -> int:
         return Remap(value, [self.min_value, self.max_value], [0, self.length])
 
+    def TimeToFrame(self, timestamp: datetime.datetime) -> Optional[int]:
+        # the first frame after the given time
+        index = np.searchsorted(self.times, np.datetime64(timestamp, "us"), side="right")
+        if index == len(self.times):
+            return None
+        return int(self.frames[index])
+
     def value(self) -> int:
         return self.slider_position.value
 
@@ -584,13 +695,15 @@ class RealTimeSlider(QtWidgets.QGraphicsView):
                 tick.scene().removeItem(tick)
         self.tick_blocks = []
 
-        # get timestamps
+        # get timestamps sorted by time, the raw text is parsed by numpy instead of creating datetime objects
         self.data_file = data_file
-        timestamps = np.array(self.data_file.table_image.select(self.data_file.table_image.timestamp).where(
-            self.data_file.table_image.timestamp != None).tuples().execute())
+        rows = self.data_file.db.execute_sql("SELECT timestamp, sort_index FROM image WHERE timestamp IS NOT NULL "
+                                             "ORDER BY timestamp").fetchall()
+        self.times = np.array([row[0] for row in rows], dtype="datetime64[us]")
+        self.frames = np.array([row[1] for row in rows], dtype=int)
 
         # handle empty timeline
-        if len(timestamps) == 0:
+        if len(self.times) == 0:
             self.min_value = datetime.datetime.today()
             self.max_value = datetime.datetime.today() + datetime.timedelta(hours=1)
             self.slider_position.setValueRange(self.min_value, self.max_value)
@@ -598,15 +711,12 @@ class RealTimeSlider(QtWidgets.QGraphicsView):
             self.setHidden(True)
             return
 
-        # remove obsolete dimension (Nx1 -> N)
-        timestamps = timestamps[:, 0]
-
         self.is_hidden = False
         self.setHidden(False)
 
         # get min/max values
-        self.min_value = np.amin(timestamps)
-        self.max_value = np.amax(timestamps)
+        self.min_value = self.times[0].astype(datetime.datetime)
+        self.max_value = self.times[-1].astype(datetime.datetime)
         if self.max_value == self.min_value:
             self.max_value = self.min_value + datetime.timedelta(hours=1)
         range = self.max_value - self.min_value
@@ -621,18 +731,20 @@ class RealTimeSlider(QtWidgets.QGraphicsView):
         # add tick blocks
 
         # calculate the time between frames
-        deltas = timestamps[1:] - timestamps[:-1]
+        deltas = np.diff(self.times)
 
         # if we have only one image
         if len(deltas) == 0:
             return
 
-        # find big gaps
-        steps, = np.where(deltas > min(deltas) * 4)
+        # find big gaps (images with the same timestamp, e.g. from different layers, are no gaps)
+        positive_deltas = deltas[deltas > np.timedelta64(0, "us")]
+        min_delta = positive_deltas.min() if len(positive_deltas) else np.timedelta64(0, "us")
+        steps, = np.where(deltas > min_delta * 4)
 
         # start and end are the groups between these gaps
-        starts = timestamps[np.concatenate(([0], steps + 1))]
-        ends = timestamps[np.concatenate((steps, [len(timestamps) - 1]))]
+        starts = self.times[np.concatenate(([0], steps + 1))].astype(datetime.datetime)
+        ends = self.times[np.concatenate((steps, [len(self.times) - 1]))].astype(datetime.datetime)
 
         # add the groups to the timeline
         for start_time, end_time in zip(starts, ends):
@@ -704,12 +816,7 @@ class RealTimeSlider(QtWidgets.QGraphicsView):
                 break
             type_delta_minor = type_delta_test
 
-        tick_types = [["second", 0, 0],
-                      ["minute", 0, 0],
-                      ["hour", 0, 0],
-                      ["day", 0, 1],
-                      ["month", 0, 1],
-                      ["year", 0, 1]]
+        tick_types = ["second", "minute", "hour", "day", "month", "year"]
         # round to the nearest tick
         years = 0
         years_major = 0
@@ -738,61 +845,54 @@ class RealTimeSlider(QtWidgets.QGraphicsView):
             tick_time = datetime.datetime(left_end.year, left_end.month, 1)
         else:
             tick_time = roundTime(left_end, type_delta_major.total_seconds())
-
-        count = 0
         self.tick_start = tick_time
-        while tick_time < right_end:
-            for type in range(len(tick_types)):
-                tick_type = tick_types[type]
-                value = getattr(tick_time, tick_type[0])
-                if tick_type[1]:
-                    value %= tick_type[1]
-                if value != tick_type[2]:
-                    break
-            # find out if this is a major tick or not
-            is_major_tick = False
-            if years_major:
-                if tick_time.day == 1 and tick_time.month == 1 and tick_time.year == roundValue(tick_time.year,
-                                                                                                years_major):
-                    is_major_tick = True
-            elif months_major:
-                if tick_time.day == 1 and tick_time.month == roundValue(tick_time.month, months_major, 1):
-                    is_major_tick = True
-            elif days_major:
-                if tick_time.day == roundValue(tick_time.day, days_major, 1):
-                    is_major_tick = True
-            elif (tick_time - self.tick_start).total_seconds() % type_delta_major.total_seconds() == 0:
-                is_major_tick = True
-
-            # place the tick
-            if is_major_tick:
+
+        # create all ticks of the visible range at once
+        start = np.datetime64(tick_time, "us")
+        end = np.datetime64(right_end, "us")
+        if years:
+            ticks = np.arange(start.astype("datetime64[Y]"), end.astype("datetime64[Y]") + 1, years)
+        elif months:
+            ticks = np.arange(start.astype("datetime64[M]"), end.astype("datetime64[M]") + 1, months)
+        elif days:
+            ticks = np.arange(start.astype("datetime64[D]"), end.astype("datetime64[D]") + 1)
+            # the days are counted from the start of each month
+            ticks = ticks[(ticks - ticks.astype("datetime64[M]")).astype(int) % days == 0]
+        else:
+            ticks = np.arange(start, end, np.timedelta64(int(type_delta_minor.total_seconds() * 1e6), "us"))
+        ticks = ticks.astype("datetime64[us]")
+        ticks = ticks[ticks < end]
+
+        # split the ticks in their components
+        second = (ticks.astype("datetime64[s]") - ticks.astype("datetime64[m]")).astype(int)
+        minute = (ticks.astype("datetime64[m]") - ticks.astype("datetime64[h]")).astype(int)
+        hour = (ticks.astype("datetime64[h]") - ticks.astype("datetime64[D]")).astype(int)
+        day = (ticks.astype("datetime64[D]") - ticks.astype("datetime64[M]")).astype(int) + 1
+        month = (ticks.astype("datetime64[M]") - ticks.astype("datetime64[Y]")).astype(int) + 1
+        year = ticks.astype("datetime64[Y]").astype(int) + 1970
+
+        # the type of a tick is the smallest unit which is not at its start value
+        types = np.argmax([second != 0, minute != 0, hour != 0, day != 1, month != 1, np.ones(len(ticks), dtype=bool)],
+                          axis=0)
+
+        # find out which ticks are major ticks
+        if years_major:
+            is_major_tick = (day == 1) & (month == 1) & (year % years_major == 0)
+        elif months_major:
+            is_major_tick = (day == 1) & ((month - 1) % months_major == 0)
+        elif days_major:
+            is_major_tick = (day - 1) % days_major == 0
+        else:
+            major_delta = np.timedelta64(int(type_delta_major.total_seconds() * 1e6), "us")
+            is_major_tick = (ticks - start) % major_delta == np.timedelta64(0, "us")
+
+        # place the ticks
+        for tick_time, type, is_major in zip(ticks.astype(datetime.datetime), types, is_major_tick):
+            if is_major:
                 self.addTickMarker(tick_time, color=QtGui.QColor(0, 0, 0), height=15, type=type,
-                                   type_name=tick_types[type][0])
+                                   type_name=tick_types[type])
             else:
                 self.addTickMarker(tick_time, color=QtGui.QColor(0, 0, 0), height=10, type=type, type_name="")
-
-            # apply the delta
-            if years:
-                try:
-                    tick_time = datetime.datetime(tick_time.year + years, tick_time.month, 1)
-                except ValueError:
-                    break
-            elif months:
-                if tick_time.month + months > 12:
-                    tick_time = datetime.datetime(tick_time.year + 1, 1, 1)
-                else:
-                    tick_time = datetime.datetime(tick_time.year, tick_time.month + months, 1)
-            elif days:
-                try:
-                    tick_time = datetime.datetime(tick_time.year, tick_time.month, tick_time.day + days)
-                except ValueError:
-                    try:
-                        tick_time = datetime.datetime(tick_time.year, tick_time.month + 1, 1)
-                    except ValueError:
-                        tick_time = datetime.datetime(tick_time.year + 1, 1, 1)
-            else:
-                tick_time = tick_time + type_delta_minor
-            count += 1
         self.repaint()
 
     def mousePressEvent(self, event: QtGui.QMouseEvent) -> None:
@@ -1070,11 +1170,9 @@ class Timeline(QtCore.QObject):
 
     def ReleasedSlider2(self) -> None:
         timestamp = self.timeSlider.value()
-        n = self.data_file.table_image.select(self.data_file.table_image.sort_index).where(
-            self.data_file.table_image.timestamp > timestamp).limit(1)
-        if n.count() == 0:
+        n = self.timeSlider.TimeToFrame(timestamp)
+        if n is None:
             return
-        n = n[0].sort_index
         self.slider_update = True
         self.updateFrame(nr=n)
 
@@ -1159,11 +1257,8 @@ class Timeline(QtCore.QObject):
             self.frameSlider.addTickMarker(self.get_current_frame(), type=1)
 
     def MarkerPointsAddedList(self, frames: Optional[Union[ndarray, Set[int32]]] = None) -> None:
-        for frame in frames:
-            if frame is not None:
-                self.frameSlider.addTickMarker(frame, type=1)
-            else:
-                self.frameSlider.addTickMarker(self.get_current_frame(), type=1)
+        frames = [frame if frame is not None else self.get_current_frame() for frame in frames]
+        self.frameSlider.addTickMarkers(frames, type=1)
 
     def MarkerPointsRemoved(self) -> None:
         self.frameSlider.removeTickMarker(self.get_current_frame(), type=1)
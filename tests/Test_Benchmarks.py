@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Test_Benchmarks.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+
+__key__ = "BENCHMARKS"
+__testname__ = "Benchmarks"
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import clickpoints
+from benchmarks.generate import generateProject
+from benchmarks.suite import Context, runBenchmarks, compareResults
+
+
+class Test_Benchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = generateProject(self.path, frames=5, markers=3, tracks=2, polygons=1, layers=2, width=32,
+                                        height=32)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_generateProject(self):
+        """ Test if the synthetic project has the requested content """
+        db = clickpoints.DataFile(self.filename)
+        self.assertEqual(db.getImages().count(), 10, "Images of the layers are missing")
+        self.assertEqual(len(db.getLayers()), 2, "Layer is missing")
+        self.assertEqual(db.getMarkers(type="marker").count(), 15, "Markers are missing")
+        self.assertEqual(db.getPolygons().count(), 5, "Polygons are missing")
+        self.assertEqual(db.getMasks().count(), 5, "Masks are missing")
+        tracks = db.getTracksNanPadded(type="track", layer=1)
+        self.assertEqual(tracks.shape, (2, 5, 2), "Tracks have the wrong shape")
+        self.assertFalse(np.any(np.isnan(tracks)), "Tracks are not complete")
+        db.db.close()
+
+    def test_runBenchmarks(self):
+        """ Test if all benchmarks run and if the comparison finds a regression """
+        context = Context(self.filename, dict(frames=5, markers=3, size=32), self.path)
+        try:
+            results = runBenchmarks(context, repeat=1, verbose=False)
+        finally:
+            context.close()
+        self.assertIn("getTracksNanPadded", results)
+        self.assertIn("load_frame", results)
+
+        baseline = {name: dict(result, median=result["median"] / 2) for name, result in results.items()}
+        comparison = compareResults(results, baseline, tolerance=0.25)
+        self.assertEqual(len(comparison), len(results))
+        self.assertTrue(all(regression for *_, regression in comparison), "Regression not detected")
+
+
+if __name__ == '__main__':
+    __path__ = os.path.dirname(os.path.abspath(__file__))
+    log_file = os.path.join(__path__, 'log_'+__key__+'.txt')
+    with open(log_file, "w") as f:
+        runner = unittest.TextTestRunner(f)
+        unittest.main(testRunner=runner)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Test_ChangeTracker.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+__key__ = "CHANGETRACKER"
+__testname__ = "Change Tracker"
+
+import os
+import unittest
+import numpy as np
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "package"))
+
+from clickpoints import DataFile
+from clickpoints.modules.ChangeTracker import undo as Undo
+
+
+class Test_ChangeTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DataFile(self.id().split(".")[-1]+".cdb", "w")
+        self.images = [self.db.setImage(filename="test%d.jpg" % i, width=10, height=10) for i in range(4)]
+        self.db.setMaskType(name="color", color="#FF0000", index=1)
+
+    def tearDown(self):
+        self.undo.deactivate()
+        self.db.db.close()
+        os.remove(self.db._database_filename)
+
+    def startUndo(self, max_size=None):
+        self.undo = Undo(self.db.db, ["mask"], max_size=max_size)
+        self.undo.activate()
+        return self.undo
+
+    def getMaskData(self, image):
+        mask = self.db.getMask(image=image)
+        return None if mask is None else mask.data
+
+    def test_undoRedo(self):
+        """ Test undo and redo of inserted, updated and deleted masks """
+        undo = self.startUndo()
+        data1 = np.zeros((10, 10), dtype=np.uint8)
+        data1[2:5, 2:5] = 1
+        data2 = np.ones((10, 10), dtype=np.uint8)
+
+        with undo("insert"):
+            self.db.setMask(image=self.images[0], data=data1)
+        with undo("update"):
+            self.db.setMask(image=self.images[0], data=data2)
+        with undo("delete"):
+            self.db.deleteMasks(image=self.images[0])
+        self.assertEqual(undo.get_state(), ("delete", None), "Undo steps not recorded.")
+
+        # undo the delete, the update and the insert
+        undo.undo()
+        np.testing.assert_array_equal(self.getMaskData(self.images[0]), data2, "Undo of the delete failed.")
+        undo.undo()
+        np.testing.assert_array_equal(self.getMaskData(self.images[0]), data1, "Undo of the update failed.")
+        undo.undo()
+        self.assertIsNone(self.getMaskData(self.images[0]), "Undo of the insert failed.")
+        self.assertEqual(undo.get_state(), (None, "insert"), "Redo steps not recorded.")
+
+        # and redo them again
+        undo.redo()
+        np.testing.assert_array_equal(self.getMaskData(self.images[0]), data1, "Redo of the insert failed.")
+        undo.redo()
+        np.testing.assert_array_equal(self.getMaskData(self.images[0]), data2, "Redo of the update failed.")
+        undo.redo()
+        self.assertIsNone(self.getMaskData(self.images[0]), "Redo of the delete failed.")
+        self.assertEqual(undo.get_state(), ("delete", None), "Wrong undo state after redo.")
+
+    def test_maxSize(self):
+        """ Test that the oldest steps are dropped when the journal exceeds its size """
+        # every insert step has the size of one log entry
+        undo = self.startUndo(max_size=2 * Undo.entry_size)
+        for i in range(3):
+            with undo("insert %d" % i):
+                self.db.setMask(image=self.images[i], data=np.ones((10, 10), dtype=np.uint8))
+
+        self.assertEqual([step[2] for step in undo.undo_stack], ["insert 1", "insert 2"], "Oldest step not dropped.")
+        self.assertEqual(self.db.db.execute_sql("SELECT COUNT(*) FROM undolog").fetchone()[0], 2,
+                         "Log of the dropped step not deleted.")
+
+        # the last step can still be undone and the stacks stay within the size
+        undo.undo()
+        self.assertIsNone(self.getMaskData(self.images[2]), "Undo failed.")
+        self.assertIsNotNone(self.getMaskData(self.images[0]), "Dropped step was undone.")
+        self.assertIsNotNone(self.getMaskData(self.images[1]), "Too many steps undone.")
+        self.assertLessEqual(sum(step[3] for step in undo.undo_stack + undo.redo_stack), undo.max_size,
+                             "Stacks exceed the maximal size.")
+
+    def test_suspended(self):
+        """ Test that bulk inserts are not recorded and clear the undo history """
+        undo = self.startUndo()
+        with undo("insert"):
+            self.db.setMask(image=self.images[0], data=np.ones((10, 10), dtype=np.uint8))
+        self.assertEqual(undo.get_state(), ("insert", None), "Undo step not recorded.")
+
+        with undo.suspended("mask"):
+            self.db.saveInsertMany(self.db.table_mask, [dict(image=image, data=np.ones((10, 10), dtype=np.uint8))
+                                                        for image in self.images[1:]])
+        undo.barrier("bulk")
+
+        self.assertEqual(undo.get_state(), (None, None), "Undo history not cleared.")
+        self.assertEqual(self.db.db.execute_sql("SELECT COUNT(*) FROM undolog").fetchone()[0], 0,
+                         "Bulk insert was recorded.")
+        self.assertEqual(self.db.getMasks().count(), 4, "Bulk insert failed.")
+
+        # changes after the bulk operation are recorded again
+        with undo("delete"):
+            self.db.deleteMasks(image=self.images[0])
+        undo.undo()
+        self.assertIsNotNone(self.getMaskData(self.images[0]), "Undo after a bulk operation failed.")
+
+
+if __name__ == '__main__':
+    unittest.main()
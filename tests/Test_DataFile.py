@@ -492,6 +492,53 @@ class Test_DataFile(unittest.TestCase):
         masks = self.db.getMasks()
         self.assertTrue(masks.count() == 0, 'Failed to to delete all masks')
 
+    def test_getMaskIntensities(self):
+        """ Test the getMaskIntensities function """
+        import imageio
+        from clickpoints.DataFile import DoesNotExist
+        self.db.setMaskType(name="cell1", color="#FF0000", index=1)
+        self.db.setMaskType(name="cell2", color="#00FF00", index=2)
+
+        np.random.seed(1234)
+        datas = []
+        masks = []
+        for i in range(3):
+            data = np.random.randint(0, 255, (20, 30, 3)).astype(np.uint8)
+            imageio.imwrite("intensity%d.png" % i, data)
+            self.addCleanup(os.remove, "intensity%d.png" % i)
+            image = self.db.setImage(filename="intensity%d.png" % i, path=self.db.setPath("."))
+            mask = np.zeros((20, 30), np.uint8)
+            mask[2:8, 3:10] = 1
+            if i < 2:
+                mask[10:15, 15:17 + i] = 2
+            self.db.setMask(image=image, data=mask)
+            datas.append(data[:, :, 1].astype(float))
+            masks.append(mask)
+
+        sums, areas, means, stds = self.db.getMaskIntensities(channel=1)
+        self.assertEqual(sums.shape, (2, 3))
+        for m, index in enumerate([1, 2]):
+            for t in range(3):
+                values = datas[t][masks[t] == index]
+                self.assertEqual(areas[m, t], len(values))
+                if len(values):
+                    self.assertAlmostEqual(sums[m, t], np.sum(values))
+                    self.assertAlmostEqual(means[m, t], np.mean(values))
+                    self.assertAlmostEqual(stds[m, t], np.std(values))
+                else:
+                    self.assertTrue(np.isnan(means[m, t]))
+
+        # filter by mask type and frames
+        sums2, areas2, means2, stds2 = self.db.getMaskIntensities(mask_type="cell2", frame=[0, 1], channel=1)
+        np.testing.assert_array_equal(areas2, areas[1:, :2])
+        np.testing.assert_almost_equal(means2, means[1:, :2])
+        self.assertRaises(DoesNotExist, self.db.getMaskIntensities, mask_type="missing")
+
+        # the same result with the images processed in other processes
+        sums3, areas3, means3, stds3 = self.db.getMaskIntensities(channel=1, processes=2)
+        np.testing.assert_array_equal(areas3, areas)
+        np.testing.assert_almost_equal(sums3, sums)
+
     ''' Test Marker functions '''
 
     def test_setMarker(self):
@@ -1449,6 +1496,108 @@ class Test_DataFile(unittest.TestCase):
         print(self.db.getAnnotations().count())
         self.assertEqual(self.db.getAnnotations().count(), 2, "Failed to delete all annotation.")
 
+    def test_frameSummary(self):
+        for i in range(4):
+            self.db.setImage("test%d.jpg" % i)
+        self.db.setMarkerType("marker", "#FF0000")
+        self.db.setMarkerType("line", "#00FF00", mode=self.db.TYPE_Line)
+        self.db.setMarkerType("track", "#0000FF", mode=self.db.TYPE_Track)
+
+        self.db.setMarkers(frame=[0, 0, 2], x=[1, 2, 3], y=[1, 2, 3], type="marker")
+        self.db.setLine(frame=1, x1=0, y1=0, x2=1, y2=1, type="line")
+        self.db.setAnnotation(frame=3, comment="foo")
+        self.assertEqual(list(self.db.getMarkedFrames()), [0, 1, 2, 3], "Failed to get marked frames.")
+        self.assertEqual(list(self.db.getMarkedFrames(kind="marker")), [0, 2], "Failed to get marked frames by kind.")
+        self.assertEqual(list(self.db.getMarkedFrames(type="line")), [1], "Failed to get marked frames by type.")
+        self.assertEqual(self.db.getFrameSummaryCount(frame=0), 2, "Failed to count the objects of a frame.")
+        self.assertEqual(self.db.getFrameSummaryCount(type="marker"), 3, "Failed to count the objects of a type.")
+
+        # changing and deleting objects updates the summary
+        marker = self.db.getMarkers(frame=2)[0]
+        marker.image = self.db.getImage(frame=1)
+        marker.save()
+        self.assertEqual(list(self.db.getMarkedFrames(kind="marker")), [0, 1], "Failed to update the summary.")
+        self.db.deleteMarkers(frame=0)
+        self.assertEqual(self.db.getFrameSummaryCount(kind="marker"), 1, "Failed to update the summary.")
+
+        # replaced markers are not counted twice
+        track = self.db.setTrack("track")
+        self.db.setMarker(frame=0, x=1, y=1, track=track)
+        self.db.setMarkers(frame=[0, 2], x=[2, 2], y=[2, 2], track=track)
+        self.assertEqual(self.db.getFrameSummaryCount(kind="marker"), 3, "Failed to count replaced markers.")
+
+        # the summary matches a complete recount
+        summary = sorted((s.image.id, s.kind, s.type, s.count) for s in self.db.getFrameSummaries())
+        self.db._FillSummaryTable()
+        recount = sorted((s.image.id, s.kind, s.type, s.count) for s in self.db.getFrameSummaries())
+        self.assertEqual(summary, recount, "Summary differs from a recount.")
+
+    def test_trackStatistics(self):
+        for i in range(5):
+            self.db.setImage("test%d.jpg" % i)
+        self.db.setMarkerType("track", "#0000FF", mode=self.db.TYPE_Track)
+        track = self.db.setTrack("track")
+        track2 = self.db.setTrack("track")
+
+        # appended markers update the statistics directly
+        self.db.setMarkers(frame=[0, 1, 3], x=[0, 3, 3], y=[0, 4, 0], track=track)
+        self.db.setMarker(frame=0, x=0, y=0, track=track2)
+        statistic = self.db.table_trackstatistic.get(track=track)
+        self.assertEqual((statistic.count, statistic.first_frame, statistic.last_frame), (3, 0, 3), "Wrong count or frames.")
+        self.assertAlmostEqual(statistic.path_length, 9, msg="Wrong path length.")
+        self.assertAlmostEqual(statistic.displacement, 3, msg="Wrong displacement.")
+
+        # a marker in the middle of the track
+        self.db.setMarker(frame=2, x=3, y=8, track=track)
+        statistic = self.db.getTrackStatistics(track=track)[0]
+        self.assertEqual((statistic.count, statistic.max_y), (4, 8), "Statistics not updated.")
+        self.assertAlmostEqual(statistic.path_length, 17, msg="Wrong path length.")
+
+        # moving a marker
+        marker = self.db.getMarkers(frame=3, track=track)[0]
+        marker.x = 7
+        marker.save()
+        statistic = self.db.getTrackStatistics(track=track)[0]
+        self.assertEqual((statistic.end_x, statistic.max_x), (7, 7), "Statistics not updated.")
+
+        # filter tracks by their statistics
+        self.assertEqual([t.id for t in self.db.getTracks(count=slice(2, None))], [track.id], "Failed to filter tracks.")
+        self.assertEqual([t.id for t in self.db.getTracks(path_length=slice(None, 1))], [track2.id], "Failed to filter tracks.")
+
+    def test_queryProfiling(self):
+        """ Test if the query profiling aggregates the statements and explains the slow ones """
+        for i in range(5):
+            self.db.setImage("test%d.jpg" % i)
+
+        self.db.enableQueryProfiling(threshold=0)
+        for i in range(5):
+            self.db.getImage(frame=i)
+        self.db.disableQueryProfiling()
+        self.db.getImage(frame=0)
+
+        statistics = [s for s in self.db.getQueryStatistics() if s["sql"].startswith("SELECT") and '"image"' in s["sql"]]
+        self.assertEqual(len(statistics), 1, "Statements with different values are not aggregated.")
+        self.assertEqual(statistics[0]["count"], 5, "Statements are not counted correctly.")
+        self.assertIn("getImage <- Test_DataFile.py", statistics[0]["call_sites"][0][0], "Call site is missing.")
+        self.assertIn("image_sort_index_layer_id", statistics[0]["plan"], "Frame lookup does not use the index.")
+
+    def test_importTime(self):
+        """ Test that the DataFile can be imported without the gui and image libraries and within the time budget """
+        import json
+        import subprocess
+        # the budget in seconds for importing the DataFile (in a fresh interpreter)
+        import_time_budget = 2
+        code = "import sys, time, json\n" \
+               "t = time.perf_counter()\n" \
+               "import clickpoints\n" \
+               "clickpoints.DataFile\n" \
+               "t = time.perf_counter() - t\n" \
+               "heavy = ['qtpy', 'matplotlib', 'cv2', 'skimage', 'imageio', 'PIL']\n" \
+               "print(json.dumps([t, [name for name in heavy if name in sys.modules]]))"
+        duration, loaded = json.loads(subprocess.check_output([sys.executable, "-c", code]).decode().strip().split("\n")[-1])
+        self.assertEqual(loaded, [], "Importing the DataFile loads heavy modules")
+        self.assertLess(duration, import_time_budget, "Importing the DataFile exceeds the time budget")
+
 
 if __name__ == '__main__':
     __path__ = os.path.dirname(os.path.abspath(__file__))
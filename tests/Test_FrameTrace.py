@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Test_FrameTrace.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+__key__ = "FRAMETRACE"
+__testname__ = "Frame Trace"
+
+import os
+import json
+import unittest
+import numpy as np
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "package"))
+
+from clickpoints.includes.FrameTrace import FrameTrace, frame_trace
+from clickpoints.includes.Tools import BroadCastEvent
+
+
+class Receiver:
+    def __init__(self):
+        self.calls = []
+
+    def imageLoadedEvent(self, filename, framenumber):
+        self.calls.append(framenumber)
+
+
+class Test_FrameTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.trace = FrameTrace(history=50)
+        self.trace.setEnabled(True)
+        # the global trace may be enabled by the environment
+        self.enabled = frame_trace.enabled
+        frame_trace.setEnabled(False)
+        frame_trace.clear()
+
+    def tearDown(self):
+        frame_trace.setEnabled(self.enabled)
+        frame_trace.clear()
+        if os.path.exists("test_save.json"):
+            os.remove("test_save.json")
+
+    def test_percentiles(self):
+        """ Test the rolling percentiles of the stages """
+        for i in range(100):
+            self.trace.record("decode", 0, (i + 1) * 1e-3)
+        self.trace.record("lut", 0, 2e-3)
+
+        percentiles = self.trace.getPercentiles()
+        self.assertEqual(set(percentiles), {"decode", "lut"}, "Wrong stages.")
+        # only the last 50 durations are kept
+        durations = np.arange(51, 101) * 1e-3
+        self.assertEqual(percentiles["decode"][0], 50, "History not limited.")
+        np.testing.assert_almost_equal(percentiles["decode"][1:], np.percentile(durations, [50, 90, 99]),
+                                       err_msg="Wrong percentiles.")
+        self.assertEqual(percentiles["lut"], (1, 2e-3, 2e-3, 2e-3), "Wrong percentiles of a single duration.")
+
+    def test_report(self):
+        """ Test that the report lists the frame first and then the slowest stages """
+        self.trace.record("fast", 0, 1e-3)
+        self.trace.record("slow", 0, 5e-3)
+        self.trace.record("frame", 0, 7e-3)
+        self.trace.record("medium", 0, 3e-3)
+
+        lines = self.trace.report().split("\n")
+        self.assertEqual([line.split()[0] for line in lines[1:]], ["frame", "slow", "medium", "fast"],
+                         "Wrong order of the stages.")
+        self.assertEqual(len(self.trace.report(max_stages=2).split("\n")), 3, "Stages not limited.")
+
+    def test_stages(self):
+        """ Test that stages are assigned to their frame and not recorded when the trace is disabled """
+        with self.trace.frameChange(3):
+            with self.trace.stage("decode"):
+                pass
+        with self.trace.stage("idle"):
+            pass
+        events = list(self.trace.events)
+        self.assertEqual([(event[0], event[4]) for event in events], [("decode", 3), ("frame", 3), ("idle", None)],
+                         "Wrong stages or frames.")
+        # the frame contains the stage
+        self.assertLessEqual(events[1][2], events[0][2], "Frame starts after its stage.")
+        self.assertGreaterEqual(events[1][3], events[0][3], "Frame shorter than its stage.")
+
+        self.trace.setEnabled(False)
+        with self.trace.frameChange(4):
+            with self.trace.stage("decode"):
+                pass
+        self.assertEqual(len(self.trace.events), 3, "Stages recorded while disabled.")
+
+        self.trace.clear()
+        self.assertEqual((len(self.trace.events), self.trace.getPercentiles()), (0, {}), "Trace not cleared.")
+
+    def test_save(self):
+        """ Test the output in the trace event format """
+        with self.trace.frameChange(7):
+            with self.trace.stage("decode"):
+                pass
+        self.trace.save("test_save.json")
+
+        with open("test_save.json") as fp:
+            trace = json.load(fp)
+        events = trace["traceEvents"]
+        self.assertEqual([event["name"] for event in events], ["decode", "frame"], "Wrong events saved.")
+        for event, recorded in zip(events, self.trace.events):
+            self.assertEqual(event["ph"], "X", "Events are not complete events.")
+            self.assertEqual(event["pid"], os.getpid(), "Wrong process id.")
+            self.assertEqual(event["args"], dict(frame=7), "Wrong frame.")
+            # the times are in microseconds
+            self.assertAlmostEqual(event["ts"], recorded[2] * 1e6, msg="Wrong start time.")
+            self.assertAlmostEqual(event["dur"], recorded[3] * 1e6, msg="Wrong duration.")
+
+    def test_broadCastEvent(self):
+        """ Test that the broadcast handlers are only recorded when the trace is enabled """
+        receiver = Receiver()
+        modules = [receiver, object()]
+
+        BroadCastEvent(modules, "imageLoadedEvent", "", 1)
+        self.assertEqual(receiver.calls, [1], "Handler not called.")
+        self.assertEqual(len(frame_trace.events), 0, "Handler recorded while the trace is disabled.")
+
+        frame_trace.setEnabled(True)
+        BroadCastEvent(modules, "imageLoadedEvent", "", 2)
+        self.assertEqual(receiver.calls, [1, 2], "Handler not called.")
+        self.assertEqual(list(frame_trace.getPercentiles()), ["imageLoadedEvent Receiver"], "Handler not recorded.")
+
+
+if __name__ == '__main__':
+    unittest.main()
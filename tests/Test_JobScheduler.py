@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Test_JobScheduler.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+__key__ = "JOBSCHEDULER"
+__testname__ = "Job Scheduler"
+
+import os
+import json
+import unittest
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "package"))
+
+from clickpoints import DataFile
+from clickpoints.JobScheduler import BatchJob, JobScheduler
+
+
+def batchFunction(database_filename, image_ids, parameters):
+    # a trivial batch function, which is executed in the worker processes
+    return [image_id * parameters for image_id in image_ids]
+
+
+class Signal:
+    def emit(self, *args):
+        pass
+
+
+class Command:
+    STATUS_Idle = 0
+    STATUS_Active = 1
+    STATUS_Running = 2
+
+
+class StubAddon:
+    """ An add-on without gui, which collects the results of its batch jobs """
+    addon_name = "stub"
+    batch_function = batchFunction
+
+    def __init__(self, db):
+        self.db = db
+        self.cp = Command()
+        self._change_status = Signal()
+        self.options = {}
+        self.results = []
+        self.job = None
+        self.cancel_after = None
+
+    def getOption(self, key):
+        return self.options.get(key, "")
+
+    def setOption(self, key, value):
+        self.options[key] = value
+
+    def batchParameters(self):
+        return 10
+
+    def batchResults(self, images, results):
+        self.results.append(([image.sort_index for image in images], results))
+        if self.cancel_after is not None and len(self.results) == self.cancel_after:
+            self.job.cancel()
+
+    def is_running(self):
+        return False
+
+    def run_stopped(self):
+        pass
+
+    def runBatch(self, start, end, chunk_size):
+        # queue a job and resume a stored one with the same frames, like Addon.run_batch
+        self.job = BatchJob(self, start, end, 1, None, chunk_size, processes=1)
+        if self.getOption("batchJob"):
+            state = json.loads(self.getOption("batchJob"))
+            if self.job.matches(state):
+                self.job.done = set(state["done"])
+        return self.job
+
+
+class Test_JobScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DataFile(self.id().split(".")[-1]+".cdb", "w")
+        self.images = [self.db.setImage(filename="test%d.jpg" % i, width=10, height=10) for i in range(20)]
+        self.addon = StubAddon(self.db)
+        self.scheduler = JobScheduler()
+
+    def tearDown(self):
+        self.db.db.close()
+        # the connection of the scheduler thread keeps the journal files of the database
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.db._database_filename + suffix):
+                os.remove(self.db._database_filename + suffix)
+
+    def test_batchResults(self):
+        """ Test that the results are stored chunk by chunk in the order of the frames """
+        job = self.scheduler.submit(self.addon.runBatch(0, 19, chunk_size=4))
+        self.assertTrue(job.wait(60), "Batch job did not finish.")
+        self.assertIsNone(job.error, "Batch job failed.")
+
+        self.assertEqual([frames for frames, results in self.addon.results],
+                         [list(range(i, i + 4)) for i in range(0, 20, 4)], "Chunks not stored in the order of the frames.")
+        for frames, results in self.addon.results:
+            self.assertEqual(results, [self.images[frame].id * 10 for frame in frames], "Wrong results of a chunk.")
+        self.assertEqual(job.progress(), (5, 5), "Wrong progress.")
+        self.assertEqual(self.addon.getOption("batchJob"), "", "Progress of a finished job not removed.")
+
+    def test_resume(self):
+        """ Test that a cancelled job resumes from the stored chunks """
+        self.addon.cancel_after = 2
+        job = self.scheduler.submit(self.addon.runBatch(0, 19, chunk_size=4))
+        self.assertTrue(job.wait(60), "Batch job was not cancelled.")
+        self.assertEqual(job.progress(), (2, 5), "Job not cancelled after two chunks.")
+        state = json.loads(self.addon.getOption("batchJob"))
+        self.assertEqual(state["done"], [0, 1], "Progress not stored.")
+
+        # a job with other frames does not resume the progress
+        self.assertEqual(self.addon.runBatch(0, 18, chunk_size=4).progress(), (0, 5), "Progress of other frames resumed.")
+
+        # the same job continues with the missing chunks
+        self.addon.cancel_after = None
+        self.addon.results = []
+        job = self.scheduler.submit(self.addon.runBatch(0, 19, chunk_size=4))
+        self.assertTrue(job.wait(60), "Resumed batch job did not finish.")
+        self.assertEqual([frames for frames, results in self.addon.results],
+                         [list(range(i, i + 4)) for i in range(8, 20, 4)], "Stored chunks were processed again.")
+        self.assertEqual(job.progress(), (5, 5), "Wrong progress.")
+        self.assertEqual(self.addon.getOption("batchJob"), "", "Progress of a finished job not removed.")
+
+
+if __name__ == '__main__':
+    unittest.main()
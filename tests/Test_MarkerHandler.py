@@ -113,6 +113,36 @@ class Test_MarkerHandler(unittest.TestCase, BaseTest):
         self.mouseClick(50, 50)
         self.assertEqual(len(self.window.GetModule("MarkerHandler").points), 0, "Marker deletion didn't work")
 
+    def test_batchMarker(self):
+        """ Test if many markers are drawn in a batch and can still be moved """
+        self.createInstance(os.path.join("ClickPointsExamples", "TweezerVideos", "002"))
+
+        # switch interface on
+        self.keyPress(Qt.Key_F2)
+
+        # wait for image to be loaded
+        self.wait_for_image_load()
+
+        # draw markers in batches from the first marker on
+        marker_handler = self.window.GetModule("MarkerHandler")
+        self.db.setOption("marker_batch_threshold", 0)
+        self.db.setMarkers(image=self.db.getImage(frame=0), x=[50, 150], y=[50, 150], type="marker")
+        marker_handler.ReloadMarker(0)
+        self.assertEqual(len(marker_handler.points), 0, "Markers did not get drawn in a batch")
+        self.assertEqual(sum(batch.alive.sum() for batch in marker_handler.marker_batches.values()), 2,
+                         "Not all markers are in the batch")
+
+        # process the event
+        self.window.app.processEvents()
+        time.sleep(0.1)
+
+        # moving a marker should give it its own item
+        self.mouseDrag(50, 50, 100, 100)
+        self.assertEqual(len(marker_handler.points), 1, "Dragged marker didn't get its own item")
+        data = marker_handler.points[0].data
+        self.assertTrue(95 < data.x < 105, "Marker x position move didn't work.")
+        self.assertTrue(95 < data.y < 105, "Marker y position move didn't work.")
+
 if __name__ == '__main__':
     __path__ = os.path.dirname(os.path.abspath(__file__))
     log_file = os.path.join(__path__, 'log_'+__key__+'.txt')
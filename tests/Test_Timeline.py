@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Test_Timeline.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+__key__ = "MODULE_TIMELINE"
+__testname__ = "Timeline"
+
+import sys
+import os
+import unittest
+import datetime
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.dirname(__file__))
+
+from BaseTest import BaseTest
+
+import clickpoints
+from clickpoints.modules.Timeline import TimeLineSlider, RealTimeSlider
+
+class Test_Timeline(unittest.TestCase, BaseTest):
+
+    def tearDown(self):
+        BaseTest.tearDown(self)
+
+    def test_tickJumps(self):
+        """ Test jumping between the tick markers """
+        self.createInstance(os.path.join("ClickPointsExamples", "TweezerVideos", "002"))
+        slider = self.window.GetModule("Timeline").frameSlider
+        slider.clearTickMarker()
+
+        # mark some frames
+        slider.addTickMarkers([2, 3, 4, 7], type=1)
+        self.assertEqual(slider.getNextTick(0), 2, "Next tick not found")
+        self.assertEqual(slider.getNextTick(4), 7, "Next tick not found")
+        self.assertEqual(slider.getNextTick(7, back=True), 4, "Previous tick not found")
+        self.assertEqual(slider.getNextTickChange(2), 5, "End of tick block not found")
+        self.assertEqual(slider.getNextTickChange(7, back=True), 4, "Previous tick block not found")
+
+        # remove a tick
+        slider.removeTickMarker(7, type=1)
+        self.assertEqual(slider.getNextTick(4), slider.max_value, "Removed tick still found")
+        self.assertEqual(slider.ticks.bin_counts[1].sum(), 3, "Bin counts not updated")
+
+    def test_tickBins(self):
+        """ Test if the ticks of long timelines are counted in bins """
+        slider = TimeLineSlider()
+        slider.length = 500
+        slider.setRange(0, 10 ** 6 - 1)
+        self.assertEqual(slider.ticks.bin_count, 500, "Wrong number of bins")
+
+        # mark the frames of the first bin and one of the last bin
+        slider.addTickMarkers(np.arange(2000), type=0)
+        slider.addTickMarker(10 ** 6 - 1, type=0)
+        slider.addTickMarker(10 ** 6 - 1, type=0)
+        counts = slider.ticks.bin_counts[0]
+        self.assertEqual(counts[0], 2000, "Frames not counted in their bin")
+        self.assertEqual(counts[-1], 1, "Frame counted twice")
+        self.assertEqual(counts.sum(), 2001, "Frames counted in the wrong bins")
+
+        # the bins are recounted when the slider is resized
+        slider.length = 1000
+        slider.ticks.updateBins()
+        self.assertEqual(slider.ticks.bin_counts[0][:2].sum(), 2000, "Frames not counted in the new bins")
+
+    def test_timeSlider(self):
+        """ Test the mapping of the real time slider from times to frames """
+        db = clickpoints.DataFile(":memory:", "w")
+        start = datetime.datetime(2020, 1, 30, 12, 0, 0)
+        for i in range(10):
+            db.setImage(filename="%d.jpg" % i, timestamp=start + datetime.timedelta(minutes=i if i < 5 else i + 60))
+
+        slider = RealTimeSlider()
+        slider.setTimes(db)
+        self.assertEqual(len(slider.tick_blocks), 2, "Gap in the timestamps not found")
+        self.assertEqual(slider.TimeToFrame(start - datetime.timedelta(minutes=1)), 0, "Wrong first frame")
+        self.assertEqual(slider.TimeToFrame(start + datetime.timedelta(minutes=2, seconds=30)), 3, "Wrong frame")
+        self.assertEqual(slider.TimeToFrame(start + datetime.timedelta(minutes=30)), 5, "Wrong frame after the gap")
+        self.assertEqual(slider.TimeToFrame(start + datetime.timedelta(days=1)), None, "Frame found after the end")
+        db.db.close()
+
+if __name__ == '__main__':
+    __path__ = os.path.dirname(os.path.abspath(__file__))
+    log_file = os.path.join(__path__, 'log_'+__key__+'.txt')
+    with open(log_file, "w") as f:
+        runner = unittest.TextTestRunner(f)
+        unittest.main(testRunner=runner)
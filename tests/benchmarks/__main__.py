@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# __main__.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import clickpoints
+from .generate import generateProject
+from .suite import Context, runBenchmarks, compareResults
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Time the core DataFile and loader operations on a synthetic project.")
+    parser.add_argument("--frames", type=int, default=100, help="the number of frames")
+    parser.add_argument("--markers", type=int, default=50, help="the number of markers per frame")
+    parser.add_argument("--tracks", type=int, default=10, help="the number of tracks")
+    parser.add_argument("--polygons", type=int, default=5, help="the number of polygons per frame")
+    parser.add_argument("--layers", type=int, default=2, help="the number of layers")
+    parser.add_argument("--no-masks", dest="masks", action="store_false", help="do not add masks")
+    parser.add_argument("--size", type=int, default=256, help="the width and height of the images")
+    parser.add_argument("--repeat", type=int, default=5, help="how often every benchmark is repeated")
+    parser.add_argument("--filter", nargs="*", help="only run the benchmarks which contain one of these strings")
+    parser.add_argument("--project", help="generate the project in this folder and keep it")
+    parser.add_argument("--output", help="save the results to this json file")
+    parser.add_argument("--baseline", help="compare the results to this json file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="the relative slowdown which is accepted in the comparison")
+    args = parser.parse_args(args)
+
+    parameters = dict(frames=args.frames, markers=args.markers, tracks=args.tracks, polygons=args.polygons,
+                      layers=args.layers, masks=args.masks, size=args.size)
+
+    with tempfile.TemporaryDirectory() as temp_path:
+        path = args.project or temp_path
+        print("Generating project in", path)
+        filename = generateProject(path, frames=args.frames, markers=args.markers, tracks=args.tracks,
+                                   polygons=args.polygons, masks=args.masks, layers=args.layers, width=args.size,
+                                   height=args.size)
+        context = Context(filename, parameters, temp_path)
+        try:
+            results = runBenchmarks(context, repeat=args.repeat, names=args.filter)
+        finally:
+            context.close()
+
+    output = dict(clickpoints=clickpoints.__version__, python=platform.python_version(), platform=platform.platform(),
+                  parameters=parameters, results=results)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(output, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        if baseline.get("parameters") != parameters:
+            print("Warning: the baseline was recorded with different parameters", baseline.get("parameters"))
+        comparison = compareResults(results, baseline["results"], args.tolerance)
+        print("%-25s %12s %12s %8s" % ("benchmark", "baseline", "current", "ratio"))
+        for name, old, new, ratio, regression in comparison:
+            print("%-25s %9.2f ms %9.2f ms %7.2fx%s" % (name, old * 1e3, new * 1e3, ratio,
+                                                      "  REGRESSION" if regression else ""))
+        if any(regression for *_, regression in comparison):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
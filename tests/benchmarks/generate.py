@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# generate.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+
+import os
+
+import imageio
+import numpy as np
+
+import clickpoints
+
+
+def generateProject(path, frames=100, markers=50, tracks=10, polygons=5, masks=True, layers=1, width=256, height=256,
+                    seed=1234):
+    """
+    Generate a synthetic ClickPoints project with random images and annotations.
+
+    Parameters
+    ----------
+    path : str
+        the folder in which the images and the project file are created.
+    frames : int, optional
+        the number of frames.
+    markers : int, optional
+        the number of markers per frame.
+    tracks : int, optional
+        the number of tracks, each track has a marker in every frame.
+    polygons : int, optional
+        the number of polygons per frame.
+    masks : bool, optional
+        whether every frame gets a mask.
+    layers : int, optional
+        the number of layers, every additional layer has its own images.
+    width : int, optional
+        the width of the images.
+    height : int, optional
+        the height of the images.
+    seed : int, optional
+        the seed of the random numbers.
+
+    Returns
+    -------
+    filename : str
+        the filename of the created .cdb file.
+    """
+    rng = np.random.RandomState(seed)
+    path = os.path.abspath(path)
+    image_path = os.path.join(path, "images")
+    os.makedirs(image_path, exist_ok=True)
+    filename = os.path.join(path, "benchmark.cdb")
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    db = clickpoints.DataFile(filename, "w")
+    try:
+        with db.db.atomic():
+            marker_type = db.setMarkerType("marker", "#FF0000", db.TYPE_Normal)
+            track_type = db.setMarkerType("track", "#00FF00", db.TYPE_Track)
+            polygon_type = db.setMarkerType("polygon", "#0000FF", db.TYPE_Polygon)
+            if masks:
+                db.setMaskType("mask", "#FFFF00", 1)
+
+            # the images, every layer gets its own files
+            layer_names = ["default"] + ["layer%d" % i for i in range(1, layers)]
+            for layer_index, layer_name in enumerate(layer_names):
+                if layer_index > 0:
+                    db.setLayer(layer_name, base_layer=db.getLayer("default"))
+                for frame in range(frames):
+                    image_filename = os.path.join(image_path, "frame%04d_%s.png" % (frame, layer_name))
+                    data = rng.randint(0, 255, (height, width), dtype=np.uint8)
+                    imageio.imwrite(image_filename, data)
+                    db.setImage(image_filename, layer=layer_name, sort_index=frame)
+            images = list(db.getImages(layer="default"))
+
+            # tracks with a random walk through all frames
+            track_entries = [db.setTrack(track_type) for _ in range(tracks)]
+            for track in track_entries:
+                positions = np.cumsum(rng.normal(0, 2, (frames, 2)), axis=0) + rng.uniform(0, 1, 2) * [width, height]
+                db.setMarkers(image=images, x=positions[:, 0], y=positions[:, 1], type=track_type,
+                              track=[track] * frames)
+
+            # untracked markers
+            if markers:
+                db.setMarkers(image=[image.id for image in images for _ in range(markers)], x=rng.uniform(0, width, frames * markers),
+                              y=rng.uniform(0, height, frames * markers), type=marker_type)
+
+            # polygons with a few points each
+            for image in images:
+                for _ in range(polygons):
+                    points = rng.uniform(0, 1, (6, 2)) * [width, height]
+                    db.setPolygon(image=image, points=points, type=polygon_type)
+
+            # masks with a random rectangle
+            if masks:
+                for image in images:
+                    data = np.zeros((height, width), dtype=np.uint8)
+                    x, y = rng.randint(0, width // 2), rng.randint(0, height // 2)
+                    data[y:y + height // 4, x:x + width // 4] = 1
+                    db.setMask(image=image, data=data)
+    finally:
+        db.db.close()
+    return filename
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# suite.py
+
+# Copyright (c) 2015-2022, Richard Gerum, Sebastian Richter, Alexander Winterl
+#
+# This file is part of ClickPoints.
+#
+# ClickPoints is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClickPoints is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClickPoints. If not, see <http://www.gnu.org/licenses/>
+
+
+import os
+import time
+
+import numpy as np
+
+import clickpoints
+from clickpoints.includes import Database
+from clickpoints.includes import loader
+
+# the registered benchmarks as (name, function)
+benchmarks = []
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function gets the :py:class:`Context` and returns the function to time, or a
+    tuple of the function to time and a function to call untimed before every repetition.
+    """
+    def decorator(function):
+        benchmarks.append((name, function))
+        return function
+    return decorator
+
+
+class Context:
+    """
+    The generated project and its parameters, shared by the benchmarks.
+    """
+
+    def __init__(self, filename, parameters, path):
+        self.filename = filename
+        self.parameters = parameters
+        self.path = path
+        self.image_path = os.path.join(os.path.dirname(filename), "images")
+        self.db = clickpoints.DataFile(filename)
+
+    def close(self):
+        self.db.db.close()
+
+
+def measure(run, reset=None, repeat=5):
+    """
+    Time a function.
+
+    Returns
+    -------
+    result : dict
+        the minimum, median and mean duration in seconds and the number of repetitions.
+    """
+    times = []
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return dict(min=float(np.min(times)), median=float(np.median(times)), mean=float(np.mean(times)), repeat=repeat)
+
+
+def runBenchmarks(context, repeat=5, names=None, verbose=True):
+    """
+    Run the registered benchmarks.
+
+    Parameters
+    ----------
+    context : :py:class:`Context`
+        the project to run the benchmarks on.
+    repeat : int, optional
+        how often every benchmark is repeated.
+    names : list of str, optional
+        only run the benchmarks which contain one of these strings.
+    verbose : bool, optional
+        whether to print the results while running.
+
+    Returns
+    -------
+    results : dict
+        the timing of every benchmark, see :py:func:`measure`.
+    """
+    results = {}
+    cwd = os.getcwd()
+    for name, function in benchmarks:
+        if names and not any(part in name for part in names):
+            continue
+        try:
+            run = function(context)
+            reset = None
+            if isinstance(run, tuple):
+                run, reset = run
+            results[name] = measure(run, reset, repeat)
+        finally:
+            # opening a project changes the working directory
+            os.chdir(cwd)
+        if verbose:
+            print("%-25s %10.2f ms" % (name, results[name]["median"] * 1e3))
+    return results
+
+
+def compareResults(results, baseline, tolerance=0.25):
+    """
+    Compare the results with a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        the current results.
+    baseline : dict
+        the stored results to compare to.
+    tolerance : float, optional
+        the relative increase of the median duration which is still accepted.
+
+    Returns
+    -------
+    comparison : list
+        for every benchmark in both results the name, the median duration of the baseline and the current results,
+        their ratio and whether it is a regression.
+    """
+    comparison = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["median"], result["median"]
+        ratio = new / old if old > 0 else np.inf
+        comparison.append((name, old, new, ratio, ratio > 1 + tolerance))
+    return comparison
+
+
+@benchmark("open_project")
+def openProject(context):
+    return lambda: clickpoints.DataFile(context.filename).db.close()
+
+
+@benchmark("getMarkers")
+def getMarkers(context):
+    return lambda: list(context.db.getMarkers())
+
+
+@benchmark("getMarkers_per_frame")
+def getMarkersPerFrame(context):
+    def run():
+        for frame in range(context.parameters["frames"]):
+            list(context.db.getMarkers(frame=frame, layer=1))
+    return run
+
+
+@benchmark("setMarkers")
+def setMarkers(context):
+    db = context.db
+    marker_type = db.setMarkerType("benchmark", "#FFFFFF", db.TYPE_Normal)
+    images = [image.id for image in db.getImages(layer=1) for _ in range(context.parameters["markers"])]
+    rng = np.random.RandomState(1234)
+    x, y = rng.uniform(0, 100, len(images)), rng.uniform(0, 100, len(images))
+
+    def run():
+        db.setMarkers(image=images, x=x, y=y, type=marker_type)
+
+    def reset():
+        db.deleteMarkers(type=marker_type)
+    return run, reset
+
+
+@benchmark("getTracksNanPadded")
+def getTracksNanPadded(context):
+    return lambda: context.db.getTracksNanPadded(type="track", layer=1)
+
+
+@benchmark("getPolygons")
+def getPolygons(context):
+    return lambda: [polygon.points for polygon in context.db.getPolygons()]
+
+
+@benchmark("getMask")
+def getMask(context):
+    def run():
+        for frame in range(context.parameters["frames"]):
+            mask = context.db.getMask(frame=frame, layer=1)
+            if mask is not None:
+                mask.data
+    return run
+
+
+@benchmark("FrameBuffer")
+def frameBuffer(context):
+    size = context.parameters["size"]
+    frames = [np.zeros((size, size), dtype=np.uint8) for _ in range(context.parameters["frames"])]
+    buffer = Database.FrameBuffer(10, 0, 1)
+
+    def run():
+        # play the frames forward and look back a few frames
+        for index, frame in enumerate(frames):
+            slots, slot_index = buffer.prepare_slot(index, 1)
+            if slots is not None:
+                slots[slot_index] = frame
+            for previous in range(max(index - 5, 0), index + 1):
+                buffer.get_frame(previous, 1)
+    return run, buffer.reset
+
+
+@benchmark("load_frame")
+def loadFrame(context):
+    if loader.formats is None:
+        loader.loadFileFormats()
+    data_file = Database.DataFileExtended(context.filename)
+    images = list(data_file.getImages(layer=1))
+
+    def run():
+        for image in images:
+            data_file.load_frame(image, image.sort_index, 1)
+    return run, data_file.buffer.reset
+
+
+@benchmark("loader_addPath")
+def loaderAddPath(context):
+    if loader.formats is None:
+        loader.loadFileFormats()
+    data_files = []
+
+    def run():
+        loader.addPath(data_files[-1], loader.InputIteratorFolder(context.image_path))
+
+    def reset():
+        for data_file in data_files:
+            data_file.db.close()
+            os.remove(data_file.temporary_db)
+        data_files.clear()
+        data_files.append(Database.DataFileExtended(None, storage_path=context.path))
+    return run, reset